@@ -0,0 +1,468 @@
+import argparse
+import functools
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import wave
+from datetime import datetime
+
+import numpy as np
+
+from capture import audio_chunks
+from cli import COMMANDS, HEAVY_MODULES
+from inference import InferenceBackend, INFERENCE_BACKENDS, get_inference_backend, register_inference_backend
+from streaming import SAMPLE_RATE, AudioChunk
+from utils import (configurar_cache_correcciones, corregir_texto, crear_datos_precalculados, leer_palabras_correctas,
+                   load_correct_words, setup_logging)
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato del informe JSON
+REPORT_VERSION = 1
+
+# Sílabas con las que se inventan las palabras del vocabulario de prueba
+_SILABAS = ["ca", "de", "lo", "mi", "ra", "to", "ve", "sa", "pe", "ni", "bu", "jo", "gar", "tre", "mon", "ción",
+            "lla", "ño", "qué", "rí", "zu", "tl", "ix", "ma", "á", "pa", "cho", "güe"]
+
+# Palabras frecuentes que nunca están en el vocabulario (texto que la corrección debe dejar igual)
+_PALABRAS_COMUNES = ["el", "la", "de", "que", "en", "los", "se", "del", "las", "por", "un", "para", "con", "una",
+                     "su", "al", "lo", "como", "más", "pero", "sus", "le", "ya", "este", "porque", "esta", "entre",
+                     "cuando", "muy", "sin", "sobre", "también", "hasta", "donde", "quien", "desde", "todos"]
+
+
+class StubBackend(InferenceBackend):
+    """Backend sin modelo para medir el pipeline: tarda `rtf` segundos por segundo de audio."""
+
+    name = 'stub'
+
+    def __init__(self, model_size=None, device=None, model_dir=None, rtf=0.05):
+        super().__init__()
+        self.rtf = rtf
+
+    def _transcribe(self, chunks, language, prompt):
+        time.sleep(self.rtf * sum(chunk.duration for chunk in chunks))
+        return [{"text": " texto de prueba", "language": language or "es",
+                 "segments": [{"start": 0.0, "end": chunk.duration, "text": " texto de prueba"}]}
+                for chunk in chunks]
+
+    def detect_language(self, audio):
+        return "es", 1.0
+
+
+def synthesize_speech(duration, seed=0, sample_rate=SAMPLE_RATE):
+    """Audio parecido a la voz: tramos armónicos con sílabas de ~4 Hz separados por pausas con ruido de fondo."""
+    rng = np.random.default_rng(seed)
+    audio = rng.normal(0, 0.002, int(duration * sample_rate)).astype(np.float32)
+    position = 0.0
+    while position < duration:
+        voiced = rng.uniform(1.0, 4.0)
+        start, end = int(position * sample_rate), int(min(duration, position + voiced) * sample_rate)
+        t = np.arange(end - start) / sample_rate
+        f0 = rng.uniform(90, 220) * (1 + 0.1 * np.sin(2 * np.pi * 0.5 * t))
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        tone = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = 0.5 * (1 - np.cos(2 * np.pi * rng.uniform(3, 5) * t))
+        audio[start:end] += (0.2 * tone * envelope).astype(np.float32)
+        position += voiced + rng.uniform(0.3, 1.5)
+    return np.clip(audio, -1, 1)
+
+
+def write_wav(path, audio, sample_rate=SAMPLE_RATE):
+    """Guarda audio float32 como WAV PCM de 16 bits mono."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((audio * 32767).astype(np.int16).tobytes())
+
+
+def read_pcm(path):
+    """Lee las muestras PCM s16le de un WAV, como las entrega FFmpeg."""
+    with wave.open(path, "rb") as f:
+        return f.readframes(f.getnframes())
+
+
+def fake_vocabulary(size, seed=0):
+    """Vocabulario inventado de `size` entradas (algunas de varias palabras), reproducible con `seed`."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        word = "".join(rng.choice(_SILABAS) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.3:
+            word = word.capitalize()
+        if rng.random() < 0.05:
+            word += " " + "".join(rng.choice(_SILABAS) for _ in range(rng.randint(2, 3)))
+        words.add(word)
+    return sorted(words)
+
+
+def misspell(word, rng):
+    """Error típico de transcripción: sin tildes, una letra cambiada o una letra de menos."""
+    choice = rng.random()
+    if choice < 0.4:
+        return word.translate(str.maketrans("áéíóúñü", "aeiounu"))
+    i = rng.randrange(len(word))
+    if choice < 0.7:
+        return word[:i] + rng.choice("aeiourslnt") + word[i + 1:]
+    return word[:i] + word[i + 1:] if len(word) > 3 else word
+
+
+def fake_sentences(vocabulary, count, seed=0, words_per_sentence=12, error_rate=0.15):
+    """Frases de palabras comunes con entradas del vocabulario, algunas mal escritas."""
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(count):
+        words = []
+        for _ in range(words_per_sentence):
+            if rng.random() < 0.3:
+                word = rng.choice(vocabulary)
+                words.append(misspell(word, rng) if rng.random() < error_rate / 0.3 else word)
+            else:
+                words.append(rng.choice(_PALABRAS_COMUNES))
+        sentences.append(" ".join(words))
+    return sentences
+
+
+def prepare_fixtures(fixtures_dir, duration, vocab_sizes, seed=0):
+    """Crea (si no existen) el WAV de prueba y un JSON de vocabulario por tamaño. Devuelve sus rutas."""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    wav = os.path.join(fixtures_dir, f"voz-{duration:g}s-{seed}.wav")
+    if not os.path.exists(wav):
+        write_wav(wav, synthesize_speech(duration, seed))
+    vocabularies = {}
+    for size in vocab_sizes:
+        path = os.path.join(fixtures_dir, f"vocabulario-{size}-{seed}.json")
+        if not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"benchmark": fake_vocabulary(size, seed)}, f, ensure_ascii=False)
+        vocabularies[size] = path
+    return wav, vocabularies
+
+
+def percentiles(values):
+    """p50, p95 y máximo de una lista de duraciones (en segundos)."""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    p50, p95 = np.quantile(values, (0.5, 0.95))
+    return {"p50": float(p50), "p95": float(p95), "max": float(max(values))}
+
+
+def load_transcriptor():
+    """Importa transcriptor-whisper.py (su nombre no es un identificador de Python válido)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcriptor-whisper.py")
+    spec = importlib.util.spec_from_file_location("transcriptor_whisper", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_chunking(wav, configs):
+    """Troceado del PCM (ventanas o VAD) sin FFmpeg: velocidad en veces el tiempo real."""
+    pcm = read_pcm(wav)
+    audio_seconds = len(pcm) / 2 / SAMPLE_RATE
+    results = []
+    for chunk_size, overlap, vad in configs:
+        started = time.perf_counter()
+        chunks, _ = audio_chunks(io.BytesIO(pcm), chunk_size, overlap, vad)
+        count = sum(1 for _ in chunks)
+        elapsed = time.perf_counter() - started
+        results.append({"chunk_size": chunk_size, "overlap": overlap, "vad": vad, "chunks": count,
+                        "seconds": elapsed, "speed": audio_seconds / elapsed if elapsed else 0.0})
+        logger.info(f"[Benchmark] Troceado {chunk_size} s/{overlap} s/VAD {vad}: {count} chunks, "
+                    f"{results[-1]['speed']:.0f}x tiempo real")
+    return results
+
+
+def bench_capture(transcriptor, wav, configs):
+    """stream_audio_from_youtube con FFmpeg leyendo el WAV local: primer chunk y velocidad de captura."""
+    if not shutil.which("ffmpeg"):
+        logger.warning("[Benchmark] FFmpeg no encontrado; se omite la captura.")
+        return {"skipped": "ffmpeg no encontrado"}
+
+    audio_seconds = len(read_pcm(wav)) / 2 / SAMPLE_RATE
+    results = []
+    for chunk_size, overlap, vad in configs:
+        transcriptor.shutdown_event.clear()
+        transcriptor.configure_queues(0)
+        started = time.perf_counter()
+        thread = threading.Thread(target=transcriptor.stream_audio_from_youtube,
+                                  args=(wav, chunk_size, overlap, vad), daemon=True)
+        thread.start()
+        first_chunk, count = None, 0
+        while transcriptor.audio_queue.get() is not None:
+            first_chunk = first_chunk or time.perf_counter() - started
+            count += 1
+        elapsed = time.perf_counter() - started
+        thread.join()
+        results.append({"chunk_size": chunk_size, "overlap": overlap, "vad": vad, "chunks": count,
+                        "first_chunk_seconds": first_chunk, "seconds": elapsed,
+                        "speed": audio_seconds / elapsed if elapsed else 0.0})
+        logger.info(f"[Benchmark] Captura {chunk_size} s/{overlap} s/VAD {vad}: primer chunk en "
+                    f"{first_chunk or 0:.2f} s, {results[-1]['speed']:.0f}x tiempo real")
+    return results
+
+
+def bench_transcription(transcriptor, wav, backend, model_size, chunk_size, worker_configs, language="es"):
+    """transcription_worker con todos los chunks del WAV encolados a la vez: velocidad y latencia por chunk."""
+    pcm = read_pcm(wav)
+    chunks = list(audio_chunks(io.BytesIO(pcm), chunk_size)[0])
+    audio_seconds = sum(chunk.duration for chunk in chunks)
+    results = []
+    for workers, batch_size in worker_configs:
+        transcriptor.shutdown_event.clear()
+        transcriptor.configure_queues(0)
+        thread = threading.Thread(target=transcriptor.transcription_worker, daemon=True,
+                                  args=(model_size, language, 0.0, True, workers, batch_size, None, backend))
+        engine = get_inference_backend(backend, model_size)  # Cargado antes de medir; transcription_worker lo reutiliza
+
+        # Calentamiento fuera de la medida: transcription_worker crea el InferencePool (import de
+        # torch, réplicas de share_weights) y el modelo procesa un segundo de silencio que acaba
+        # en el 0, antes del audio medido
+        thread.start()
+        transcriptor.audio_queue.put(AudioChunk(-1.0, np.zeros(SAMPLE_RATE, dtype=np.float32),
+                                                captured_at=time.monotonic()))
+        transcriptor.transcription_queue.get()
+        engine.reset_stats()  # Está en la caché del ModelManager: sin esto sumaría el calentamiento y las configuraciones anteriores
+
+        started = time.perf_counter()
+        for chunk in chunks:
+            chunk.captured_at = time.monotonic()
+            transcriptor.audio_queue.put(chunk)
+        transcriptor.audio_queue.put(None)
+
+        latencies = []
+        while True:
+            caption = transcriptor.transcription_queue.get()
+            if caption is None:
+                break
+            latencies.append(time.monotonic() - caption.captured_at)
+        elapsed = time.perf_counter() - started
+        thread.join()
+        results.append({"workers": workers, "batch_size": batch_size, "chunks": len(chunks),
+                        "audio_seconds": audio_seconds, "seconds": elapsed,
+                        "speed": audio_seconds / elapsed if elapsed else 0.0, "latency": percentiles(latencies),
+                        "real_time_factor": engine.stats.real_time_factor, "batches": engine.stats.batches})
+        logger.info(f"[Benchmark] Transcripción {backend}/{model_size} ({workers} hilos, lote {batch_size}): "
+                    f"{results[-1]['speed']:.1f}x tiempo real, latencia p95 {results[-1]['latency']['p95']:.2f} s")
+    return results
+
+
+def bench_correction(vocabularies, sentences_count=500, seed=0):
+    """Carga del vocabulario y corregir_texto por tamaño de diccionario, con la caché vacía y ya llena."""
+    results = []
+    for size, path in sorted(vocabularies.items()):
+        vocabulary = sorted(leer_palabras_correctas(path))
+        sentences = fake_sentences(vocabulary, sentences_count, seed)
+        words = sum(len(sentence.split()) for sentence in sentences)
+
+        started = time.perf_counter()
+        crear_datos_precalculados(set(vocabulary))
+        build = time.perf_counter() - started
+
+        index = path[:-len(".json")] + ".vidx"
+        if os.path.exists(index):
+            os.remove(index)
+        started = time.perf_counter()
+        load_correct_words(path)  # Compila el índice
+        compile_index = time.perf_counter() - started
+        started = time.perf_counter()
+        datos_correccion = load_correct_words(path)
+        load_index = time.perf_counter() - started
+
+        result = {"vocabulary": size, "sentences": len(sentences), "words": words, "build_seconds": build,
+                  "compile_index_seconds": compile_index, "load_index_seconds": load_index}
+        configurar_cache_correcciones()
+        for cache in ("cold", "warm"):
+            latencies = []
+            for sentence in sentences:
+                started = time.perf_counter()
+                corregir_texto(sentence, datos_correccion, umbral=0.7)
+                latencies.append(time.perf_counter() - started)
+            total = sum(latencies)
+            result[cache] = {"seconds": total, "words_per_second": words / total if total else 0.0,
+                             "latency": percentiles(latencies)}
+        results.append(result)
+        logger.info(f"[Benchmark] Corrección con {size} palabras: índice en {load_index * 1000:.0f} ms, "
+                    f"{result['cold']['words_per_second']:.0f} palabras/s en frío, "
+                    f"{result['warm']['words_per_second']:.0f} con la caché llena")
+    return results
+
+
+# Se ejecuta en un proceso nuevo: `cli.py <comando> --help` y los módulos pesados que ha cargado
+_STARTUP_SCRIPT = """
+import contextlib, io, json, sys, time
+started = time.perf_counter()
+import cli
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        cli.main(sys.argv[1:] + ["--help"])
+    except SystemExit:
+        pass
+print(json.dumps({"seconds": time.perf_counter() - started,
+                  "heavy_modules": [name for name in cli.HEAVY_MODULES if name in sys.modules]}))
+"""
+
+
+def bench_startup(commands=tuple(COMMANDS), repeats=5, budget=None):
+    """Arranque de `cli.py <comando> --help` en un proceso nuevo: tiempo total, tiempo de imports y módulos pesados.
+
+    La ayuda y los errores de argumentos no deben cargar torch, whisper ni yt-dlp; un comando
+    que los carga, o que tarda más de `budget` segundos, se marca como regresión.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for command in commands:
+        totals, imports, heavy = [], [], set()
+        for _ in range(repeats):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, command], capture_output=True, text=True,
+                                    cwd=root, check=True).stdout
+            totals.append(time.perf_counter() - started)
+            measured = json.loads(output.splitlines()[-1])
+            imports.append(measured["seconds"])
+            heavy.update(measured["heavy_modules"])
+        result = {"command": command, "seconds": float(np.median(totals)), "import_seconds": float(np.median(imports)),
+                  "heavy_modules": sorted(heavy)}
+        result["regression"] = bool(heavy) or (budget is not None and result["seconds"] > budget)
+        results.append(result)
+        log = logger.error if result["regression"] else logger.info
+        log(f"[Benchmark] Arranque de `cli.py {command} --help`: {result['seconds'] * 1000:.0f} ms "
+            f"(imports {result['import_seconds'] * 1000:.0f} ms)"
+            + (f"; carga módulos pesados: {', '.join(result['heavy_modules'])}" if heavy else ""))
+    return results
+
+
+def environment():
+    """Datos de la máquina y del commit para que los informes se puedan comparar."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def _flatten(value, prefix=""):
+    """Aplana el informe en {ruta: número} para compararlo con otro."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = ((str(i), item) for i, item in enumerate(value))
+    else:
+        return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+    flat = {}
+    for key, item in items:
+        flat.update(_flatten(item, f"{prefix}.{key}" if prefix else key))
+    return flat
+
+
+def compare_reports(previous, current):
+    """Cambio relativo de cada medida entre dos informes. Devuelve {ruta: (anterior, actual, % de cambio)}."""
+    before, after = _flatten(previous["results"]), _flatten(current["results"])
+    changes = {}
+    for key in sorted(before.keys() & after.keys()):
+        if key.endswith(("seconds", "per_second", "speed", "real_time_factor", "p50", "p95", "max")) and before[key]:
+            changes[key] = (before[key], after[key], 100 * (after[key] - before[key]) / before[key])
+    return changes
+
+
+def run_benchmarks(stages, fixtures_dir="bench_fixtures", duration=120, vocab_sizes=(1000, 10000, 50000),
+                   backend="stub", model_size="tiny", chunk_size=10, worker_configs=((1, 1), (2, 1), (1, 4)),
+                   sentences=500, seed=0, startup_budget=None):
+    """Ejecuta las etapas pedidas y devuelve el informe."""
+    results = {}
+    if "startup" in stages:
+        results["startup"] = bench_startup(budget=startup_budget)
+    if set(stages) - {"startup"}:
+        wav, vocabularies = prepare_fixtures(fixtures_dir, duration, vocab_sizes, seed)
+    configs = [(chunk_size, 0.0, None), (chunk_size, chunk_size / 5, None), (chunk_size, 0.0, "energy")]
+    transcriptor = load_transcriptor() if {"capture", "transcription"} & set(stages) else None
+
+    if "chunking" in stages:
+        results["chunking"] = bench_chunking(wav, configs)
+    if "capture" in stages:
+        results["capture"] = bench_capture(transcriptor, wav, configs)
+    if "transcription" in stages:
+        results["transcription"] = bench_transcription(transcriptor, wav, backend, model_size, chunk_size,
+                                                       worker_configs)
+    if "correction" in stages:
+        results["correction"] = bench_correction(vocabularies, sentences, seed)
+
+    config = {"stages": list(stages), "duration": duration, "vocab_sizes": list(vocab_sizes), "backend": backend,
+              "model": model_size, "chunk_size": chunk_size, "workers": [list(c) for c in worker_configs],
+              "sentences": sentences, "seed": seed, "startup_budget": startup_budget}
+    return {"version": REPORT_VERSION, "environment": environment(), "config": config, "results": results}
+
+
+STAGES = ("startup", "chunking", "capture", "transcription", "correction")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark reproducible de las etapas del transcriptor, sin conexión.')
+    parser.add_argument('--stages', type=str, nargs='+', default=list(STAGES), choices=STAGES,
+                        help='Etapas a medir')
+    parser.add_argument('--output', type=str, default="benchmark.json",
+                        help='Fichero JSON donde se guarda el informe')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='Informe anterior con el que comparar los resultados')
+    parser.add_argument('--fixtures-dir', type=str, default="bench_fixtures",
+                        help='Directorio donde se generan el audio y los vocabularios de prueba')
+    parser.add_argument('--duration', type=float, default=120,
+                        help='Duración en segundos del audio sintético')
+    parser.add_argument('--vocab-sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='Tamaños de los vocabularios de prueba')
+    parser.add_argument('--sentences', type=int, default=500,
+                        help='Número de frases que se corrigen por vocabulario')
+    parser.add_argument('--backend', type=str, default="stub",
+                        help='Backend de inferencia: stub (sin modelo) o uno real, p. ej. whisper con --model tiny')
+    parser.add_argument('--stub-rtf', type=float, default=0.05,
+                        help='Segundos de cómputo por segundo de audio del backend stub')
+    parser.add_argument('--model', type=str, default="tiny", choices=["tiny", "base", "small", "medium", "large"],
+                        help='Tamaño del modelo con un backend real')
+    parser.add_argument('--chunk-size', type=float, default=10,
+                        help='Tamaño del fragmento de audio en segundos')
+    parser.add_argument('--workers', type=str, nargs='+', default=["1x1", "2x1", "1x4"],
+                        help='Configuraciones de inferencia como HILOSxLOTE')
+    parser.add_argument('--startup-budget', type=float, default=None,
+                        help='Segundos máximos de arranque de `cli.py <comando> --help`; más es una regresión')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Semilla de los datos sintéticos')
+    parser.add_argument('--debug', action='store_true',
+                        help='Activar modo debug')
+
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    register_inference_backend("stub", functools.partial(StubBackend, rtf=args.stub_rtf))
+    if args.backend not in INFERENCE_BACKENDS:
+        parser.error(f"Backend desconocido: {args.backend}")
+    worker_configs = [tuple(int(n) for n in config.split("x")) for config in args.workers]
+
+    report = run_benchmarks(args.stages, args.fixtures_dir, args.duration, args.vocab_sizes, args.backend, args.model,
+                            args.chunk_size, worker_configs, args.sentences, args.seed, args.startup_budget)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info(f"[Benchmark] Informe guardado en {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        logger.info(f"[Benchmark] Comparación con {args.compare} (commit {previous['environment'].get('commit')}):")
+        for key, (before, after, change) in compare_reports(previous, report).items():
+            logger.info(f"[Benchmark]   {key}: {before:.4g} -> {after:.4g} ({change:+.1f}%)")
+
+    regressions = [result["command"] for result in report["results"].get("startup", []) if result["regression"]]
+    if regressions:
+        logger.error(f"[Benchmark] Regresión en el arranque de: {', '.join(regressions)}")
+        raise SystemExit(1)
@@ -0,0 +1,189 @@
+import logging
+import subprocess
+import time
+
+from utils import get_audio_stream_info
+from streaming import SlidingWindowChunker, SAMPLE_RATE
+from vad import VADSegmenter, get_vad_backend, speech_chunks, log_vad_stats
+from metrics import REGISTRY
+from overload import OverloadQueue
+
+logger = logging.getLogger(__name__)
+
+# Duración de los bloques que se leen de FFmpeg cuando el VAD decide los cortes
+VAD_BLOCK_SECONDS = 0.48
+
+# Duración máxima de una ventana al aumentar el stride por sobrecarga (la ventana de Whisper)
+MAX_WINDOW_SECONDS = 30
+
+# Reintentos de conexión seguidos sin recibir audio antes de abandonar, y espera entre ellos (backoff exponencial)
+MAX_RECONNECTS = 10
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 60.0
+
+
+def start_ffmpeg(stream_url, seek=0.0):
+    """Lanza FFmpeg convirtiendo el stream a PCM s16le mono a 16 kHz por stdout.
+
+    Con `seek`, empieza en ese segundo del medio (solo vídeos, no directos).
+    """
+    cmd = [
+        'ffmpeg',
+        '-loglevel', 'quiet',  # Silenciar la salida de FFmpeg
+        *(['-ss', f"{seek:.3f}"] if seek else []),
+        '-i', stream_url,
+        '-vn',  # Sin video
+        '-acodec', 'pcm_s16le',  # Audio en formato PCM de 16 bits
+        '-f', 's16le',  # PCM crudo, sin cabecera WAV
+        '-ar', str(SAMPLE_RATE),
+        '-ac', '1',
+        '-'
+    ]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+
+def stop_process(process, tag="Stream"):
+    """Termina un proceso externo esperando como mucho 5 segundos."""
+    try:
+        process.terminate()
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    except Exception as e:
+        logger.error(f"[{tag}] Error cerrando proceso: {e}")
+
+
+def audio_chunks(stream, chunk_size=10, overlap=0.0, vad=None, vad_min_silence=0.5, labels=None):
+    """Divide un flujo PCM en chunks.
+
+    Devuelve (iterador de AudioChunk, divisor), donde el divisor es el VADSegmenter o el
+    SlidingWindowChunker que decide los cortes (ambos admiten widen()). `labels` son las
+    etiquetas de las métricas del VAD.
+    """
+    if vad:
+        # El VAD corta en las pausas (como mucho cada chunk_size segundos) y descarta el silencio
+        segmenter = VADSegmenter(get_vad_backend(vad), max_segment=chunk_size, min_silence=vad_min_silence,
+                                 labels=labels)
+        blocks = SlidingWindowChunker(VAD_BLOCK_SECONDS).chunks(stream)
+        return speech_chunks(blocks, segmenter), segmenter
+
+    # Ventanas de chunk_size segundos que avanzan chunk_size - overlap segundos
+    chunker = SlidingWindowChunker(chunk_size, overlap, max_window_seconds=MAX_WINDOW_SECONDS)
+    return chunker.chunks(stream), chunker
+
+
+def reconnect_delay(attempt, base=RECONNECT_DELAY, limit=MAX_RECONNECT_DELAY):
+    """Espera antes del reintento número `attempt` (1, 2, 4... segundos, como mucho `limit`)."""
+    return min(limit, base * 2 ** (attempt - 1))
+
+
+def capture_stream(youtube_url, out_queue, shutdown_event, chunk_size=10, overlap=0.0,
+                   vad=None, vad_min_silence=0.5, tag="Stream", labels=None,
+                   position=0.0, disconnected_at=None, max_reconnects=MAX_RECONNECTS, dedup=None):
+    """Captura el audio de YouTube y coloca los chunks en `out_queue` (None al terminar el stream).
+
+    Si FFmpeg se corta o la URL del stream caduca, se vuelve a resolver la URL y se reconecta
+    con espera exponencial, hasta `max_reconnects` intentos seguidos sin audio (0: sin reintentos).
+    Los tiempos de los chunks continúan entre conexiones: un vídeo se retoma en el segundo
+    `position` y un directo en el momento actual, sumando a `position` el tiempo transcurrido
+    desde `disconnected_at` (time.time(), al reanudar desde un checkpoint) o desde el corte.
+    `labels` son las etiquetas de sus métricas (p. ej. {"stream": "canal1"}). Con `dedup`
+    (SimulcastDedup), cada chunk se registra con su fingerprint al salir de FFmpeg para
+    reutilizar la transcripción de otros streams que emiten el mismo audio.
+    """
+    labels = labels or {}
+    captured = REGISTRY.counter("audio_chunks_total", "Chunks de audio capturados", **labels)
+    reconnects = REGISTRY.counter("stream_reconnects_total", "Reconexiones con el stream tras un corte", **labels)
+    gap_seconds = REGISTRY.counter("stream_gap_seconds_total", "Segundos de directo perdidos en las reconexiones",
+                                   **labels)
+
+    attempt = 0
+    was_live = False
+    while not shutdown_event.is_set():
+        if attempt:
+            if attempt > max_reconnects:
+                logger.error(f"[{tag}] No se pudo reconectar con el stream tras {max_reconnects} intentos.")
+                shutdown_event.set()
+                return
+            delay = reconnect_delay(attempt)
+            logger.warning(f"[{tag}] Reconectando en {delay:.0f} s (intento {attempt} de {max_reconnects}).")
+            if shutdown_event.wait(delay):
+                break
+            reconnects.inc()
+
+        # Tras un corte se vuelve a resolver la URL: la de googlevideo puede haber caducado
+        try:
+            info = get_audio_stream_info(youtube_url, refresh=attempt > 0)
+        except Exception as e:
+            logger.error(f"[{tag}] Error obteniendo la URL del stream: {e}")
+            attempt += 1
+            continue
+
+        live = bool(info.get('is_live'))
+        if was_live and not live:
+            out_queue.put(None)
+            logger.info(f"[{tag}] El directo ha terminado.")
+            return
+        was_live = live
+
+        offset = position
+        if live and disconnected_at is not None:
+            gap = max(0.0, time.time() - disconnected_at)
+            offset += gap
+            gap_seconds.inc(gap)
+            logger.warning(f"[{tag}] Se retoma el directo en el momento actual: se han perdido {gap:.1f} s.")
+        elif position:
+            logger.info(f"[{tag}] Se retoma el vídeo en el segundo {position:.1f}.")
+
+        process = None
+        splitter = None
+        try:
+            # Usar FFmpeg para procesar el stream en tiempo real
+            process = start_ffmpeg(info['url'], 0.0 if live else position)
+            chunks, splitter = audio_chunks(process.stdout, chunk_size, overlap, vad, vad_min_silence, labels)
+            if isinstance(out_queue, OverloadQueue):
+                out_queue.attach_source(splitter)
+
+            for chunk in chunks:
+                chunk.start += offset
+                chunk.captured_at = time.monotonic()
+                if dedup:
+                    dedup.register(youtube_url, chunk)
+                position = max(position, chunk.end)
+                attempt = 0
+                captured.inc()
+                out_queue.put(chunk)
+                if shutdown_event.is_set():
+                    break
+
+            if shutdown_event.is_set():
+                break
+            returncode = process.wait()
+            if returncode == 0 and not live:
+                out_queue.put(None)
+                logger.info(f"[{tag}] Fin del stream normalmente.")
+                return
+            # Un directo que termina bien se confirma al volver a resolverlo
+            if returncode:
+                logger.warning(f"[{tag}] FFmpeg ha terminado con código {returncode} en el segundo {position:.1f}.")
+
+        except FileNotFoundError:
+            logger.error(f"[{tag}] No se encuentra FFmpeg; no se puede capturar el audio.")
+            shutdown_event.set()
+            return
+
+        except Exception as e:
+            logger.error(f"[{tag}] Error capturando audio: {e}")
+
+        finally:
+            if isinstance(splitter, VADSegmenter):
+                log_vad_stats(splitter)
+
+            if process:
+                logger.info(f"[{tag}] Cerrando proceso de audio.")
+                stop_process(process, tag)
+
+        attempt += 1
+        disconnected_at = time.time()
+
+    logger.info(f"[{tag}] Finalizando captura de audio por señal de cierre.")
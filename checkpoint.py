@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+
+from inference import PROMPT_CHARS
+from sinks import Sink
+from utils import MARCA_CORREGIDA
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre escrituras del checkpoint
+CHECKPOINT_INTERVAL = 10.0
+
+
+@dataclass
+class Checkpoint:
+    """Punto de reanudación de una transcripción larga."""
+    url: str
+    position: float = 0.0        # Segundo del medio hasta el que ya se ha escrito la salida
+    captured_at: float = None    # time.time() en que se capturó ese segundo (para medir el hueco en directos)
+    prompt: str = ""             # Contexto (texto previo) que recibía el modelo
+    output_offset: int = 0       # Bytes del fichero de salida que corresponden a lo anterior
+    sink_offsets: dict = field(default_factory=dict)  # Lo mismo para cada destino que añade a un fichero
+    captions: int = 0            # Textos definitivos escritos desde el inicio
+    saved_at: float = None
+
+    @classmethod
+    def load(cls, path):
+        """Lee el checkpoint de `path`; None si no existe o no se puede leer."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.error(f"[Checkpoint] No se puede leer {path}: {e}")
+            return None
+
+    def save(self, path):
+        """Escribe el checkpoint de forma atómica: nunca queda un fichero a medias."""
+        self.saved_at = time.time()
+        temporal = f"{path}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, path)
+
+    def truncate_output(self, output_file):
+        """Recorta la salida y los destinos en fichero a lo que recoge el checkpoint, para no repetir lo escrito después."""
+        _truncate(output_file, self.output_offset)
+        for path, offset in self.sink_offsets.items():
+            if path != output_file:
+                _truncate(path, offset)
+
+
+def _truncate(path, offset):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    if size > offset:
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+        logger.info(f"[Checkpoint] Descartados {size - offset} bytes de {path} posteriores al checkpoint.")
+
+
+class CheckpointSink(Sink):
+    """Destino que guarda el checkpoint cada `interval` segundos con lo que ya se ha escrito.
+
+    Debe ir el último en el SinkWriter: cuando se guarda, los demás destinos ya han
+    volcado el lote, así que `output_offset` nunca apunta más allá de lo escrito. Con
+    `track`, guarda también el tamaño de los destinos que añaden a un fichero (JSONL...).
+    """
+
+    def __init__(self, path, checkpoint, output_file, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.checkpoint = checkpoint
+        self.output_file = output_file
+        self.interval = interval
+        self._last_save = time.monotonic()
+        self._dirty = False
+        self._files = []
+
+    def track(self, sinks):
+        """Destinos cuyo fichero se recorta al reanudar (los que añaden a un fichero)."""
+        self._files = [sink.path for sink in sinks if sink.appends]
+
+    def write(self, caption):
+        if not caption.final or not caption.text.strip():
+            return
+        checkpoint = self.checkpoint
+        checkpoint.position = max(checkpoint.position, caption.end)
+        if caption.captured_at:
+            checkpoint.captured_at = time.time() - (time.monotonic() - caption.captured_at)
+        text = caption.text.replace(MARCA_CORREGIDA, "").strip()
+        checkpoint.prompt = (checkpoint.prompt + " " + text)[-PROMPT_CHARS:]
+        checkpoint.captions += 1
+        self._dirty = True
+
+    def flush(self, force=False):
+        if not self._dirty or (not force and time.monotonic() - self._last_save < self.interval):
+            return
+        self.checkpoint.output_offset = _size(self.output_file)
+        self.checkpoint.sink_offsets = {path: _size(path) for path in self._files}
+        self.checkpoint.save(self.path)
+        self._last_save = time.monotonic()
+        self._dirty = False
+        logger.debug(f"[Checkpoint] Guardado en el segundo {self.checkpoint.position:.1f} "
+                     f"({self.checkpoint.captions} textos).")
+
+    def close(self):
+        self.flush(force=True)
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,55 @@
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+
+# Subcomando -> (fichero del módulo que lo implementa con main(argv, prog), descripción).
+# El módulo solo se importa al ejecutar su subcomando: `cli.py --help` no carga nada más.
+COMMANDS = {
+    "whisper": ("transcriptor-whisper.py", "Transcribe un stream de YouTube en directo con Whisper"),
+    "whisperx": ("transcriptor-whisperX.py", "Transcribe un stream con WhisperX (palabras alineadas y hablantes)"),
+    "offline": ("offline.py", "Transcribe vídeos (no en directo) en paralelo"),
+    "server": ("server.py", "Servidor que transcribe varios streams con un único modelo"),
+    "corregir": ("correccion.py", "Corrige transcripciones ya escritas con un vocabulario, sin cargar ningún modelo"),
+    "vocab": ("vocab_index.py", "Compila y revisa el índice del vocabulario de palabras correctas"),
+    "index": ("transcript_index.py", "Busca en el índice de transcripciones (--sink index:)"),
+}
+
+# Módulos que no deben importarse para mostrar la ayuda o validar los argumentos (ver benchmark.py)
+HEAVY_MODULES = ("torch", "whisper", "whisperx", "yt_dlp", "faster_whisper")
+
+
+def load_command(name):
+    """Importa el módulo de un subcomando (algunos ficheros no tienen un nombre de módulo válido)."""
+    filename = COMMANDS[name][0]
+    module_name = os.path.splitext(filename)[0]
+    if module_name.isidentifier():
+        return importlib.import_module(module_name)
+
+    module_name = module_name.replace("-", "_")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    comandos = "\n".join(f"  {name:<10} {description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog="cli.py", formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description='Transcriptor de YouTube: un único punto de entrada para todas '
+                                                 'las herramientas.',
+                                     epilog=f"comandos:\n{comandos}\n\n"
+                                            "`cli.py <comando> --help` muestra las opciones de cada comando.")
+    parser.add_argument('comando', choices=COMMANDS, metavar='comando',
+                        help='Herramienta a ejecutar (ver la lista de abajo)')
+    # Solo se analiza el subcomando; el resto de argumentos son del módulo que lo implementa
+    args = parser.parse_args(argv[:1])
+    load_command(args.comando).main(argv[1:], prog=f"{parser.prog} {args.comando}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import (MARCA_CORREGIDA, CacheCorrecciones, ambito_correcciones, configurar_cache_correcciones,
+                   corregir_palabra, corregir_texto, load_correct_words, necesita_correccion, normalizar_palabra,
+                   obtener_cache_correcciones, setup_logging, _PATRON_PALABRA)
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de las líneas de TextSink y de offline.py: `[HH:MM:SS]: ` y, con diarización, `SPEAKER_00: `
+_PREFIJO_LINEA = re.compile(r'^(\[[^\]]*\]: (?:SPEAKER_\d+: )?)?(.*)$', re.DOTALL)
+
+# Con menos palabras por buscar no compensa arrancar procesos (cada uno carga el vocabulario)
+MIN_PALABRAS_PROCESOS = 2000
+
+# Vocabulario de cada proceso del pool; se carga una vez en _init_proceso
+_datos_proceso = None
+_umbral_proceso = None
+
+
+def recoger_palabras(textos, datos_correccion, palabras=None):
+    """Palabras distintas de los textos que hay que buscar en el vocabulario: {palabra normalizada: palabra}.
+
+    Es la clave de la caché de correcciones, así que cada palabra se busca una sola vez
+    aunque aparezca miles de veces en el lote. Con `palabras`, se añaden a ese diccionario.
+    """
+    palabras = {} if palabras is None else palabras
+    for texto in textos:
+        for palabra in _PATRON_PALABRA.findall(texto.replace(MARCA_CORREGIDA, " ")):
+            if necesita_correccion(palabra, datos_correccion):
+                palabras.setdefault(normalizar_palabra(palabra), palabra)
+    return palabras
+
+
+def _init_proceso(correct_words, datos_correccion, umbral):
+    """Inicializa un proceso del pool: carga el vocabulario (del índice compilado si hay fichero)."""
+    global _datos_proceso, _umbral_proceso
+    _datos_proceso = load_correct_words(correct_words) if correct_words else datos_correccion
+    _umbral_proceso = umbral
+
+
+def _buscar_palabras(palabras):
+    """Busca un bloque de palabras en el vocabulario del proceso. Devuelve sus correcciones (None: sin corrección)."""
+    return [_buscar_palabra(palabra, _datos_proceso, _umbral_proceso) for palabra in palabras]
+
+
+def _buscar_palabra(palabra, datos_correccion, umbral):
+    corregida = corregir_palabra(palabra, datos_correccion['indice_fonetico'],
+                                 datos_correccion['listas_palabras_correctas'], umbral,
+                                 datos_correccion.get('indice_difuso'))
+    return corregida if corregida != palabra else CacheCorrecciones.SIN_CORRECCION
+
+
+def resolver_palabras(palabras, datos_correccion, umbral=0.7, procesos=1, correct_words=None):
+    """Corrección de cada palabra de recoger_palabras: {palabra normalizada: corrección o None}.
+
+    Las que ya están en la caché de correcciones no se vuelven a buscar; el resto se buscan
+    con la búsqueda fonética y difusa de corregir_palabra, en `procesos` procesos si son
+    muchas, y se guardan en la caché. Con `correct_words`, cada proceso carga el índice
+    compilado del vocabulario en lugar de recibir una copia de `datos_correccion`.
+    """
+    cache = obtener_cache_correcciones()
+    ambito = ambito_correcciones(datos_correccion, umbral)
+    resueltas, pendientes = {}, []
+    for clave, palabra in palabras.items():
+        encontrada, correccion = cache.obtener(ambito, clave)
+        if encontrada:
+            resueltas[clave] = correccion
+        else:
+            pendientes.append((clave, palabra))
+    if not pendientes:
+        return resueltas
+
+    started = time.perf_counter()
+    procesos = min(procesos, len(pendientes) // MIN_PALABRAS_PROCESOS)
+    lista = [palabra for _, palabra in pendientes]
+    if procesos > 1:
+        # Bloques grandes para no pagar la comunicación entre procesos palabra a palabra
+        tamano = -(-len(lista) // (procesos * 4))
+        bloques = [lista[i:i + tamano] for i in range(0, len(lista), tamano)]
+        # spawn: como offline.py, los procesos no heredan los hilos del proceso principal
+        context = multiprocessing.get_context("spawn")
+        initargs = (correct_words, None if correct_words else datos_correccion, umbral)
+        with ProcessPoolExecutor(procesos, mp_context=context, initializer=_init_proceso,
+                                 initargs=initargs) as pool:
+            correcciones = [correccion for bloque in pool.map(_buscar_palabras, bloques) for correccion in bloque]
+    else:
+        correcciones = [_buscar_palabra(palabra, datos_correccion, umbral) for palabra in lista]
+
+    for (clave, _), correccion in zip(pendientes, correcciones):
+        resueltas[clave] = correccion
+        cache.guardar(ambito, clave, correccion)
+    logger.debug(f"[Corrección] {len(pendientes)} palabras buscadas en {time.perf_counter() - started:.2f} s "
+                 f"({max(procesos, 1)} procesos), {len(palabras) - len(pendientes)} de la caché.")
+    return resueltas
+
+
+def corregir_textos(textos, datos_correccion, umbral=0.7, procesos=1, correct_words=None):
+    """corregir_texto para un lote de textos: cada palabra distinta se busca una sola vez para todo el lote."""
+    resueltas = resolver_palabras(recoger_palabras(textos, datos_correccion), datos_correccion, umbral, procesos,
+                                  correct_words)
+    return [corregir_texto_marcado(texto, datos_correccion, umbral, resueltas) for texto in textos]
+
+
+def corregir_texto_marcado(texto, datos_correccion, umbral=0.7, resueltas=None):
+    """corregir_texto respetando las correcciones ya hechas: corregir dos veces el mismo texto no lo cambia."""
+    partes = texto.split(MARCA_CORREGIDA)
+    return MARCA_CORREGIDA.join(corregir_texto(parte, datos_correccion, umbral, resueltas) for parte in partes)
+
+
+def corregir_linea(linea, datos_correccion, umbral=0.7, resueltas=None):
+    """Corrige una línea `[HH:MM:SS]: texto`, sin tocar la marca de tiempo ni el hablante."""
+    prefijo, texto = _PREFIJO_LINEA.match(linea).groups()
+    return (prefijo or "") + corregir_texto_marcado(texto, datos_correccion, umbral, resueltas)
+
+
+def corregir_jsonl(linea, datos_correccion, umbral=0.7, resueltas=None):
+    """Corrige el campo `text` de una línea de JsonlSink (las palabras con sus tiempos se dejan como están)."""
+    if not linea.strip():
+        return linea
+    objeto = json.loads(linea)
+    if objeto.get("text"):
+        objeto["text"] = corregir_texto_marcado(objeto["text"], datos_correccion, umbral, resueltas)
+    return json.dumps(objeto, ensure_ascii=False)
+
+
+def leer_textos(ruta):
+    """Textos de una transcripción (.txt o .jsonl), línea a línea y sin cargar el fichero entero."""
+    jsonl = ruta.endswith(".jsonl")
+    with open(ruta, "r", encoding="utf-8") as f:
+        for linea in f:
+            if jsonl:
+                if linea.strip():
+                    yield json.loads(linea).get("text") or ""
+            else:
+                yield _PREFIJO_LINEA.match(linea.rstrip("\n")).group(2)
+
+
+def ruta_corregida(ruta):
+    """Fichero de salida por defecto: `transcripcion.txt` -> `transcripcion.corregida.txt`."""
+    base, extension = os.path.splitext(ruta)
+    return f"{base}.corregida{extension}"
+
+
+def buscar_transcripciones(rutas):
+    """Expande los directorios en los .txt y .jsonl que contienen (sin las salidas .corregida ya escritas)."""
+    encontradas = []
+    for ruta in rutas:
+        if not os.path.isdir(ruta):
+            encontradas.append(ruta)
+            continue
+        for raiz, _, ficheros in os.walk(ruta):
+            encontradas.extend(os.path.join(raiz, nombre) for nombre in sorted(ficheros)
+                               if nombre.endswith((".txt", ".jsonl")) and ".corregida." not in nombre)
+    return encontradas
+
+
+def corregir_archivo(ruta, datos_correccion, salida=None, umbral=0.7, resueltas=None):
+    """Corrige una transcripción ya escrita (texto o JSONL) y la guarda en `salida`.
+
+    Sin `salida` se escribe junto al original (ver ruta_corregida); si `salida` es el propio
+    fichero, se sustituye al terminar, así que un error a medias no lo deja truncado.
+    Devuelve (líneas, líneas cambiadas).
+    """
+    salida = salida or ruta_corregida(ruta)
+    corregir = corregir_jsonl if ruta.endswith(".jsonl") else corregir_linea
+    temporal = f"{salida}.{os.getpid()}.tmp"
+    lineas = cambiadas = 0
+    try:
+        with open(ruta, "r", encoding="utf-8") as entrada, open(temporal, "w", encoding="utf-8") as f:
+            for linea in entrada:
+                original = linea.rstrip("\n")
+                corregida = corregir(original, datos_correccion, umbral, resueltas)
+                f.write(corregida + "\n")
+                lineas += 1
+                cambiadas += corregida != original
+        os.replace(temporal, salida)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return lineas, cambiadas
+
+
+def corregir_archivos(rutas, datos_correccion, umbral=0.7, procesos=1, correct_words=None, in_place=False,
+                      salida=None):
+    """Vuelve a corregir un conjunto de transcripciones en dos pasadas.
+
+    La primera lee todos los ficheros y reúne sus palabras distintas, que se buscan una sola
+    vez (en paralelo si son muchas); la segunda reescribe cada fichero línea a línea con las
+    correcciones ya resueltas. Devuelve {ruta: (líneas, líneas cambiadas) o None si falló}.
+    """
+    resultados = {}
+    palabras = {}
+    started = time.perf_counter()
+    for ruta in rutas:
+        try:
+            recoger_palabras(leer_textos(ruta), datos_correccion, palabras)
+            resultados[ruta] = (0, 0)
+        except (OSError, ValueError) as e:
+            logger.error(f"[Corrección] Error leyendo {ruta}: {e}")
+            resultados[ruta] = None
+    logger.info(f"[Corrección] {len(palabras)} palabras distintas que buscar en {len(rutas)} transcripciones "
+                f"({time.perf_counter() - started:.1f} s).")
+
+    started = time.perf_counter()
+    resueltas = resolver_palabras(palabras, datos_correccion, umbral, procesos, correct_words)
+    corregibles = sum(correccion is not CacheCorrecciones.SIN_CORRECCION for correccion in resueltas.values())
+    logger.info(f"[Corrección] {corregibles} de {len(resueltas)} palabras tienen corrección "
+                f"({time.perf_counter() - started:.1f} s).")
+
+    for ruta in rutas:
+        if resultados[ruta] is None:
+            continue
+        destino = ruta if in_place else salida or ruta_corregida(ruta)
+        try:
+            resultados[ruta] = corregir_archivo(ruta, datos_correccion, destino, umbral, resueltas)
+        except (OSError, ValueError) as e:
+            logger.error(f"[Corrección] Error corrigiendo {ruta}: {e}")
+            resultados[ruta] = None
+            continue
+        lineas, cambiadas = resultados[ruta]
+        logger.info(f"[Corrección] {ruta}: {cambiadas} de {lineas} líneas corregidas -> {destino}")
+    return resultados
+
+
+def main(argv=None, prog=None):
+    """Punto de entrada de la línea de comandos (también `cli.py corregir`)."""
+
+    parser = argparse.ArgumentParser(prog=prog, description='Corrige transcripciones ya escritas con un vocabulario '
+                                                            'de palabras correctas, sin cargar ningún modelo.')
+    parser.add_argument('archivos', type=str, nargs='+',
+                        help='Transcripciones a corregir (.txt con líneas [HH:MM:SS]: texto, o .jsonl) o '
+                             'directorios que las contienen')
+    parser.add_argument('--correct-words', type=str, required=True,
+                        help='Archivo JSON con palabras correctas')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Fichero de salida (solo con una transcripción; predeterminado: <nombre>.corregida.<ext>)')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Sustituir cada transcripción por su versión corregida')
+    parser.add_argument('--threshold', type=float, default=0.7,
+                        help='Similitud mínima (0-1) para sustituir una palabra')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Procesos con los que buscar las palabras (predeterminado: uno por núcleo)')
+    parser.add_argument('--cache-size', type=int, default=100000,
+                        help='Número máximo de palabras en la caché de correcciones')
+    parser.add_argument('--cache-file', type=str, default=None,
+                        help='Fichero SQLite donde persistir la caché de correcciones entre ejecuciones')
+    parser.add_argument('--debug', action='store_true',
+                        help='Activar modo debug')
+
+    args = parser.parse_args(argv)
+    archivos = buscar_transcripciones(args.archivos)
+    if args.output and (len(archivos) > 1 or args.in_place):
+        parser.error("--output solo se admite con una transcripción y sin --in-place")
+    setup_logging(args.debug)
+
+    datos_correccion = load_correct_words(args.correct_words)
+    if datos_correccion is None:
+        raise SystemExit(1)
+    cache = configurar_cache_correcciones(args.cache_size, args.cache_file)
+
+    started = time.perf_counter()
+    resultados = corregir_archivos(archivos, datos_correccion, args.threshold, args.workers or os.cpu_count() or 1,
+                                   args.correct_words, args.in_place, args.output)
+    fallidos = [ruta for ruta, resultado in resultados.items() if resultado is None]
+    lineas = sum(resultado[0] for resultado in resultados.values() if resultado)
+    logger.info(f"[Corrección] {len(archivos) - len(fallidos)} de {len(archivos)} transcripciones "
+                f"({lineas} líneas) corregidas en {time.perf_counter() - started:.1f} s.")
+    cache.registrar_estadisticas(logger)
+    cache.cerrar()
+    if fallidos:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import logging
+
+import numpy as np
+
+from streaming import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Segundos de audio sobre los que se diariza cada vez (los chunks nuevos más el contexto anterior)
+DIARIZATION_WINDOW = 60.0
+
+# Similitud coseno mínima entre la voz de una ventana y la de un hablante ya conocido para considerarlos el mismo
+SPEAKER_THRESHOLD = 0.5
+
+# Peso máximo del historial al actualizar la voz media de un hablante (para que se adapte poco a poco)
+MAX_CENTROID_WEIGHT = 20
+
+
+class SpeakerRegistry:
+    """Hablantes del stream completo, identificados por la media de sus embeddings de voz.
+
+    Las etiquetas que da el modelo en cada ventana (SPEAKER_00, SPEAKER_01...) son locales a
+    esa ventana; aquí se traducen a etiquetas globales que no cambian a lo largo del stream.
+    """
+
+    def __init__(self, threshold=SPEAKER_THRESHOLD):
+        self.threshold = threshold
+        self._centroids = []   # Embedding medio normalizado de cada hablante global
+        self._weights = []
+
+    def __len__(self):
+        return len(self._centroids)
+
+    @staticmethod
+    def label(index):
+        return f"SPEAKER_{index:02d}"
+
+    def match(self, embeddings):
+        """Asigna una etiqueta global a cada hablante local {etiqueta local: embedding}.
+
+        Los emparejamientos se hacen de mayor a menor similitud, sin repetir hablante global
+        dentro de la misma ventana; los que no superan el umbral son hablantes nuevos.
+        """
+        local = {speaker: _normalize(embedding) for speaker, embedding in embeddings.items()}
+        pairs = sorted(((float(np.dot(embedding, centroid)), speaker, index)
+                        for speaker, embedding in local.items()
+                        for index, centroid in enumerate(self._centroids)), reverse=True)
+        mapping, used = {}, set()
+        for similarity, speaker, index in pairs:
+            if similarity < self.threshold:
+                break
+            if speaker in mapping or index in used:
+                continue
+            mapping[speaker] = index
+            used.add(index)
+
+        for speaker, embedding in local.items():
+            if speaker in mapping:
+                self._update(mapping[speaker], embedding)
+            else:
+                mapping[speaker] = self._add(embedding)
+        return {speaker: self.label(index) for speaker, index in mapping.items()}
+
+    def new_label(self):
+        """Etiqueta para un hablante nuevo del que no se tiene embedding."""
+        return self.label(self._add(None))
+
+    def _add(self, embedding):
+        self._centroids.append(embedding if embedding is not None else np.zeros(0))
+        self._weights.append(1)
+        return len(self._centroids) - 1
+
+    def _update(self, index, embedding):
+        weight = self._weights[index]
+        centroid = self._centroids[index]
+        if centroid.shape != embedding.shape:
+            self._centroids[index] = embedding
+        else:
+            self._centroids[index] = _normalize(centroid * weight + embedding)
+        self._weights[index] = min(weight + 1, MAX_CENTROID_WEIGHT)
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _overlap(start, end, other_start, other_end):
+    return max(0.0, min(end, other_end) - max(start, other_start))
+
+
+class IncrementalDiarizer:
+    """Diarización de un stream por ventanas deslizantes con etiquetas de hablante estables.
+
+    Cada llamada a `process` diariza los chunks nuevos junto con el audio anterior hasta
+    completar `window` segundos y devuelve los turnos [(inicio, fin, hablante)] de los
+    chunks nuevos en tiempo del stream. Las etiquetas locales de la ventana se traducen a
+    globales con los embeddings de voz (SpeakerRegistry) o, si el pipeline no los da, por
+    coincidencia en el tiempo con los turnos ya asignados en la parte solapada.
+    """
+
+    def __init__(self, pipeline, window=DIARIZATION_WINDOW, registry=None):
+        self.pipeline = pipeline
+        self.window = window
+        self.registry = registry or SpeakerRegistry()
+        self._audio = []            # [(inicio, muestras)] de los últimos `window` segundos
+        self._turns = []            # Turnos globales ya asignados dentro de la ventana
+        self._labelled_until = 0.0  # Fin del audio que ya tiene hablantes asignados
+        self._embeddings = True     # Si el pipeline admite return_embeddings
+
+    def process(self, chunks):
+        """Diariza los chunks nuevos (consecutivos, en orden). Devuelve sus turnos en tiempo del stream."""
+        if not chunks:
+            return []
+        for chunk in chunks:
+            if self._audio and chunk.start - self._buffer_end() > 0.01:
+                # Hueco (chunk descartado por sobrecarga): el contexto anterior ya no es contiguo
+                self._audio, self._turns = [], []
+            self._audio.append((chunk.start, chunk.audio))
+        new_start = max(self._labelled_until, chunks[0].start)
+        new_end = chunks[-1].end
+        self._trim(min(new_start, new_end - self.window))
+
+        window_start = self._audio[0][0]
+        audio = np.concatenate([audio for _, audio in self._audio])
+        local_turns, embeddings = self._diarize(audio)
+        local_turns = [(window_start + start, window_start + end, speaker) for start, end, speaker in local_turns]
+
+        if embeddings:
+            mapping = self.registry.match(embeddings)
+        else:
+            mapping = self._match_by_overlap(local_turns, new_start)
+
+        turns = [(max(start, new_start), end, mapping[speaker])
+                 for start, end, speaker in local_turns if end > new_start]
+        self._turns.extend(turns)
+        self._labelled_until = new_end
+        return turns
+
+    def _diarize(self, audio):
+        """Ejecuta el pipeline. Devuelve ([(inicio, fin, hablante local)], {hablante local: embedding} o None)."""
+        embeddings = None
+        if self._embeddings:
+            try:
+                diarization, embeddings = self.pipeline(audio, return_embeddings=True)
+            except TypeError:
+                # Versiones de WhisperX sin embeddings: las etiquetas se enlazan por solapamiento
+                logger.warning("[Diarización] El pipeline no devuelve embeddings; se enlazan los hablantes por "
+                               "solapamiento entre ventanas.")
+                self._embeddings = False
+        if not self._embeddings:
+            diarization = self.pipeline(audio)
+        turns = list(zip(diarization["start"], diarization["end"], diarization["speaker"]))
+        return turns, embeddings
+
+    def _match_by_overlap(self, local_turns, new_start):
+        """Etiquetas globales para las locales según cuánto coinciden con los turnos anteriores."""
+        overlaps = {}
+        for start, end, speaker in local_turns:
+            if start >= new_start:
+                continue
+            for previous_start, previous_end, label in self._turns:
+                shared = _overlap(start, min(end, new_start), previous_start, previous_end)
+                if shared:
+                    overlaps[(speaker, label)] = overlaps.get((speaker, label), 0.0) + shared
+
+        mapping, used = {}, set()
+        for (speaker, label), _ in sorted(overlaps.items(), key=lambda item: item[1], reverse=True):
+            if speaker not in mapping and label not in used:
+                mapping[speaker] = label
+                used.add(label)
+        for _, _, speaker in local_turns:
+            if speaker not in mapping:
+                mapping[speaker] = self.registry.new_label()
+        return mapping
+
+    def _buffer_end(self):
+        start, audio = self._audio[-1]
+        return start + len(audio) / SAMPLE_RATE
+
+    def _trim(self, start):
+        """Descarta el audio y los turnos anteriores a `start`."""
+        while len(self._audio) > 1 and self._audio[0][0] + len(self._audio[0][1]) / SAMPLE_RATE <= start:
+            self._audio.pop(0)
+        self._turns = [turn for turn in self._turns if turn[1] > self._audio[0][0]]
+
+
+def speaker_at(turns, start, end):
+    """Hablante que más tiempo ocupa el intervalo; si ninguno lo toca, el del turno más cercano."""
+    if not turns:
+        return None
+    durations = {}
+    for turn_start, turn_end, speaker in turns:
+        shared = _overlap(start, end, turn_start, turn_end)
+        if shared:
+            durations[speaker] = durations.get(speaker, 0.0) + shared
+    if durations:
+        return max(durations, key=durations.get)
+    middle = (start + end) / 2
+    return min(turns, key=lambda turn: min(abs(turn[0] - middle), abs(turn[1] - middle)))[2]
+
+
+def assign_speakers(segments, turns, offset=0.0):
+    """Añade `speaker` a cada segmento (y a sus palabras) con tiempos relativos a `offset`."""
+    for segment in segments:
+        segment["speaker"] = speaker_at(turns, offset + segment["start"], offset + segment["end"])
+        for word in segment.get("words", []):
+            if "start" in word:
+                word["speaker"] = speaker_at(turns, offset + word["start"], offset + word["end"])
+    return segments
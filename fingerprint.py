@@ -0,0 +1,390 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from metrics import REGISTRY
+from overload import chunk_level_db
+from streaming import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Tramas del fingerprint: 256 ms que avanzan 16 ms (muy solapadas y largas, para que dos
+# streams con los cortes desplazados una fracción de trama den casi los mismos bits)
+FRAME_SAMPLES = 4096
+HOP_SAMPLES = 256
+HOP_SECONDS = HOP_SAMPLES / SAMPLE_RATE
+
+# 33 bandas logarítmicas entre 300 Hz y 3 kHz: 32 bits por trama
+BAND_EDGES = np.unique(np.round(np.geomspace(300, 3000, 34) * FRAME_SAMPLES / SAMPLE_RATE).astype(int))
+
+# Se indexa cada mitad de 16 bits de los hashes por separado: entre dos codificaciones del
+# mismo audio casi nunca coinciden los 32 bits, pero una de las mitades sí con frecuencia.
+# Solo las claves pares, para que la selección no dependa de dónde empiece el chunk
+HALF_MASK = 0xFFFF
+INDEX_MASK = 1
+
+# Claves coincidentes con el mismo desfase para considerar que dos chunks son el mismo audio
+MIN_VOTES = 8
+
+# Tasa de bits distintos por debajo de la cual el audio se da por idéntico (la de Haitsma y Kalker)
+MAX_BIT_ERROR = 0.35
+
+# Parte del chunk que debe estar cubierta por audio ya capturado de otro stream para reutilizarlo
+MIN_COVERAGE = 0.9
+
+# Los chunks por debajo de este nivel (dBFS) no se comparan: el silencio se parece entre streams
+SILENCE_DB = -60.0
+
+# Segundos que se recuerda el audio de cada stream
+DEDUP_WINDOW = 120.0
+
+# Segundos como mucho que un chunk espera, desde su captura, a la transcripción de otro stream
+DEDUP_WAIT = 15.0
+
+# Diferencia de llegada (s) por debajo de la cual dos streams van a la par: manda el nombre
+LEAD_MARGIN = 1.0
+
+# Cada cuántos chunks registrados se borra lo que ha salido de la ventana
+PRUNE_EVERY = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    stream TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    registered_at REAL NOT NULL,
+    hashes BLOB NOT NULL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_stream ON chunks(stream, start);
+CREATE INDEX IF NOT EXISTS chunks_registered ON chunks(registered_at);
+CREATE TABLE IF NOT EXISTS hashes (
+    key INTEGER NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    frame INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hashes_key ON hashes(key);
+CREATE INDEX IF NOT EXISTS hashes_chunk ON hashes(chunk_id);
+"""
+
+
+def audio_fingerprint(audio):
+    """Fingerprint espectral de unas muestras float32 a 16 kHz: un hash de 32 bits cada 16 ms.
+
+    Cada bit dice si la diferencia de energía entre dos bandas vecinas crece o decrece
+    respecto a la trama anterior, así que no depende del volumen ni de la codificación.
+    """
+    if len(audio) < FRAME_SAMPLES + HOP_SAMPLES:
+        return np.zeros(0, dtype=np.uint32)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FRAME_SAMPLES)[::HOP_SAMPLES]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SAMPLES).astype(np.float32), axis=1)) ** 2
+    energy = np.add.reduceat(spectrum[:, BAND_EDGES[0]:BAND_EDGES[-1]], BAND_EDGES[:-1] - BAND_EDGES[0], axis=1)
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+    return np.packbits(bits, axis=1, bitorder="little").view("<u4").ravel()
+
+
+def _index_keys(hashes):
+    """Claves del índice y su trama: (mitad baja) y (mitad alta + 2^16) de cada hash.
+
+    Se descartan las mitades con todos los bits iguales, que salen del silencio digital.
+    """
+    frames = np.arange(len(hashes))
+    keys = []
+    for half, value in enumerate((hashes & HALF_MASK, hashes >> 16)):
+        mask = ((value & INDEX_MASK) == 0) & (value != 0) & (value != HALF_MASK)
+        keys.append((value[mask].astype(np.int64) + (half << 16), frames[mask]))
+    return np.concatenate([k for k, _ in keys]), np.concatenate([f for _, f in keys])
+
+
+def _bit_errors(a, b):
+    """Bits distintos entre dos series de hashes, trama a trama."""
+    return np.unpackbits((a ^ b).view(np.uint8)).reshape(-1, 32).sum(axis=1)
+
+
+def _plain_result(result):
+    """Lo que se guarda de un resultado para otros streams (tiempos relativos al chunk)."""
+    segments = []
+    for segment in result["segments"]:
+        plain = {"start": float(segment["start"]), "end": float(segment["end"]), "text": segment["text"]}
+        if segment.get("words"):
+            plain["words"] = [{**word, "start": float(word["start"]), "end": float(word["end"])}
+                              for word in segment["words"]]
+        segments.append(plain)
+    return {"segments": segments, "language": result.get("language")}
+
+
+@dataclass
+class AudioFingerprint:
+    """Fingerprint de un chunk registrado en el índice."""
+    chunk_id: int
+    stream: str
+    hashes: np.ndarray
+    registered_at: float    # time.time() al registrarlo (al salir de la captura)
+    reused: bool = False    # Su transcripción se tomó de otro stream
+
+
+class SimulcastDedup:
+    """Reutiliza la transcripción de audio que otro stream ya ha transcrito (emisiones simultáneas).
+
+    La captura registra el fingerprint de cada chunk (`register`) en una base de datos SQLite
+    compartida: en memoria dentro de un proceso (servidor multi-stream) o un fichero que
+    comparten varios transcriptores. Antes de transcribir un chunk, `transcribe` busca audio
+    de otro stream capturado en los últimos `window` segundos que lo cubra; si lo encuentra,
+    recorta la transcripción de ese stream al tramo del chunk en lugar de llamar al modelo.
+    Solo se reutiliza lo de los streams que llegan antes: si el otro aún no ha terminado de
+    transcribirlo, `pending` lo indica durante como mucho `wait` segundos desde la captura y
+    quien reparte los chunks (InferencePool, FairScheduler) lo aplaza sin bloquear sus hilos.
+    """
+
+    def __init__(self, path=":memory:", window=DEDUP_WINDOW, wait=DEDUP_WAIT):
+        self.path = path
+        self.window = window
+        self.wait = wait
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._registered = 0
+
+        self.reused_chunks = 0
+        self.transcribed_chunks = 0
+        self.reused_seconds = 0.0
+        self.transcribed_seconds = 0.0
+        self._chunks_metric = {
+            outcome: REGISTRY.counter("dedup_chunks_total", "Chunks transcritos o reutilizados de otro stream",
+                                      outcome=outcome)
+            for outcome in ("reused", "transcribed")
+        }
+        self._seconds_metric = REGISTRY.counter("dedup_reused_audio_seconds_total",
+                                                "Segundos de audio cuya transcripción se reutilizó de otro stream")
+
+    def register(self, stream, chunk):
+        """Calcula el fingerprint del chunk recién capturado y lo deja en `chunk.fingerprint`."""
+        if chunk_level_db(chunk) < SILENCE_DB:
+            return
+        hashes = audio_fingerprint(chunk.audio)
+        if not len(hashes):
+            return
+        now = time.time()
+        keys, frames = _index_keys(hashes)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                chunk_id = self._conn.execute(
+                    "INSERT INTO chunks (stream, start, end, registered_at, hashes) VALUES (?, ?, ?, ?, ?)",
+                    (stream, chunk.start, chunk.end, now, hashes.tobytes())).lastrowid
+                self._conn.executemany("INSERT INTO hashes (key, chunk_id, frame) VALUES (?, ?, ?)",
+                                       [(int(key), chunk_id, int(frame)) for key, frame in zip(keys, frames)])
+                self._registered += 1
+                if self._registered % PRUNE_EVERY == 0:
+                    self._prune(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        chunk.fingerprint = AudioFingerprint(chunk_id, stream, hashes, now)
+
+    def transcribe(self, backend, chunks, language=None, prompt=None):
+        """Como `backend.transcribe`, pero sin llamar al modelo con los chunks que otro stream ya transcribió."""
+        results = [self.lookup(chunk) for chunk in chunks]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            transcribed = backend.transcribe([chunks[i] for i in missing], language, prompt)
+            for i, result in zip(missing, transcribed):
+                results[i] = result
+        for chunk, result in zip(chunks, results):
+            self.store(chunk, result)
+        return results
+
+    def lookup(self, chunk):
+        """Transcripción de otro stream recortada al chunk, o None si hay que transcribirlo.
+
+        No espera: para dar tiempo al otro stream, se aplaza el chunk mientras `pending` lo indique.
+        """
+        fingerprint = chunk.fingerprint
+        if fingerprint is None:
+            return None
+        state, result = self._match(chunk)
+        if state != "hit":
+            return None
+        fingerprint.reused = True
+        with self._lock:
+            self.reused_chunks += 1
+            self.reused_seconds += chunk.duration
+        self._chunks_metric["reused"].inc()
+        self._seconds_metric.inc(chunk.duration)
+        logger.debug(f"[Dedup] {fingerprint.stream} {chunk.start:.1f}-{chunk.end:.1f} s: "
+                     f"transcripción reutilizada de otro stream.")
+        return result
+
+    def pending(self, chunk):
+        """True si el chunk coincide con audio de otro stream que aún no se ha transcrito y puede esperar."""
+        fingerprint = chunk.fingerprint
+        if fingerprint is None or time.time() >= fingerprint.registered_at + self.wait:
+            return False
+        return self._match(chunk)[0] == "pending"
+
+    def store(self, chunk, result):
+        """Guarda la transcripción de un chunk registrado para que otros streams la reutilicen."""
+        fingerprint = chunk.fingerprint
+        if fingerprint is None:
+            self._count_transcribed(chunk)
+            return
+        if result is not None:
+            with self._lock:
+                self._conn.execute("UPDATE chunks SET result = ? WHERE id = ?",
+                                   (json.dumps(_plain_result(result), ensure_ascii=False), fingerprint.chunk_id))
+        if not fingerprint.reused:
+            self._count_transcribed(chunk)
+
+    def stats(self):
+        total = self.reused_seconds + self.transcribed_seconds
+        return {"reused_chunks": self.reused_chunks, "transcribed_chunks": self.transcribed_chunks,
+                "reused_audio_seconds": round(self.reused_seconds, 1),
+                "reused_ratio": round(self.reused_seconds / total, 3) if total else 0.0}
+
+    def log_stats(self, real_time_factor=None, nivel=logging.INFO):
+        """Registra el ahorro: audio reutilizado y, con el RTF del backend, el cómputo que se ha evitado."""
+        total = self.reused_seconds + self.transcribed_seconds
+        if not total:
+            return
+        saved = f"; ~{self.reused_seconds * real_time_factor:.0f} s de inferencia ahorrados" if real_time_factor else ""
+        logger.log(nivel, f"[Dedup] {self.reused_chunks} de {self.reused_chunks + self.transcribed_chunks} chunks "
+                          f"({self.reused_seconds:.0f} s de {total:.0f} s de audio, "
+                          f"{self.reused_seconds / total:.0%}) reutilizados de otros streams{saved}.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _count_transcribed(self, chunk):
+        with self._lock:
+            self.transcribed_chunks += 1
+            self.transcribed_seconds += chunk.duration
+        self._chunks_metric["transcribed"].inc()
+
+    def _prune(self, now):
+        """Borra lo que ha salido de la ventana (dentro de la transacción de `register`)."""
+        limit = now - self.window - self.wait
+        self._conn.execute("DELETE FROM hashes WHERE chunk_id IN (SELECT id FROM chunks WHERE registered_at < ?)",
+                           (limit,))
+        self._conn.execute("DELETE FROM chunks WHERE registered_at < ?", (limit,))
+
+    def _match(self, chunk):
+        """Compara el chunk con el audio reciente de otros streams. Devuelve (estado, resultado).
+
+        "hit": otro stream que llega antes lo cubre y ya está transcrito; "pending": lo cubre
+        (o lo cubrirá) pero falta su transcripción o parte del audio; "miss": no hay coincidencia
+        o este stream es el que llega antes.
+        """
+        fingerprint = chunk.fingerprint
+        hashes = fingerprint.hashes
+        since = time.time() - self.window
+        query = {}
+        for key, frame in zip(*_index_keys(hashes)):
+            query.setdefault(int(key), []).append(int(frame))
+        if not query:
+            return "miss", None
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT h.key, h.frame, c.stream, c.start FROM hashes h JOIN chunks c ON c.id = h.chunk_id "
+                f"WHERE h.key IN ({','.join('?' * len(query))}) AND c.stream != ? AND c.registered_at >= ?",
+                (*query, fingerprint.stream, since)).fetchall()
+
+        # Votos por (stream, desfase en tramas entre el otro stream y este)
+        votes = {}
+        for value, frame, stream, start in rows:
+            source_frame = round((start - chunk.start) / HOP_SECONDS) + frame
+            for query_frame in query[value]:
+                vote = (stream, source_frame - query_frame)
+                votes[vote] = votes.get(vote, 0) + 1
+        if not votes:
+            return "miss", None
+        # Los cortes de los dos streams no caen en la misma trama: se suman los desfases vecinos
+        scores = {(stream, offset): sum(votes.get((stream, offset + i), 0) for i in (-1, 0, 1))
+                  for stream, offset in votes}
+        (stream, offset), count = max(scores.items(), key=lambda item: item[1])
+        if count < MIN_VOTES:
+            return "miss", None
+
+        delta = offset * HOP_SECONDS   # Tiempo del otro stream = tiempo de este + delta
+        with self._lock:
+            sources = self._conn.execute(
+                "SELECT start, end, registered_at, hashes, result FROM chunks "
+                "WHERE stream = ? AND start < ? AND end > ? AND registered_at >= ? ORDER BY start",
+                (stream, chunk.end + delta, chunk.start + delta, since)).fetchall()
+
+        # Cada trama del chunk se compara con la del primer chunk del otro stream que la contiene
+        # y sus vecinas: los cortes casi nunca caen justo en una trama, así que se toma la que
+        # menos bits distintos tenga
+        times = chunk.start + delta + np.arange(len(hashes)) * HOP_SECONDS
+        covered = np.zeros(len(hashes), dtype=bool)
+        errors = 0
+        owners = []
+        arrival = None
+        for start, end, registered_at, blob, result in sources:
+            source_hashes = np.frombuffer(blob, dtype=np.uint32)
+            frames = np.round((times - start) / HOP_SECONDS).astype(int)
+            mask = ~covered & (frames >= 0) & (frames < len(source_hashes))
+            if not mask.any():
+                continue
+            errors += int(np.minimum.reduce([
+                _bit_errors(hashes[mask], source_hashes[np.clip(frames[mask] + i, 0, len(source_hashes) - 1)])
+                for i in (-1, 0, 1)]).sum())
+            covered |= mask
+            owners.append((start, end, result))
+            if arrival is None:
+                # Cuándo llegó el audio común a cada stream (hora de registro menos lo que quedaba de chunk)
+                t = times[np.flatnonzero(mask)[0]]
+                arrival = (fingerprint.registered_at - (chunk.end - (t - delta))) - (registered_at - (end - t))
+
+        checked = int(covered.sum())
+        if checked < MIN_VOTES or errors / (32 * checked) > MAX_BIT_ERROR:
+            return "miss", None
+        # Solo se reutiliza lo de un stream que llega antes; a la par, el de nombre menor
+        if arrival < -LEAD_MARGIN or (abs(arrival) <= LEAD_MARGIN and stream > fingerprint.stream):
+            return "miss", None
+        if checked < MIN_COVERAGE * len(hashes):
+            # Se puede esperar al audio que al otro stream aún no le ha llegado (el final), no al que le falta antes
+            last = np.flatnonzero(covered)[-1]
+            if last + 1 - covered[:last + 1].sum() > (1 - MIN_COVERAGE) * len(hashes):
+                return "miss", None
+            return "pending", None
+        if any(result is None for _, _, result in owners):
+            return "pending", None
+        return "hit", self._clip(owners, chunk, delta)
+
+    @staticmethod
+    def _clip(owners, chunk, delta):
+        """Recorta las transcripciones del otro stream al tramo del chunk, en tiempos relativos al chunk."""
+        segments = []
+        language = None
+        begin, finish = chunk.start + delta, chunk.end + delta
+        for i, (start, end, result) in enumerate(owners):
+            result = json.loads(result)
+            language = language or result.get("language")
+            # Con ventanas solapadas, cada segmento es del primer chunk que lo contiene
+            limit = owners[i + 1][0] if i + 1 < len(owners) else end
+            for segment in result["segments"]:
+                seg_start, seg_end = start + segment["start"], start + segment["end"]
+                middle = (seg_start + seg_end) / 2
+                if not (begin <= middle < finish and middle < limit):
+                    continue
+                shift = start - begin
+                clipped = {**segment, "start": max(0.0, segment["start"] + shift),
+                           "end": min(chunk.duration, segment["end"] + shift)}
+                if "words" in segment:
+                    clipped["words"] = [{**word, "start": word["start"] + shift, "end": word["end"] + shift}
+                                        for word in segment["words"]]
+                segments.append(clipped)
+        return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": language}
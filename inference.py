@@ -0,0 +1,442 @@
+import copy
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import REGISTRY
+from models import get_model_manager, load_whisper, open_whisper
+from streaming import HypothesisDeduper
+
+logger = logging.getLogger(__name__)
+
+# Caracteres del texto previo que se pasan como contexto (prompt) a Whisper
+PROMPT_CHARS = 200
+
+# Duración de cada token de marca de tiempo de Whisper
+TIMESTAMP_SECONDS = 0.02
+
+# Cada cuántos segundos se revisan las ventanas aplazadas a la espera de otro stream (dedup)
+DEFER_POLL_SECONDS = 0.2
+
+
+def share_weights(model):
+    """Copia la estructura del modelo reutilizando los mismos tensores de pesos.
+
+    Whisper instala hooks en los módulos durante la decodificación, así que cada hilo
+    necesita sus propios módulos; los pesos (lo que ocupa memoria) se comparten. Las capas
+    cuantizadas (int8) guardan los pesos empaquetados en un submódulo que no son parámetros
+    ni buffers: ese submódulo, de solo lectura, también se comparte.
+    """
+    import torch
+
+    memo = {id(tensor): tensor for tensor in itertools.chain(model.parameters(), model.buffers())}
+    for module in model.modules():
+        if isinstance(getattr(module, "_packed_params", None), torch.ScriptObject):
+            memo[id(module)] = module
+    return copy.deepcopy(model, memo)
+
+
+def _segments_from_tokens(tokenizer, tokens, duration):
+    """Convierte los tokens con marcas de tiempo de Whisper en segmentos relativos a la ventana."""
+    segments = []
+    text_tokens = []
+    start = 0.0
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = (token - tokenizer.timestamp_begin) * TIMESTAMP_SECONDS
+            if text_tokens:
+                segments.append({"start": start, "end": time, "text": tokenizer.decode(text_tokens)})
+                text_tokens = []
+            start = time
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        segments.append({"start": start, "end": duration, "text": tokenizer.decode(text_tokens)})
+    return segments
+
+
+def transcribe_batch(model, chunks, language=None, prompt=None):
+    """Transcribe varias ventanas de audio; con más de una, el encoder y el decoder trabajan en lote."""
+    import torch
+    import whisper
+
+    if len(chunks) == 1 or any(len(chunk.audio) > whisper.audio.N_SAMPLES for chunk in chunks):
+        return [model.transcribe(chunk.audio, language=language, initial_prompt=prompt) for chunk in chunks]
+
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(chunk.audio), model.dims.n_mels)
+        for chunk in chunks
+    ]).to(model.device)
+    options = whisper.DecodingOptions(language=language, prompt=prompt, without_timestamps=False,
+                                      fp16=model.device.type != "cpu")
+    decoded = whisper.decode(model, mels, options)
+
+    results = []
+    for chunk, result in zip(chunks, decoded):
+        tokenizer = whisper.tokenizer.get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                                    language=result.language, task="transcribe")
+        segments = [{**segment, "avg_logprob": result.avg_logprob}
+                    for segment in _segments_from_tokens(tokenizer, result.tokens, chunk.duration)]
+        results.append({"text": result.text, "segments": segments, "language": result.language})
+    return results
+
+
+class InferenceStats:
+    """Tiempo de cómputo frente a segundos de audio transcritos, compartido por las réplicas de un backend."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.audio_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.batches = 0
+
+    def record(self, audio_seconds, compute_seconds):
+        with self._lock:
+            self.audio_seconds += audio_seconds
+            self.compute_seconds += compute_seconds
+            self.batches += 1
+
+    @property
+    def real_time_factor(self):
+        """Segundos de cómputo por segundo de audio (por debajo de 1, más rápido que el tiempo real)."""
+        return self.compute_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+
+class InferenceBackend:
+    """Interfaz de los motores de inferencia.
+
+    Un backend transcribe listas de AudioChunk y devuelve, por cada una, un dict como el de
+    `model.transcribe()` de Whisper ({"text", "segments", "language"}) con tiempos relativos
+    a la ventana. `replicate()` devuelve otra instancia para un hilo más, compartiendo pesos.
+    `detect_language(audio)` devuelve (idioma, probabilidad), o None si el backend no detecta idiomas.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.stats = InferenceStats()
+        self._audio_metric = REGISTRY.counter("inference_audio_seconds_total", "Segundos de audio transcritos",
+                                              backend=self.name)
+        self._compute_metric = REGISTRY.counter("inference_compute_seconds_total", "Segundos de cómputo de inferencia",
+                                                backend=self.name)
+        self._rtf_metric = REGISTRY.gauge("inference_real_time_factor", "RTF del último lote", backend=self.name)
+        self._batch_metric = REGISTRY.summary("inference_seconds", "Duración de cada lote de inferencia",
+                                              backend=self.name)
+
+    def transcribe(self, chunks, language=None, prompt=None):
+        started = time.perf_counter()
+        results = self._transcribe(chunks, language, prompt)
+        elapsed = time.perf_counter() - started
+        audio = sum(chunk.duration for chunk in chunks)
+        self.stats.record(audio, elapsed)
+        self._audio_metric.inc(audio)
+        self._compute_metric.inc(elapsed)
+        self._rtf_metric.set(elapsed / audio if audio else 0.0)
+        self._batch_metric.observe(elapsed)
+        logger.debug(f"[Inferencia] {self.name}: {audio:.1f} s de audio en {elapsed:.2f} s "
+                     f"(RTF {elapsed / audio if audio else 0:.2f})")
+        return results
+
+    def _transcribe(self, chunks, language, prompt):
+        raise NotImplementedError
+
+    def detect_language(self, audio):
+        return None
+
+    def replicate(self):
+        return self
+
+    def reset_stats(self):
+        """Vuelve a contar desde cero; las réplicas creadas después comparten los contadores nuevos."""
+        self.stats = InferenceStats()
+
+    def log_stats(self, nivel=logging.INFO):
+        s = self.stats
+        logger.log(nivel, f"[Inferencia] Backend {self.name}: RTF {s.real_time_factor:.2f} "
+                          f"({s.audio_seconds:.0f} s de audio en {s.compute_seconds:.0f} s de cómputo, {s.batches} lotes)")
+
+
+class WhisperBackend(InferenceBackend):
+    """openai-whisper en float32 (fp16 en GPU)."""
+
+    name = 'whisper'
+
+    def __init__(self, model_size, device=None, model_dir=None):
+        super().__init__()
+        self.model = load_whisper(model_size, device, model_dir)
+
+    def _transcribe(self, chunks, language, prompt):
+        return transcribe_batch(self.model, chunks, language, prompt)
+
+    def detect_language(self, audio):
+        if not self.model.is_multilingual:
+            return "en", 1.0
+        import torch
+        import whisper
+
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), self.model.dims.n_mels).to(self.model.device)
+        with torch.no_grad():
+            _, probs = self.model.detect_language(mel)
+        language = max(probs, key=probs.get)
+        return language, probs[language]
+
+    def replicate(self):
+        replica = copy.copy(self)  # Misma instancia de InferenceStats
+        replica.model = share_weights(self.model)
+        return replica
+
+
+def quantize_whisper(model):
+    """Cuantiza dinámicamente a int8 las capas lineales de un modelo Whisper en CPU.
+
+    Los pesos pasan a int8 y las activaciones se cuantizan al vuelo en cada capa; las
+    convoluciones, las normalizaciones y los embeddings siguen en float32.
+    """
+    import torch
+    import whisper
+
+    for module in model.modules():
+        # La subclase Linear de whisper solo adapta el dtype para fp16; quantize_dynamic
+        # únicamente reconoce nn.Linear
+        if type(module) is whisper.model.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class Int8WhisperBackend(WhisperBackend):
+    """openai-whisper con las capas lineales cuantizadas a int8 (solo CPU)."""
+
+    name = 'int8'
+
+    def __init__(self, model_size, device=None, model_dir=None):
+        if device not in (None, "cpu"):
+            raise ValueError("El backend 'int8' solo funciona en CPU")
+        InferenceBackend.__init__(self)
+        # Copia propia del modelo: se cuantiza in situ y los pesos float32 se liberan
+        self.model = quantize_whisper(open_whisper(model_size, "cpu", model_dir).eval())
+
+
+class CTranslate2Backend(InferenceBackend):
+    """faster-whisper (CTranslate2) en int8 en CPU o float16 en GPU (requiere `pip install faster-whisper`)."""
+
+    name = 'ctranslate2'
+
+    def __init__(self, model_size, device=None, model_dir=None):
+        super().__init__()
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise ImportError("El backend 'ctranslate2' necesita el paquete faster-whisper: pip install faster-whisper")
+        import torch
+
+        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = WhisperModel(model_size, device=device, compute_type="int8" if device == "cpu" else "float16",
+                                  download_root=model_dir)
+
+    def _transcribe(self, chunks, language, prompt):
+        results = []
+        for chunk in chunks:
+            segments, info = self.model.transcribe(chunk.audio, language=language, initial_prompt=prompt)
+            segments = [{"start": s.start, "end": s.end, "text": s.text, "avg_logprob": s.avg_logprob}
+                        for s in segments]
+            results.append({"text": "".join(s["text"] for s in segments), "segments": segments,
+                            "language": info.language})
+        return results
+
+    def detect_language(self, audio):
+        # faster-whisper detecta el idioma al llamar a transcribe; los segmentos no se decodifican
+        # hasta que se recorre el generador
+        _, info = self.model.transcribe(audio)
+        return info.language, info.language_probability
+
+
+# Backends disponibles; se pueden añadir otros con register_inference_backend
+INFERENCE_BACKENDS = {
+    'whisper': WhisperBackend,
+    'int8': Int8WhisperBackend,
+    'ctranslate2': CTranslate2Backend,
+}
+
+
+def register_inference_backend(name, factory):
+    """Registra un backend. `factory(model_size, device, model_dir)` debe devolver un InferenceBackend."""
+    INFERENCE_BACKENDS[name] = factory
+
+
+def preload_inference_backend(name, model_size, device=None, model_dir=None):
+    """Empieza a crear un backend en segundo plano; se reutiliza dentro del proceso."""
+    if name not in INFERENCE_BACKENDS:
+        raise ValueError(f"Backend de inferencia desconocido: {name}. Disponibles: {', '.join(INFERENCE_BACKENDS)}")
+    return get_model_manager().preload(("backend", name, model_size, device, model_dir),
+                                       lambda: INFERENCE_BACKENDS[name](model_size, device, model_dir))
+
+
+def get_inference_backend(name, model_size, device=None, model_dir=None):
+    """Devuelve el backend indicado con el modelo cargado."""
+    return preload_inference_backend(name, model_size, device, model_dir).result()
+
+
+class InferencePool:
+    """Pool de hilos de inferencia que comparten un backend (y sus pesos).
+
+    Cada hilo agrupa hasta `batch_size` ventanas pendientes en un micro-lote. Los
+    resultados se reordenan por orden de llegada antes de eliminar solapamientos
+    y entregarse a `on_result(text, chunk, segments)`, con los segmentos en tiempo absoluto.
+    Como mucho `max_pending` ventanas esperan dentro del pool: el resto se queda en la
+    cola de audio, donde se aplica la política de sobrecarga. `prompt` es el contexto
+    inicial (p. ej. el de un checkpoint al reanudar). Con `dedup` (SimulcastDedup), las
+    ventanas que otro stream ya transcribió no pasan por el modelo; las que otro stream aún
+    está transcribiendo se apartan y los hilos siguen con las demás hasta que se pueden reutilizar.
+    """
+
+    def __init__(self, backend, workers=1, batch_size=1, language=None, overlap=0.0, use_context=True,
+                 on_result=None, shutdown_event=None, max_pending=None, prompt="", dedup=None):
+        self.backend = backend
+        self.dedup = dedup
+        self.batch_size = max(1, batch_size)
+        self.language = language
+        self.use_context = use_context
+        self.on_result = on_result
+        self.shutdown_event = shutdown_event or threading.Event()
+
+        if workers > 1:
+            import torch
+
+            # El presupuesto de hilos de torch es global al proceso: se reparte entre los workers
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+        self._input = queue.Queue(max_pending or 2 * workers * self.batch_size)
+        self._lock = threading.Lock()
+        self._generation = 0        # Cambia con set_backend para que los hilos tomen el nuevo backend
+        self._completed = {}        # Resultados que esperan a los anteriores para salir en orden
+        self._next_to_emit = 0
+        self._submitted = 0
+        self._deferred = []         # (seq, ventana) que esperan la transcripción de otro stream
+        self._deduper = HypothesisDeduper(overlap)
+        self._prompt = prompt[-PROMPT_CHARS:]
+
+        replicas = [backend] + [backend.replicate() for _ in range(workers - 1)]
+        self._threads = [
+            threading.Thread(target=self._worker, args=(replica,), name=f"inferencia-{i}", daemon=True)
+            for i, replica in enumerate(replicas)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, chunk):
+        """Encola una ventana de audio para transcribir; espera si el pool ya tiene `max_pending`."""
+        if self._put((self._submitted, chunk)):
+            self._submitted += 1
+
+    def close(self, timeout=None):
+        """Espera a que se procesen las ventanas pendientes y detiene los hilos."""
+        for _ in self._threads:
+            self._put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self.backend.log_stats()
+
+    def set_backend(self, backend):
+        """Sustituye el backend (p. ej. por un modelo más pequeño); cada hilo lo toma en su siguiente lote."""
+        with self._lock:
+            previous, self.backend = self.backend, backend
+            self._generation += 1
+        previous.log_stats()
+
+    def _put(self, item):
+        """Encola sin quedarse bloqueado para siempre si el pipeline se está cerrando."""
+        while not self.shutdown_event.is_set():
+            try:
+                self._input.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _next_batch(self):
+        """Obtiene un micro-lote: las ventanas aplazadas y las de la cola. Devuelve (lote, debe_terminar)."""
+        with self._lock:
+            batch, self._deferred = self._deferred, []
+        try:
+            # Con ventanas aplazadas se espera poco a la cola, para volver a revisarlas
+            item = self._input.get(timeout=DEFER_POLL_SECONDS if batch else 1)
+        except queue.Empty:
+            if not batch:
+                raise
+            return batch, False
+        if item is None:
+            return batch, True
+        batch.append(item)
+        while len(batch) < self.batch_size:
+            try:
+                item = self._input.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _defer_pending(self, batch):
+        """Aparta las ventanas que otro stream está transcribiendo; devuelve como mucho `batch_size` del resto."""
+        ready, waiting = [], []
+        for item in batch:
+            (waiting if len(ready) >= self.batch_size or self.dedup.pending(item[1]) else ready).append(item)
+        if waiting:
+            with self._lock:
+                self._deferred.extend(waiting)
+        return ready
+
+    def _worker(self, backend):
+        stop = False
+        generation = 0
+        while not stop and not self.shutdown_event.is_set():
+            try:
+                batch, stop = self._next_batch()
+                if self.dedup and not stop:
+                    # Al cerrar ya no se espera a otros streams: se transcribe todo lo aplazado
+                    batch = self._defer_pending(batch)
+                if not batch:
+                    continue
+
+                with self._lock:
+                    prompt = self._prompt if self.use_context and self._prompt else None
+                    if generation != self._generation:
+                        backend, generation = self.backend.replicate(), self._generation
+                chunks = [chunk for _, chunk in batch]
+                if self.dedup:
+                    results = self.dedup.transcribe(backend, chunks, self.language, prompt)
+                else:
+                    results = backend.transcribe(chunks, self.language, prompt)
+                logger.debug(f"[Transcripción] Lote de {len(chunks)} ventanas procesado.")
+
+                self._commit([seq for seq, _ in batch], chunks, results)
+
+            except queue.Empty:
+                continue
+
+            except Exception as e:
+                logger.error(f"[Transcripción] Error en transcripción: {e}")
+                self.shutdown_event.set()
+                break
+
+    def _commit(self, seqs, chunks, results):
+        """Entrega los resultados en el orden en que se enviaron las ventanas."""
+        with self._lock:
+            for seq, chunk, result in zip(seqs, chunks, results):
+                self._completed[seq] = (chunk, result)
+
+            while self._next_to_emit in self._completed:
+                chunk, result = self._completed.pop(self._next_to_emit)
+                self._next_to_emit += 1
+
+                # Quedarse solo con los segmentos que no se emitieron en la ventana anterior
+                segments = self._deduper.filter(result["segments"], chunk)
+                text = "".join(segment["text"] for segment in segments)
+                if self.use_context and text.strip():
+                    self._prompt = (self._prompt + text)[-PROMPT_CHARS:]
+                if self.on_result:
+                    self.on_result(text, chunk, segments)
@@ -0,0 +1,153 @@
+import logging
+
+import numpy as np
+
+from metrics import REGISTRY
+from overload import chunk_level_db
+from streaming import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Segundos de voz con los que se detecta el idioma al principio del stream
+DETECT_SECONDS = 10.0
+
+# Segundos de audio entre comprobaciones del idioma ya fijado
+RECHECK_SECONDS = 300.0
+
+# Probabilidad mínima para fijar un idioma, o para cambiar a otro en una comprobación
+MIN_CONFIDENCE = 0.6
+
+# Nivel (dBFS) por debajo del cual un chunk se considera silencio y no sirve para detectar el idioma
+SPEECH_DB = -45.0
+
+# avg_logprob medio por debajo del cual se adelanta la comprobación (el mismo umbral que usa Whisper)
+LOW_LOGPROB = -1.0
+
+# Audio máximo que Whisper usa para detectar el idioma
+MAX_DETECT_SAMPLES = 30 * SAMPLE_RATE
+
+
+class LanguageTracker:
+    """Detecta el idioma del stream una sola vez y lo fija, en lugar de que Whisper lo detecte en cada chunk.
+
+    Acumula los primeros `detect_seconds` de voz y, si el idioma más probable supera
+    `min_confidence`, lo fija; si no, sigue probando con la voz más reciente. Con el idioma
+    fijado, lo vuelve a comprobar cada `recheck_seconds` de audio, o antes si la confianza
+    de la transcripción cae (`feedback`), y solo lo cambia si otro idioma gana con confianza
+    en dos comprobaciones seguidas: la música o el ruido no lo hacen saltar. Si el usuario
+    indica `language`, no se detecta nada.
+    """
+
+    def __init__(self, backend, language=None, detect_seconds=DETECT_SECONDS, recheck_seconds=RECHECK_SECONDS,
+                 min_confidence=MIN_CONFIDENCE, tag="Idioma", labels=None):
+        self.language = language
+        self.fixed = language is not None
+        self.detect_seconds = detect_seconds
+        self.recheck_seconds = recheck_seconds
+        self.min_confidence = min_confidence
+        self.tag = tag
+        # Réplica propia: la detección no puede compartir módulos con un hilo que está decodificando
+        self.backend = None if self.fixed else backend.replicate()
+
+        self.audio_seconds = {}        # Segundos de audio transcritos con cada idioma (None: detección por chunk)
+        self.detections = 0
+        self.switches = 0
+        self._speech = []              # Voz acumulada hasta fijar el idioma
+        self._since_check = 0.0
+        self._recheck_requested = False
+        self._candidate = None         # Otro idioma que ganó la última comprobación
+
+        self.labels = labels or {}
+        self._detections_metric = REGISTRY.counter("language_detections_total", "Pasadas de detección de idioma",
+                                                   **self.labels)
+        self._switches_metric = REGISTRY.counter("language_switches_total", "Cambios del idioma fijado",
+                                                 **self.labels)
+
+    def observe(self, chunk):
+        """Registra un chunk antes de transcribirlo. Devuelve el idioma con el que transcribirlo (None: detectar)."""
+        if not self.fixed:
+            if self.language is None:
+                self._accumulate(chunk)
+            else:
+                self._since_check += chunk.duration
+                if self._recheck_requested or self._since_check >= self.recheck_seconds:
+                    self._recheck(chunk)
+
+        self.audio_seconds[self.language] = self.audio_seconds.get(self.language, 0.0) + chunk.duration
+        REGISTRY.counter("language_audio_seconds_total", "Segundos de audio transcritos con cada idioma",
+                         language=self.language or "auto", **self.labels).inc(chunk.duration)
+        return self.language
+
+    def feedback(self, segments):
+        """Confianza de la transcripción: con un avg_logprob medio bajo se adelanta la comprobación."""
+        logprobs = [segment["avg_logprob"] for segment in segments if "avg_logprob" in segment]
+        if self.language and not self.fixed and logprobs and np.mean(logprobs) < LOW_LOGPROB:
+            self._recheck_requested = True
+
+    def log_stats(self, nivel=logging.INFO):
+        total = sum(self.audio_seconds.values())
+        if self.fixed or not total:
+            return
+        shares = ", ".join(f"{language or 'auto'} {seconds / total:.0%}"
+                           for language, seconds in sorted(self.audio_seconds.items(), key=lambda item: -item[1]))
+        logger.log(nivel, f"[{self.tag}] Audio por idioma: {shares}; {self.detections} detecciones, "
+                          f"{self.switches} cambios.")
+
+    def stats(self):
+        return {"language": self.language, "fixed": self.fixed, "detections": self.detections,
+                "switches": self.switches,
+                "audio_seconds": {language or "auto": round(seconds, 1)
+                                  for language, seconds in self.audio_seconds.items()}}
+
+    def _detect(self, audio):
+        detected = self.backend.detect_language(audio[-MAX_DETECT_SAMPLES:])
+        self.detections += 1
+        self._detections_metric.inc()
+        return detected
+
+    def _accumulate(self, chunk):
+        """Suma voz hasta `detect_seconds` y fija el idioma si la detección es fiable."""
+        if chunk_level_db(chunk) < SPEECH_DB:
+            return
+        self._speech.append(chunk.audio)
+        audio = np.concatenate(self._speech)
+        if len(audio) < self.detect_seconds * SAMPLE_RATE:
+            return
+
+        detected = self._detect(audio)
+        if detected is None:
+            logger.info(f"[{self.tag}] El backend no detecta idiomas; se detecta en cada chunk.")
+            self.fixed = True
+            return
+        language, probability = detected
+        if probability >= self.min_confidence:
+            self.language = language
+            self._speech = []
+            logger.info(f"[{self.tag}] Idioma detectado: {language} (p={probability:.2f}) en "
+                        f"{len(audio) / SAMPLE_RATE:.0f} s de voz; se usa para el resto del stream.")
+        else:
+            # Seguir con la voz más reciente hasta que la detección sea fiable
+            self._speech = [audio[-MAX_DETECT_SAMPLES:]]
+            logger.debug(f"[{self.tag}] Idioma dudoso: {language} (p={probability:.2f}); se sigue acumulando voz.")
+
+    def _recheck(self, chunk):
+        """Comprueba el idioma fijado con el chunk actual, si tiene voz."""
+        if chunk_level_db(chunk) < SPEECH_DB:
+            return
+        self._since_check = 0.0
+        self._recheck_requested = False
+        language, probability = self._detect(chunk.audio)
+        if language == self.language or probability < self.min_confidence:
+            self._candidate = None
+            return
+        if self._candidate != language:
+            self._candidate = language
+            logger.debug(f"[{self.tag}] Posible cambio de idioma a {language} (p={probability:.2f}).")
+            self._recheck_requested = True  # Confirmar con el siguiente chunk de voz
+            return
+
+        logger.warning(f"[{self.tag}] Cambio de idioma: {self.language} -> {language} (p={probability:.2f}).")
+        self.language = language
+        self._candidate = None
+        self.switches += 1
+        self._switches_metric.inc()
@@ -0,0 +1,224 @@
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de todas las métricas exportadas
+PREFIX = "transcriptor_"
+
+# Observaciones recientes con las que se calculan los percentiles de un Summary
+SUMMARY_WINDOW = 1000
+
+
+class Counter:
+    """Contador que solo crece (chunks, segundos de audio...)."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [("", self.value)]
+
+
+class Gauge:
+    """Valor instantáneo; con `function` se lee en el momento de exportar (p. ej. el tamaño de una cola)."""
+
+    kind = "gauge"
+
+    def __init__(self, function=None):
+        self.function = function
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [("", self.function() if self.function else self.value)]
+
+
+class Summary:
+    """Distribución de una duración: número, suma, máximo y percentiles de las últimas observaciones."""
+
+    kind = "summary"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=SUMMARY_WINDOW)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._recent.append(value)
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantiles(self, qs=(0.5, 0.95)):
+        with self._lock:
+            recent = np.array(self._recent)
+        if not len(recent):
+            return {q: 0.0 for q in qs}
+        return dict(zip(qs, np.quantile(recent, qs)))
+
+    def samples(self):
+        samples = [(f'quantile="{q}"', value) for q, value in self.quantiles().items()]
+        return samples + [("_sum", self.sum), ("_count", self.count)]
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso, identificadas por nombre y etiquetas (p. ej. stream="canal1")."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}   # (nombre, etiquetas) -> métrica
+        self._help = {}
+
+    def _get(self, factory, name, help, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = factory()
+                self._help.setdefault(name, help)
+            return metric
+
+    def counter(self, name, help="", **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", function=None, **labels):
+        gauge = self._get(Gauge, name, help, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def summary(self, name, help="", **labels):
+        return self._get(Summary, name, help, labels)
+
+    def unregister(self, **labels):
+        """Elimina las métricas que tienen estas etiquetas (p. ej. las de un stream que se ha parado)."""
+        wanted = set(labels.items())
+        with self._lock:
+            for key in [key for key in self._metrics if wanted <= set(key[1])]:
+                del self._metrics[key]
+
+    def _sorted(self):
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    def render_prometheus(self):
+        """Exporta las métricas en el formato de texto de Prometheus."""
+        lines = []
+        declared = set()
+        for (name, labels), metric in self._sorted():
+            full_name = PREFIX + name
+            if name not in declared:
+                declared.add(name)
+                if self._help.get(name):
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} {metric.kind}")
+            label_text = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+            for suffix, value in metric.samples():
+                if suffix.startswith("_"):
+                    series, extra = full_name + suffix, label_text
+                else:
+                    series, extra = full_name, ",".join(filter(None, (label_text, suffix)))
+                lines.append(f"{series}{{{extra}}} {value:g}" if extra else f"{series} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def log_line(self):
+        """Resumen de una línea con pares clave=valor para el log."""
+        parts = []
+        for (name, labels), metric in self._sorted():
+            tags = "".join(f"[{v}]" for _, v in labels)
+            if isinstance(metric, Summary):
+                if not metric.count:
+                    continue
+                p50, p95 = metric.quantiles().values()
+                parts.append(f"{name}_p50{tags}={p50:.3f} {name}_p95{tags}={p95:.3f} {name}_max{tags}={metric.max:.3f}")
+            else:
+                parts.append(f"{name}{tags}={metric.samples()[0][1]:g}")
+        return " ".join(parts)
+
+
+# Registro compartido por todo el proceso
+REGISTRY = MetricsRegistry()
+
+
+def _escape_label(value):
+    """Escapa un valor de etiqueta para el formato de texto de Prometheus (las URL o ids de stream vienen del usuario)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def serve_metrics(port, host="127.0.0.1", registry=REGISTRY):
+    """Sirve /metrics en formato Prometheus desde un hilo en segundo plano.
+
+    Por defecto solo en local: las etiquetas incluyen URLs e ids de stream.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"[Métricas] {self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metricas-http", daemon=True).start()
+    logger.info(f"[Métricas] Exportando métricas de Prometheus en http://{host}:{port}/metrics")
+    return server
+
+
+class MetricsReporter:
+    """Escribe periódicamente en el log (el configurado con setup_logging) una línea con todas las métricas."""
+
+    def __init__(self, interval=60.0, registry=REGISTRY):
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metricas-log", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(5)
+        self.report()
+
+    def report(self):
+        line = self.registry.log_line()
+        if line:
+            logger.info(f"[Métricas] {line}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+
+def start_metrics(port=None, interval=60.0, host="127.0.0.1"):
+    """Arranca la exportación de métricas configurada por línea de comandos. Devuelve (servidor, reporter)."""
+    server = serve_metrics(port, host) if port else None
+    reporter = MetricsReporter(interval).start() if interval and interval > 0 else None
+    return server, reporter
@@ -0,0 +1,203 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import asdict
+
+logger = logging.getLogger(__name__)
+
+# Tamaños de Whisper de menor a mayor coste
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+
+
+class ModelManager:
+    """Carga cada modelo una sola vez por proceso y lo reutiliza.
+
+    `preload` empieza la carga en un hilo en segundo plano (por ejemplo mientras FFmpeg
+    conecta con el stream) y `get` espera a que termine; si el modelo ya estaba cargado,
+    por un reinicio del pipeline o por otro stream, se devuelve al instante.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}  # clave -> Future con el modelo
+
+    def preload(self, key, loader):
+        """Empieza a cargar `loader()` bajo `key` si no está ya cargado o cargándose."""
+        with self._lock:
+            future = self._models.get(key)
+            if future is None:
+                future = self._models[key] = Future()
+                threading.Thread(target=self._load, args=(key, loader, future), daemon=True,
+                                 name=f"carga-{key[0]}").start()
+        return future
+
+    def get(self, key, loader, timeout=None):
+        """Devuelve el modelo de `key`, cargándolo si hace falta."""
+        return self.preload(key, loader).result(timeout)
+
+    def release(self, key):
+        """Olvida un modelo para que la memoria se libere cuando nadie más lo use."""
+        with self._lock:
+            self._models.pop(key, None)
+
+    def loaded(self):
+        with self._lock:
+            return [key for key, future in self._models.items() if future.done() and not future.exception()]
+
+    def _load(self, key, loader, future):
+        started = time.monotonic()
+        try:
+            model = loader()
+        except BaseException as e:
+            # Un fallo no se queda en la caché: el siguiente get() lo vuelve a intentar
+            self.release(key)
+            future.set_exception(e)
+            return
+        logger.info(f"[Modelos] {key[0]} ({key[1]}) cargado en {time.monotonic() - started:.1f} s")
+        future.set_result(model)
+
+
+# Gestor compartido por todos los pipelines del proceso
+_model_manager = ModelManager()
+
+
+def get_model_manager():
+    return _model_manager
+
+
+def smaller_model(model_size):
+    """Devuelve el tamaño de modelo inmediatamente inferior, o None si ya es el más pequeño."""
+    if model_size not in MODEL_SIZES or model_size == MODEL_SIZES[0]:
+        return None
+    return MODEL_SIZES[MODEL_SIZES.index(model_size) - 1]
+
+
+def _snapshot_path(snapshot_dir, model_size):
+    return os.path.join(snapshot_dir, f"whisper-{model_size}.pt")
+
+
+def save_whisper_snapshot(model, path):
+    """Guarda el modelo ya convertido a float32 en un fichero que se puede abrir con mmap."""
+    import torch
+
+    state_dict = model.state_dict()
+    # Los buffers no persistentes (máscara causal, cabezas de alineamiento) no están en el
+    # state_dict; se guardan aparte para no tener que construir el modelo en CPU al cargar
+    extra, sparse = {}, []
+    for name, buffer in model.named_buffers():
+        if name not in state_dict:
+            if buffer.is_sparse:
+                sparse.append(name)
+                buffer = buffer.to_dense()
+            extra[name] = buffer.cpu()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporal = f"{path}.{os.getpid()}.tmp"
+    torch.save({
+        "dims": asdict(model.dims),
+        "model_state_dict": {name: tensor.cpu() for name, tensor in state_dict.items()},
+        "extra_buffers": extra,
+        "sparse_buffers": sparse,
+    }, temporal)
+    os.replace(temporal, path)
+
+
+def load_whisper_snapshot(path, device=None):
+    """Abre una instantánea con mmap: los pesos no se copian ni se convierten al cargar."""
+    import torch
+    from whisper.model import AudioEncoder, ModelDimensions, TextDecoder, Whisper
+
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    dims = ModelDimensions(**checkpoint["dims"])
+
+    # Mismos módulos que Whisper.__init__, pero en el dispositivo meta: sin reservar ni
+    # inicializar pesos que el state_dict va a sustituir (Whisper(dims) no se puede crear
+    # en meta porque sus cabezas de alineamiento son un tensor disperso)
+    model = Whisper.__new__(Whisper)
+    torch.nn.Module.__init__(model)
+    model.dims = dims
+    with torch.device("meta"):
+        model.encoder = AudioEncoder(dims.n_mels, dims.n_audio_ctx, dims.n_audio_state,
+                                     dims.n_audio_head, dims.n_audio_layer)
+        model.decoder = TextDecoder(dims.n_vocab, dims.n_text_ctx, dims.n_text_state,
+                                    dims.n_text_head, dims.n_text_layer)
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+
+    for name, buffer in checkpoint["extra_buffers"].items():
+        module_name, _, attr = name.rpartition(".")
+        if name in checkpoint["sparse_buffers"]:
+            buffer = buffer.to_sparse()
+        model.get_submodule(module_name).register_buffer(attr, buffer, persistent=False)
+
+    missing = [name for name, tensor in model.state_dict(keep_vars=True).items() if tensor.is_meta]
+    missing += [name for name, tensor in model.named_buffers() if tensor.is_meta]
+    if missing:
+        raise ValueError(f"La instantánea no incluye {', '.join(missing)}")
+    return model.to(device) if device else model
+
+
+def open_whisper(model_size, device=None, snapshot_dir=None):
+    """Carga un modelo Whisper sin pasar por la caché del proceso (usa la instantánea si existe)."""
+    import torch
+    import whisper
+
+    # Mismo criterio que whisper.load_model, para que la instantánea acabe en el mismo dispositivo
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    if snapshot_dir:
+        path = _snapshot_path(snapshot_dir, model_size)
+        if os.path.exists(path):
+            try:
+                return load_whisper_snapshot(path, device)
+            except Exception as e:
+                logger.warning(f"[Modelos] No se pudo abrir la instantánea {path}, se regenera: {e}")
+
+    model = whisper.load_model(model_size, device=device)
+    if snapshot_dir:
+        try:
+            save_whisper_snapshot(model, path)
+            logger.info(f"[Modelos] Instantánea guardada en {path}")
+        except OSError as e:
+            logger.warning(f"[Modelos] No se pudo guardar la instantánea en {path}: {e}")
+    return model
+
+
+def preload_whisper(model_size, device=None, snapshot_dir=None):
+    """Empieza a cargar un modelo Whisper en segundo plano."""
+    return _model_manager.preload(("whisper", model_size, device, snapshot_dir),
+                                  lambda: open_whisper(model_size, device, snapshot_dir))
+
+
+def load_whisper(model_size, device=None, snapshot_dir=None, timeout=None):
+    """Devuelve un modelo Whisper, reutilizando el ya cargado en este proceso.
+
+    Con `snapshot_dir`, la primera carga guarda allí una instantánea en float32 y las
+    siguientes (también en otros procesos) la abren con mmap, compartiendo la caché de páginas.
+    """
+    return preload_whisper(model_size, device, snapshot_dir).result(timeout)
+
+
+def preload_whisperx(model_size, device, compute_type, language=None, snapshot_dir=None):
+    """Empieza a cargar un modelo de WhisperX; `snapshot_dir` guarda allí el modelo CTranslate2 convertido."""
+    def loader():
+        import whisperx
+        return whisperx.load_model(model_size, device, compute_type=compute_type, language=language,
+                                   download_root=snapshot_dir)
+    return _model_manager.preload(("whisperx", model_size, device, compute_type, language, snapshot_dir), loader)
+
+
+def preload_diarization(token, device):
+    """Empieza a cargar el pipeline de diarización de WhisperX."""
+    def loader():
+        import whisperx.diarize
+        return whisperx.diarize.DiarizationPipeline(use_auth_token=token, device=device)
+    return _model_manager.preload(("diarization", device, token), loader)
+
+
+def preload_align(language, device):
+    """Empieza a cargar el modelo de alineamiento de WhisperX (marcas de tiempo por palabra) de un idioma."""
+    def loader():
+        import whisperx
+        return whisperx.load_align_model(language_code=language, device=device)
+    return _model_manager.preload(("align", language, device), loader)
@@ -0,0 +1,263 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from capture import audio_chunks, start_ffmpeg, stop_process
+from streaming import AudioChunk
+from resolver import get_resolver
+from correccion import corregir_textos
+from utils import get_audio_stream_info, load_correct_words, setup_logging
+from vad import VAD_BACKENDS, VADSegmenter, log_vad_stats
+
+logger = logging.getLogger(__name__)
+
+# Memoria aproximada (MB) de cada proceso con su copia del modelo en float32, incluida la inferencia
+MODEL_MEMORY_MB = {"tiny": 400, "base": 600, "small": 1500, "medium": 4000, "large": 7500}
+
+# Procesos por defecto sin --model-dir: cada uno carga su propia copia completa del modelo
+MAX_WORKERS_WITHOUT_SNAPSHOT = 4
+
+# Backend de cada proceso del pool; se carga una vez en _init_process
+_backend = None
+_language = None
+
+
+def _init_process(model_size, language, threads, model_dir=None, backend="whisper"):
+    """Inicializa un proceso del pool: reparte los hilos de torch y carga su copia del modelo."""
+    global _backend, _language
+    # Imports pesados solo en los procesos que transcriben; el proceso principal no los necesita
+    import torch
+    from inference import get_inference_backend
+
+    torch.set_num_threads(threads)
+    # Con una instantánea, todos los procesos mapean el mismo fichero y comparten sus páginas
+    _backend = get_inference_backend(backend, model_size, model_dir=model_dir)
+    _language = language
+
+
+def _uses_cuda(backend):
+    """Si los procesos del pool van a cargar el modelo en la GPU."""
+    if backend == "int8":  # Solo CPU
+        return False
+    # Import diferido: solo para decidir el número de procesos
+    import torch
+    return torch.cuda.is_available()
+
+
+def _available_memory_mb():
+    """Memoria física libre en MB, o None si el sistema no la expone."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_workers(model_size, model_dir=None, backend="whisper"):
+    """Número de procesos cuando no se indica --workers.
+
+    Cada proceso carga su propio modelo. Con CUDA todos lo pondrían en la misma GPU, así
+    que se usa uno solo. En CPU, sin `model_dir` cada proceso tiene una copia completa
+    en memoria: como mucho MAX_WORKERS_WITHOUT_SNAPSHOT y los que quepan en la RAM libre.
+    Con `model_dir` todos mapean la misma instantánea y basta uno por núcleo.
+    """
+    if _uses_cuda(backend):
+        return 1
+    workers = os.cpu_count() or 1
+    if not model_dir:
+        workers = min(workers, MAX_WORKERS_WITHOUT_SNAPSHOT)
+        available = _available_memory_mb()
+        if available:
+            workers = min(workers, max(1, int(0.8 * available // MODEL_MEMORY_MB.get(model_size, 7500))))
+    return workers
+
+
+def _transcribe_segment(audio):
+    """Transcribe un segmento de voz. Devuelve ([(inicio, fin, texto)] relativos al segmento, segundos de cómputo)."""
+    started = time.perf_counter()
+    result = _backend.transcribe([AudioChunk(0.0, audio)], _language)[0]
+    segments = [(segment["start"], segment["end"], segment["text"]) for segment in result["segments"]]
+    return segments, time.perf_counter() - started
+
+
+def format_timestamp(seconds):
+    """Convierte segundos de audio en HH:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def read_url_list(path):
+    """Lee un fichero con una URL por línea (se ignoran las líneas vacías y los comentarios #)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def output_name(info, index):
+    """Nombre del fichero de transcripción de un vídeo a partir de su id de YouTube."""
+    video_id = info.get("id") or f"video-{index}"
+    return re.sub(r"[^\w\-]", "_", video_id) + ".txt"
+
+
+def transcribe_vod(youtube_url, index, pool, in_flight, output_dir, chunk_size=30, vad="energy",
+                   vad_min_silence=0.5, datos_correccion=None):
+    """Transcribe un vídeo completo repartiendo sus segmentos de voz entre los procesos del pool.
+
+    El audio se corta en las pausas con el VAD y cada segmento conserva su inicio en el vídeo,
+    así que la transcripción se une en orden con marcas de tiempo del propio vídeo.
+    """
+    info = get_audio_stream_info(youtube_url)
+    if info.get("is_live"):
+        raise ValueError("es un directo; usar transcriptor-whisper.py")
+
+    tag = f"Offline {info.get('id', index)}"
+    started = time.monotonic()
+    process = start_ffmpeg(info["url"])
+    futures = []
+    duration = 0.0
+    compute = 0.0
+    try:
+        chunks, splitter = audio_chunks(process.stdout, chunk_size, vad=vad, vad_min_silence=vad_min_silence)
+        for chunk in chunks:
+            # Limitar los segmentos en vuelo para no acumular en memoria el audio de todo el vídeo
+            in_flight.acquire()
+            try:
+                future = pool.submit(_transcribe_segment, chunk.audio)
+            except BaseException:
+                in_flight.release()  # p. ej. el pool se ha roto al cargar el modelo
+                raise
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append((chunk.start, future))
+            duration = max(duration, chunk.end)
+        if isinstance(splitter, VADSegmenter):
+            log_vad_stats(splitter)
+            duration = splitter.total_seconds
+    finally:
+        stop_process(process, tag)
+
+    timestamps, texts = [], []
+    for start, future in futures:
+        segments, seconds = future.result()
+        compute += seconds
+        for segment_start, _, text in segments:
+            if text.strip():
+                timestamps.append(format_timestamp(start + segment_start))
+                texts.append(text.strip())
+    if datos_correccion:
+        # Todo el vídeo en un lote: cada palabra distinta se busca una sola vez
+        texts = corregir_textos(texts, datos_correccion, umbral=0.7)
+    lines = [f"[{timestamp}]: {text}" for timestamp, text in zip(timestamps, texts)]
+
+    output_file = os.path.join(output_dir, output_name(info, index))
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + ("\n" if lines else ""))
+
+    elapsed = time.monotonic() - started
+    speed = duration / elapsed if elapsed else 0.0
+    rtf = compute / duration if duration else 0.0
+    logger.info(f"[{tag}] {len(futures)} segmentos, {duration:.0f} s de audio en {elapsed:.0f} s "
+                f"({speed:.1f}x tiempo real, RTF por proceso {rtf:.2f}) -> {output_file}")
+    return output_file
+
+
+def transcribe_vods(urls, model_size="small", language=None, output_dir="transcripciones", workers=None,
+                    concurrency=2, chunk_size=30, vad="energy", vad_min_silence=0.5, correct_words=None,
+                    model_dir=None, backend="whisper"):
+    """Transcribe una lista de vídeos con un pool de procesos compartido.
+
+    `workers` procesos (ver default_workers) cargan el modelo una vez cada uno y
+    transcriben segmentos de cualquier vídeo; `concurrency` vídeos se decodifican a la vez
+    para que el pool siempre tenga trabajo. Devuelve {url: fichero de salida o None si falló}.
+    """
+    workers = workers or default_workers(model_size, model_dir, backend)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(output_dir, exist_ok=True)
+    datos_correccion = load_correct_words(correct_words) if correct_words else None
+    in_flight = threading.BoundedSemaphore(2 * workers)
+
+    # Resolver todas las URLs a la vez al principio: cada vídeo la encuentra ya en la caché
+    logger.info(f"[Offline] {workers} procesos de transcripción, {concurrency} vídeos a la vez.")
+
+    remote = [url for url in urls if not os.path.isfile(url)]
+    if remote:
+        started = time.monotonic()
+        get_resolver().resolve_many(remote)
+        logger.info(f"[Offline] {len(remote)} URLs resueltas en {time.monotonic() - started:.1f} s.")
+
+    # spawn: los procesos no heredan los hilos de decodificación del proceso principal
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_process,
+                             initargs=(model_size, language, threads, model_dir, backend)) as pool, \
+            ThreadPoolExecutor(concurrency, thread_name_prefix="vod") as downloads:
+        jobs = {
+            url: downloads.submit(transcribe_vod, url, index, pool, in_flight, output_dir,
+                                  chunk_size, vad, vad_min_silence, datos_correccion)
+            for index, url in enumerate(urls)
+        }
+        for url, job in jobs.items():
+            try:
+                results[url] = job.result()
+            except Exception as e:
+                logger.error(f"[Offline] Error transcribiendo {url}: {e}")
+                results[url] = None
+    return results
+
+
+def main(argv=None, prog=None):
+    """Punto de entrada de la línea de comandos (también `cli.py offline`)."""
+    from inference import INFERENCE_BACKENDS  # Solo para validar --backend
+
+    parser = argparse.ArgumentParser(prog=prog, description='Transcribe vídeos de YouTube (no en directo) en paralelo.')
+    parser.add_argument('--url', type=str, nargs='+', default=[],
+                        help='URL de uno o varios vídeos de YouTube a transcribir')
+    parser.add_argument('--url-file', type=str, default=None,
+                        help='Fichero con una URL por línea')
+    parser.add_argument('--model', type=str, default="small", choices=["tiny", "base", "small", "medium", "large"],
+                        help='Tamaño del modelo de Whisper a utilizar')
+    parser.add_argument('--language', type=str, default=None,
+                        help='Código de idioma para la transcripción (ej: es, en, fr)')
+    parser.add_argument('--backend', type=str, default="whisper", choices=sorted(INFERENCE_BACKENDS),
+                        help='Motor de inferencia: whisper (float32), int8 (cuantizado, CPU) o ctranslate2 (faster-whisper)')
+    parser.add_argument('--model-dir', type=str, default=None,
+                        help='Directorio donde guardar una instantánea local del modelo para arrancar más rápido')
+    parser.add_argument('--output-dir', type=str, default="transcripciones",
+                        help='Directorio donde se guarda la transcripción de cada vídeo')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Número de procesos de transcripción; cada uno carga su copia del modelo (predeterminado: 1 con GPU; '
+                             'en CPU uno por núcleo con --model-dir, si no como mucho 4 y los que quepan en la RAM)')
+    parser.add_argument('--concurrency', type=int, default=2,
+                        help='Número de vídeos que se descargan y segmentan a la vez')
+    parser.add_argument('--chunk-size', type=float, default=30,
+                        help='Duración máxima en segundos de cada segmento de voz')
+    parser.add_argument('--vad', type=str, default="energy", choices=sorted(VAD_BACKENDS),
+                        help='Detector de voz con el que se corta el audio en las pausas')
+    parser.add_argument('--vad-min-silence', type=float, default=0.5,
+                        help='Segundos de silencio que cierran un segmento de voz')
+    parser.add_argument('--correct-words', type=str, default=None,
+                        help='Archivo JSON con palabras correctas para corrección de transcripciones')
+    parser.add_argument('--debug', action='store_true',
+                        help='Activar modo debug')
+
+    args = parser.parse_args(argv)
+    setup_logging(args.debug)
+
+    urls = args.url + (read_url_list(args.url_file) if args.url_file else [])
+    if not urls:
+        parser.error("Indica al menos una URL con --url o --url-file")
+
+    logger.info(f"Transcribiendo {len(urls)} vídeos con el modelo {args.model}")
+    results = transcribe_vods(urls, args.model, args.language, args.output_dir, args.workers, args.concurrency,
+                              args.chunk_size, args.vad, args.vad_min_silence, args.correct_words, args.model_dir,
+                              args.backend)
+    failed = [url for url, output in results.items() if output is None]
+    logger.info(f"[Offline] {len(urls) - len(failed)} de {len(urls)} vídeos transcritos.")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+from models import smaller_model
+
+logger = logging.getLogger(__name__)
+
+# Políticas de sobrecarga de la cola de audio
+OVERLOAD_POLICIES = ("block", "drop-oldest", "skip-silence", "downgrade", "stride")
+
+# Políticas que reducen la carga en lugar de descartar audio
+ADAPTIVE_POLICIES = ("downgrade", "stride")
+
+
+def chunk_level_db(chunk):
+    """Nivel RMS del chunk en dBFS."""
+    audio = chunk.audio
+    if not len(audio):
+        return -np.inf
+    return 10 * np.log10(float(np.mean(audio * audio)) + 1e-12)
+
+
+class OverloadQueue(queue.Queue):
+    """Cola acotada de AudioChunk que aplica una política cuando la transcripción no da abasto.
+
+    - block: la captura espera (FFmpeg deja de leer); no se pierde audio pero crece la latencia.
+    - drop-oldest: se descarta el chunk más antiguo de la cola.
+    - skip-silence: se descarta el chunk más silencioso si está por debajo de `silence_db`;
+      si todos tienen voz, el más antiguo.
+    - downgrade / stride: se llama a `adapt()` (modelo más pequeño o stride mayor) como mucho
+      una vez cada `cooldown` segundos y mientras tanto la captura espera; cuando ya no se
+      puede reducir más la carga, se descarta el chunk más antiguo.
+
+    Cada decisión se registra en el log y en las métricas. Con `maxsize` 0 la cola no tiene límite.
+    """
+
+    def __init__(self, maxsize=0, policy="block", shutdown_event=None, adapt=None, silence_db=-45.0,
+                 cooldown=30.0, tag="Sobrecarga", labels=None):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Política de sobrecarga desconocida: {policy}. Disponibles: {', '.join(OVERLOAD_POLICIES)}")
+        super().__init__(maxsize)
+        self.policy = policy
+        self.shutdown_event = shutdown_event or threading.Event()
+        self.adapt = adapt
+        self.silence_db = silence_db
+        self.cooldown = cooldown
+        self.tag = tag
+        self.labels = labels or {}
+        self._last_adapt = -float("inf")
+        self._exhausted = False
+        self._source = None  # Divisor cuyo widen() usa la política stride
+
+        self.dropped = REGISTRY.counter("dropped_chunks_total", "Chunks capturados que no llegaron a transcribirse",
+                                        **self.labels)
+        self.blocked_seconds = REGISTRY.counter("overload_blocked_seconds_total",
+                                                "Segundos que la captura ha esperado con la cola llena", **self.labels)
+
+    def attach_source(self, splitter):
+        """Con la política stride, `adapt` alarga las ventanas del chunker (o los segmentos del VAD).
+
+        La captura la vuelve a llamar en cada reconexión con el divisor nuevo.
+        """
+        if self.policy == "stride" and (self.adapt is None or self._source is not None):
+            self._source = splitter
+            self.adapt = splitter.widen
+            self._exhausted = False
+
+    def put(self, item, block=True, timeout=None):
+        if not self.maxsize or not block:
+            return super().put(item, block, timeout)
+        try:
+            return super().put(item, block=False)
+        except queue.Full:
+            pass
+
+        if self.policy in ("drop-oldest", "skip-silence"):
+            if self._make_room(item) is not item:
+                super().put(item, block=False)
+            return
+
+        waited = time.monotonic()
+        if self.policy == "block":
+            logger.warning(f"[{self.tag}] Cola de audio llena ({self.maxsize} chunks): la captura espera.")
+        while not self.shutdown_event.is_set():
+            if self.policy in ADAPTIVE_POLICIES:
+                self._maybe_adapt()
+                if self._exhausted:
+                    self._make_room(item)
+            try:
+                super().put(item, timeout=1.0)
+                break
+            except queue.Full:
+                continue
+        else:
+            if item is not None:
+                self._record_drop(item, "cierre")
+
+        waited = time.monotonic() - waited
+        self.blocked_seconds.inc(waited)
+        if self.policy == "block":
+            logger.info(f"[{self.tag}] La captura ha esperado {waited:.1f} s a la transcripción.")
+
+    def _maybe_adapt(self):
+        """Pide reducir la carga si ha pasado el tiempo de enfriamiento desde el último cambio."""
+        now = time.monotonic()
+        if self._exhausted or now - self._last_adapt < self.cooldown:
+            return
+        self._last_adapt = now
+        action = self.adapt() if self.adapt else None
+        if action:
+            REGISTRY.counter("overload_adaptations_total", "Cambios hechos para reducir la carga",
+                             policy=self.policy, **self.labels).inc()
+            logger.warning(f"[{self.tag}] Cola de audio llena ({self.maxsize} chunks): {action}.")
+        else:
+            self._exhausted = True
+            logger.warning(f"[{self.tag}] No se puede reducir más la carga con la política {self.policy}; "
+                           f"se descartarán los chunks más antiguos.")
+
+    def _make_room(self, item):
+        """Descarta un chunk según la política. Devuelve el descartado (puede ser `item`) o None."""
+        with self.mutex:
+            candidates = [(i, chunk) for i, chunk in enumerate(self.queue) if chunk is not None]
+            if item is not None:
+                candidates.append((None, item))
+            if not candidates:
+                return None
+
+            index, victim = candidates[0]
+            reason = "el más antiguo"
+            if self.policy == "skip-silence":
+                levels = [chunk_level_db(chunk) for _, chunk in candidates]
+                quietest = int(np.argmin(levels))
+                if levels[quietest] < self.silence_db:
+                    index, victim = candidates[quietest]
+                    reason = f"silencio, {levels[quietest]:.0f} dBFS"
+
+            if index is not None:
+                del self.queue[index]
+                self.unfinished_tasks -= 1
+        self._record_drop(victim, reason)
+        return victim
+
+    def _record_drop(self, chunk, reason):
+        self.dropped.inc()
+        logger.warning(f"[{self.tag}] Cola de audio llena: descartado el chunk {chunk.start:.1f}-{chunk.end:.1f} s "
+                       f"({reason}).")
+
+
+class ModelDowngrader:
+    """Acción de la política downgrade: carga en segundo plano el modelo inmediatamente más
+    pequeño y lo cambia en el pool de inferencia cuando está listo."""
+
+    def __init__(self, pool, backend, model_size, model_dir=None, tag="Sobrecarga"):
+        self.pool = pool
+        self.backend = backend
+        self.model_size = model_size
+        self.model_dir = model_dir
+        self.tag = tag
+
+    def __call__(self):
+        from inference import preload_inference_backend
+
+        smaller = smaller_model(self.model_size)
+        if smaller is None:
+            return None
+        self.model_size = smaller
+        preload_inference_backend(self.backend, smaller, model_dir=self.model_dir).add_done_callback(
+            lambda future: self._switch(smaller, future))
+        return f"cargando el modelo {smaller} para sustituir al actual"
+
+    def _switch(self, model_size, future):
+        try:
+            engine = future.result()
+        except Exception as e:
+            logger.error(f"[{self.tag}] No se pudo cargar el modelo {model_size}: {e}")
+            return
+        self.pool.set_backend(engine)
+        logger.warning(f"[{self.tag}] Transcribiendo con el modelo {model_size}.")
@@ -0,0 +1,165 @@
+import logging
+import re
+
+import numpy as np
+
+from inference import PROMPT_CHARS
+from sinks import Caption, segment_words
+from streaming import AudioChunk, SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Palabras ya confirmadas que pueden volver a aparecer al principio de una nueva hipótesis
+MAX_REPEATED_NGRAM = 5
+
+# Margen en segundos al descartar de una hipótesis las palabras anteriores a lo ya confirmado
+COMMIT_TOLERANCE = 0.1
+
+_PUNTUACION = re.compile(r"[^\w]+")
+
+
+def _key(word):
+    """Forma de comparar palabras entre hipótesis: sin mayúsculas ni puntuación."""
+    return _PUNTUACION.sub("", word.lower())
+
+
+class LocalAgreement:
+    """Política de confirmación por acuerdo local entre decodificaciones consecutivas.
+
+    Una palabra pasa a ser definitiva cuando dos hipótesis seguidas sobre el mismo audio
+    coinciden en ella (y en todas las anteriores); el resto es provisional y puede cambiar.
+    """
+
+    def __init__(self):
+        self.committed_until = 0.0   # Fin de la última palabra confirmada
+        self._committed = []         # Últimas palabras confirmadas, para quitar repeticiones
+        self._previous = []          # Parte provisional de la hipótesis anterior
+
+    def insert(self, words):
+        """Añade una nueva hipótesis (palabras con tiempos absolutos). Devuelve las palabras confirmadas."""
+        words = [word for word in words if word[0] > self.committed_until - COMMIT_TOLERANCE]
+        words = self._drop_repeated(words)
+
+        committed = []
+        for new, old in zip(words, self._previous):
+            if _key(new[2]) != _key(old[2]):
+                break
+            committed.append(new)
+        self._previous = words[len(committed):]
+        if committed:
+            self.committed_until = committed[-1][1]
+            self._committed = (self._committed + committed)[-MAX_REPEATED_NGRAM:]
+        return committed
+
+    def pending(self):
+        """Palabras provisionales de la última hipótesis."""
+        return list(self._previous)
+
+    def flush(self):
+        """Confirma todo lo pendiente (fin del stream o audio que ya no se puede revisar)."""
+        words, self._previous = self._previous, []
+        if words:
+            self.committed_until = words[-1][1]
+            self._committed = (self._committed + words)[-MAX_REPEATED_NGRAM:]
+        return words
+
+    def _drop_repeated(self, words):
+        """Quita del principio de la hipótesis las palabras que repiten el final de lo confirmado."""
+        if not words or not self._committed or abs(words[0][0] - self.committed_until) > 1:
+            return words
+        committed = [_key(word[2]) for word in self._committed]
+        for n in range(min(len(committed), len(words)), 0, -1):
+            if committed[-n:] == [_key(word[2]) for word in words[:n]]:
+                return words[n:]
+        return words
+
+
+class PartialTranscriber:
+    """Transcribe el audio a medida que llega y emite resultados provisionales cada `interval` segundos.
+
+    El audio sin confirmar se vuelve a decodificar entero en cada paso, así que el texto
+    provisional se revisa con más contexto; LocalAgreement decide cuándo es definitivo.
+    `on_event(caption)` recibe Caption provisionales (final=False, sustituyen a la anterior)
+    y definitivas (en orden). El buffer se recorta tras lo confirmado y, si en
+    `max_buffer` segundos no se confirma nada, se da por definitivo lo que haya; si no
+    hay nada (silencio, música), se descarta el audio más antiguo que `max_buffer`.
+    `prompt` es el contexto inicial (p. ej. el de un checkpoint al reanudar).
+    """
+
+    def __init__(self, backend, language=None, interval=1.0, max_buffer=15.0, use_context=True, on_event=None,
+                 prompt=""):
+        self.backend = backend
+        self.language = language
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.use_context = use_context
+        self.on_event = on_event
+
+        self.agreement = LocalAgreement()
+        self._audio = np.empty(0, dtype=np.float32)
+        self._buffer_start = 0.0     # Segundo del stream en el que empieza el buffer
+        self._undecoded = 0.0        # Segundos recibidos desde la última decodificación
+        self._last_chunk = None
+        self._last_partial = None
+        self._prompt = prompt[-PROMPT_CHARS:]
+
+    def push(self, chunk):
+        """Añade un chunk de audio consecutivo; decodifica si ya ha llegado `interval` de audio nuevo."""
+        if not len(self._audio):
+            self._buffer_start = chunk.start
+        self._audio = np.concatenate((self._audio, chunk.audio))
+        self._undecoded += chunk.duration
+        self._last_chunk = chunk
+        if self._undecoded >= self.interval:
+            self._decode()
+
+    def finish(self):
+        """Decodifica lo que quede y confirma todo el texto pendiente."""
+        if self._undecoded:
+            self._decode()
+        self._emit_final(self.agreement.flush())
+        self._emit_partial([])
+
+    def _decode(self):
+        self._undecoded = 0.0
+        buffer = AudioChunk(self._buffer_start, self._audio)
+        prompt = self._prompt if self.use_context and self._prompt else None
+        result = self.backend.transcribe([buffer], self.language, prompt)[0]
+
+        self._emit_final(self.agreement.insert(segment_words(result["segments"], self._buffer_start)))
+        if buffer.duration >= self.max_buffer and self.agreement.committed_until <= self._buffer_start:
+            logger.debug(f"[Parciales] {buffer.duration:.1f} s sin acuerdo; se confirma la hipótesis actual.")
+            self._emit_final(self.agreement.flush())
+            if self.agreement.committed_until <= self._buffer_start:
+                # Silencio o música: no hay nada que confirmar, se descarta el audio más antiguo
+                self._trim(buffer.end - self.max_buffer)
+        self._emit_partial(self.agreement.pending())
+        self._trim(self.agreement.committed_until)
+
+    def _trim(self, until):
+        """Descarta del buffer el audio anterior al segundo `until` del stream (p. ej. el ya confirmado)."""
+        cut = until - self._buffer_start
+        if cut <= 0:
+            return
+        samples = min(len(self._audio), int(cut * SAMPLE_RATE))
+        self._audio = self._audio[samples:]
+        self._buffer_start += samples / SAMPLE_RATE
+
+    def _emit_final(self, words):
+        if not words:
+            return
+        text = " ".join(word for _, _, word in words)
+        if self.use_context:
+            self._prompt = (self._prompt + " " + text)[-PROMPT_CHARS:]
+        if self.on_event:
+            self.on_event(Caption(text, words[0][0], words[-1][1], True, words,
+                                  captured_at=self._last_chunk.captured_at))
+
+    def _emit_partial(self, words):
+        text = " ".join(word for _, _, word in words)
+        if text == self._last_partial:
+            return
+        self._last_partial = text
+        if self.on_event:
+            start, end = (words[0][0], words[-1][1]) if words else (self.agreement.committed_until,) * 2
+            self.on_event(Caption(text, start, end, False, words, captured_at=self._last_chunk.captured_at))
@@ -0,0 +1,172 @@
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Validez de una resolución cuya URL no indica cuándo caduca
+DEFAULT_TTL = 3600.0
+
+# Antes de caducar, una entrada se vuelve a resolver en segundo plano con este margen (segundos)
+REFRESH_MARGIN = 300.0
+
+# Resoluciones simultáneas (cada una es una petición a YouTube)
+MAX_WORKERS = 4
+
+# Las URLs de googlevideo llevan la caducidad como parámetro (?expire=) o en la ruta (/expire/<ts>/)
+_EXPIRE_PATH = re.compile(r"/expire/(\d+)")
+
+
+def url_expiry(url):
+    """Instante (time.time()) en que caduca una URL de googlevideo, o None si no lo indica."""
+    parsed = urlparse(url)
+    expire = parse_qs(parsed.query).get("expire")
+    if expire:
+        return float(expire[0])
+    match = _EXPIRE_PATH.search(parsed.path)
+    return float(match.group(1)) if match else None
+
+
+def ytdlp_extractor(options=None):
+    """Extractor por defecto: yt-dlp con una instancia de YoutubeDL por hilo (no es thread-safe)."""
+    import yt_dlp  # Import diferido: tarda en cargar y solo hace falta al resolver la primera URL
+
+    options = options or {'format': 'bestaudio/best', 'quiet': True}
+    local = threading.local()
+
+    def extract(url):
+        if not hasattr(local, "ydl"):
+            local.ydl = yt_dlp.YoutubeDL(options)
+        return local.ydl.extract_info(url, download=False)
+
+    return extract
+
+
+class _Entry:
+    def __init__(self, info, expires_at):
+        self.info = info
+        self.expires_at = expires_at
+
+
+class StreamResolver:
+    """Caché de resoluciones de URL de YouTube (la información de yt-dlp) con caducidad.
+
+    Cada entrada vale hasta que caduca la URL del stream que contiene (parámetro `expire` de
+    googlevideo) o `ttl` segundos si no lo indica, y se vuelve a resolver en segundo plano
+    cuando le quedan menos de `refresh_margin`. Dos peticiones a la vez de la misma URL
+    comparten la misma extracción. `extractor(url)` devuelve la información (p. ej. uno
+    falso en las pruebas) y `clock` el instante actual.
+    """
+
+    def __init__(self, extractor=None, ttl=DEFAULT_TTL, refresh_margin=REFRESH_MARGIN, max_workers=MAX_WORKERS,
+                 clock=time.time):
+        self.extractor = extractor or ytdlp_extractor()
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self._entries = {}
+        self._pending = {}   # URL -> Future de la extracción en curso
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="resolucion")
+        self.resolve_seconds = REGISTRY.summary("stream_resolve_seconds", "Tiempo de cada resolución de URL")
+
+    def resolve(self, url, refresh=False):
+        """Información del stream de `url`, de la caché si sigue vigente; con `refresh`, siempre nueva."""
+        return self._lookup(url, refresh).result()
+
+    def resolve_many(self, urls, refresh=False):
+        """Resuelve varias URLs en paralelo. Devuelve {url: información o la excepción que dio}."""
+        futures = {url: self._lookup(url, refresh) for url in dict.fromkeys(urls)}
+        results = {}
+        for url, future in futures.items():
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                logger.error(f"[Resolución] Error resolviendo {url}: {e}")
+                results[url] = e
+        return results
+
+    def invalidate(self, url):
+        with self._lock:
+            self._entries.pop(url, None)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _lookup(self, url, refresh):
+        """Future con la información: ya resuelto si la entrada está vigente."""
+        with self._lock:
+            entry = self._entries.get(url)
+            now = self.clock()
+            if entry and not refresh and now < entry.expires_at:
+                self._count("hit")
+                if entry.expires_at - now < self.refresh_margin and url not in self._pending:
+                    self._count("refresh")
+                    logger.debug(f"[Resolución] {url} caduca en {entry.expires_at - now:.0f} s; se renueva.")
+                    self._start(url)
+                future = Future()
+                future.set_result(entry.info)
+                return future
+            if url not in self._pending:
+                self._count("miss")
+                self._start(url)
+            return self._pending[url]
+
+    def _start(self, url):
+        self._pending[url] = self._executor.submit(self._extract, url)
+
+    def _extract(self, url):
+        started = time.perf_counter()
+        try:
+            info = self.extractor(url)
+        except Exception:
+            self._count("error")
+            with self._lock:
+                self._pending.pop(url, None)
+            raise
+        finally:
+            self.resolve_seconds.observe(time.perf_counter() - started)
+
+        now = self.clock()
+        expiries = [expiry for expiry in (url_expiry(info.get(key) or "") for key in ("url", "manifest_url"))
+                    if expiry is not None]
+        expires_at = min(expiries) if expiries else now + self.ttl
+        with self._lock:
+            self._entries[url] = _Entry(info, expires_at)
+            self._pending.pop(url, None)
+        logger.debug(f"[Resolución] {url} resuelta en {time.perf_counter() - started:.1f} s "
+                     f"(válida {expires_at - now:.0f} s).")
+        return info
+
+    def _count(self, result):
+        REGISTRY.counter("stream_resolutions_total", "Resoluciones de URL por resultado (hit, miss, refresh, error)",
+                         result=result).inc()
+
+
+# Resolución compartida por la captura, el transcriptor offline y WhisperX
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """Devuelve el resolvedor global (se crea con yt-dlp la primera vez)."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = StreamResolver()
+        return _resolver
+
+
+def configure_resolver(extractor=None, ttl=DEFAULT_TTL, refresh_margin=REFRESH_MARGIN, max_workers=MAX_WORKERS):
+    """Sustituye el resolvedor global (p. ej. con un extractor falso en las pruebas)."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is not None:
+            _resolver.close()
+        _resolver = StreamResolver(extractor, ttl, refresh_margin, max_workers)
+        return _resolver
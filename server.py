@@ -0,0 +1,483 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from capture import capture_stream
+from fingerprint import DEDUP_WAIT, DEDUP_WINDOW, SimulcastDedup
+from inference import PROMPT_CHARS, INFERENCE_BACKENDS, get_inference_backend
+from language import LanguageTracker
+from metrics import REGISTRY, start_metrics
+from overload import OVERLOAD_POLICIES, OverloadQueue
+from streaming import HypothesisDeduper
+from utils import load_correct_words, corregir_texto, setup_logging, configurar_cache_correcciones
+from vad import VAD_BACKENDS
+
+logger = logging.getLogger(__name__)
+
+
+# El modelo es compartido por todos los streams: uno no puede cambiarlo por sobrecarga
+SERVER_OVERLOAD_POLICIES = [policy for policy in OVERLOAD_POLICIES if policy != "downgrade"]
+
+
+class _StreamQueue(OverloadQueue):
+    """Cola acotada que avisa al planificador cada vez que llega un chunk."""
+
+    def __init__(self, on_put, maxsize=0, policy="block", shutdown_event=None, tag="Sobrecarga", labels=None):
+        super().__init__(maxsize, policy, shutdown_event, tag=tag, labels=labels)
+        self._on_put = on_put
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self._on_put()
+
+
+class FairScheduler:
+    """Reparte un único backend de inferencia entre todos los streams por turnos (round-robin).
+
+    Cada stream tiene como mucho un chunk en inferencia a la vez, así sus resultados
+    salen en orden y con el contexto del chunk anterior, y ningún stream acapara el modelo.
+    Con `dedup`, un stream cuyo siguiente chunk es audio que otro stream aún está
+    transcribiendo cede el turno hasta que esa transcripción se pueda reutilizar. Un stream
+    cuya salida no da abasto también cede el turno: su cola de audio se llena y aplica su
+    política de sobrecarga, sin que ningún hilo del planificador se quede esperando.
+    """
+
+    def __init__(self, backend, workers=1, dedup=None):
+        self.backend = backend
+        self.dedup = dedup
+        self._streams = []
+        self._turn = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        replicas = [backend] + [backend.replicate() for _ in range(workers - 1)]
+        self._threads = [
+            threading.Thread(target=self._worker, args=(replica,), name=f"planificador-{i}", daemon=True)
+            for i, replica in enumerate(replicas)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def register(self, pipeline):
+        with self._cond:
+            self._streams.append(pipeline)
+
+    def unregister(self, pipeline):
+        with self._cond:
+            if pipeline in self._streams:
+                self._streams.remove(pipeline)
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(5)
+
+    def _next_job(self):
+        """Devuelve el siguiente (pipeline, chunk) empezando por el stream al que le toca turno."""
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return None, None
+                candidates = []
+                for offset in range(len(self._streams)):
+                    idx = (self._turn + offset) % len(self._streams)
+                    pipeline = self._streams[idx]
+                    if not pipeline.busy and not pipeline.overloaded and not pipeline.audio_queue.empty():
+                        candidates.append((idx, pipeline, pipeline.audio_queue.queue[0]))
+                if not self.dedup and candidates:
+                    return self._claim(*candidates[0][:2])
+                if not candidates:
+                    self._cond.wait(timeout=1)
+                    continue
+
+            # La consulta al índice (SQLite) se hace sin el cerrojo que comparten todos los streams
+            waiting = True
+            for idx, pipeline, head in candidates:
+                if head is not None and self.dedup.pending(head):
+                    continue  # Otro stream está transcribiendo este mismo audio
+                waiting = False
+                with self._cond:
+                    # Mientras tanto otro worker puede haberlo cogido o la cola haber descartado el chunk
+                    queue = pipeline.audio_queue.queue
+                    if not self._stopped and not pipeline.busy and queue and queue[0] is head:
+                        return self._claim(idx, pipeline)
+            if waiting:
+                with self._cond:
+                    self._cond.wait(timeout=1)
+
+    def _claim(self, idx, pipeline):
+        """Saca el primer chunk del stream y le pasa el turno al siguiente (con `_cond` adquirido)."""
+        pipeline.busy = True
+        self._turn = idx + 1
+        return pipeline, pipeline.audio_queue.get_nowait()
+
+    def _worker(self, backend):
+        while True:
+            pipeline, chunk = self._next_job()
+            if pipeline is None:
+                break
+            try:
+                if chunk is None:
+                    pipeline.finish()
+                else:
+                    language = pipeline.languages.observe(chunk)
+                    if self.dedup:
+                        # El planificador ya ha dado tiempo al otro stream (ver _next_job)
+                        result = self.dedup.transcribe(backend, [chunk], language, pipeline.prompt)[0]
+                    else:
+                        result = backend.transcribe([chunk], language, pipeline.prompt)[0]
+                    pipeline.deliver(chunk, result)
+            except Exception as e:
+                logger.error(f"[Planificador] Error transcribiendo el stream {pipeline.stream_id}: {e}")
+                pipeline.shutdown_event.set()
+            finally:
+                with self._cond:
+                    pipeline.busy = False
+                    self._cond.notify()
+
+
+class StreamPipeline:
+    """Captura, corrección y salida de un stream, cada una en su hilo; la inferencia la hace el planificador compartido."""
+
+    def __init__(self, stream_id, youtube_url, scheduler, output_file, datos_correccion=None, language=None,
+                 chunk_size=10, overlap=0.0, vad=None, vad_min_silence=0.5, use_context=True, max_queue=20,
+                 overload_policy="block"):
+        self.stream_id = stream_id
+        self.youtube_url = youtube_url
+        self.output_file = output_file
+        self.languages = LanguageTracker(scheduler.backend, language, tag=f"Stream {stream_id}",
+                                         labels={"stream": stream_id})
+        self.use_context = use_context
+        self.busy = False
+
+        self.shutdown_event = threading.Event()
+        self.audio_queue = _StreamQueue(scheduler.notify, max_queue, overload_policy, self.shutdown_event,
+                                        tag=f"Stream {stream_id}", labels={"stream": stream_id})
+        # Sin límite para no bloquear al planificador: este deja de darle turnos al llegar a max_queue
+        self.text_queue = queue.Queue()
+        self.max_text = max_queue
+        self._text_overloaded = False
+        self.corrected_queue = queue.Queue(max_queue)
+
+        self._scheduler = scheduler
+        self._datos_correccion = datos_correccion
+        self._deduper = HypothesisDeduper(0.0 if vad else overlap)
+        self._prompt = ""
+        self._capture_args = (chunk_size, 0.0 if vad else overlap, vad, vad_min_silence, scheduler.dedup)
+        self._threads = []
+
+        REGISTRY.gauge("queue_depth", "Elementos pendientes en cada cola", function=self.audio_queue.qsize,
+                       queue="audio", stream=stream_id)
+        REGISTRY.gauge("queue_depth", "Elementos pendientes en cada cola", function=self.text_queue.qsize,
+                       queue="text", stream=stream_id)
+        REGISTRY.gauge("queue_depth", "Elementos pendientes en cada cola", function=self.corrected_queue.qsize,
+                       queue="corrected", stream=stream_id)
+        self._correction_seconds = REGISTRY.summary("correction_seconds", "Tiempo de corrección de cada texto",
+                                                    stream=stream_id)
+        self._latency_seconds = REGISTRY.summary("latency_seconds", "Latencia desde la captura del chunk hasta la salida",
+                                                 stream=stream_id)
+        self._dropped_chunks = self.audio_queue.dropped
+
+    @property
+    def overloaded(self):
+        """True si la salida lleva `max_queue` textos de retraso: el planificador no le da más chunks."""
+        return bool(self.max_text) and self.text_queue.qsize() >= self.max_text
+
+    @property
+    def prompt(self):
+        return self._prompt if self.use_context and self._prompt else None
+
+    def start(self):
+        self._scheduler.register(self)
+        chunk_size, overlap, vad, vad_min_silence, dedup = self._capture_args
+        self._threads = [
+            threading.Thread(target=capture_stream, daemon=True, name=f"captura-{self.stream_id}",
+                             args=(self.youtube_url, self.audio_queue, self.shutdown_event, chunk_size, overlap, vad,
+                                   vad_min_silence),
+                             kwargs={"tag": f"Stream {self.stream_id}", "labels": {"stream": self.stream_id},
+                                     "dedup": dedup}),
+            threading.Thread(target=self._correction_loop, daemon=True, name=f"correccion-{self.stream_id}"),
+            threading.Thread(target=self._output_loop, daemon=True, name=f"salida-{self.stream_id}"),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self.shutdown_event.set()
+        for thread in self._threads:
+            thread.join(5)
+        self._scheduler.unregister(self)
+        pending = sum(1 for chunk in list(self.audio_queue.queue) if chunk is not None)
+        if pending:
+            self._dropped_chunks.inc(pending)
+            logger.warning(f"[Stream {self.stream_id}] {pending} chunks pendientes descartados.")
+        self.languages.log_stats()
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def deliver(self, chunk, result):
+        """Recibe el resultado de un chunk (llamado desde el planificador)."""
+        segments = self._deduper.filter(result["segments"], chunk)
+        self.languages.feedback(segments)
+        text = "".join(segment["text"] for segment in segments)
+        if self.use_context and text.strip():
+            self._prompt = (self._prompt + text)[-PROMPT_CHARS:]
+        self._put_text((datetime.now().strftime("%H:%M:%S"), text, chunk.captured_at))
+
+    def finish(self):
+        """El stream ha terminado: la salida se cierra tras escribir lo pendiente."""
+        self._put_text((None, "", None))
+
+    def _put_text(self, item):
+        # Nunca bloquea (lo llama un hilo del planificador compartido); el límite lo aplica `overloaded`
+        self.text_queue.put(item)
+        if self.overloaded and not self._text_overloaded:
+            logger.warning(f"[Stream {self.stream_id}] La salida no da abasto ({self.text_queue.qsize()} textos "
+                           f"pendientes): se pausa su transcripción y la cola de audio aplica su política.")
+        self._text_overloaded = self.overloaded
+
+    def _correction_loop(self):
+        """Corrige los textos en su propio hilo, para que una corrección lenta no retrase la escritura."""
+        while not self.shutdown_event.is_set():
+            try:
+                timestamp, text, captured_at = self.text_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if self.max_text and self.text_queue.qsize() == self.max_text - 1:
+                self._scheduler.notify()  # Vuelve a tener sitio: el planificador puede darle turno
+            if timestamp is None:
+                self._put_corrected((None, "", None))
+                break
+
+            text = text.strip()
+            if self._datos_correccion and text:
+                started = time.perf_counter()
+                text = corregir_texto(text, self._datos_correccion, umbral=0.7)
+                self._correction_seconds.observe(time.perf_counter() - started)
+            self._put_corrected((timestamp, text, captured_at))
+
+    def _put_corrected(self, item):
+        # La corrección sí puede esperar a la salida: al llenarse text_queue, el planificador deja de darle turnos
+        while not self.shutdown_event.is_set():
+            try:
+                self.corrected_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _output_loop(self):
+        with open(self.output_file, "a", encoding="utf-8") as f:
+            while not self.shutdown_event.is_set():
+                try:
+                    timestamp, text, captured_at = self.corrected_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if timestamp is None:
+                    logger.info(f"[Stream {self.stream_id}] Salida finalizada normalmente.")
+                    break
+
+                if text:
+                    f.write(f"[{timestamp}]: {text}\n")
+                    f.flush()
+                if captured_at:
+                    self._latency_seconds.observe(time.monotonic() - captured_at)
+        self._scheduler.unregister(self)
+
+
+class TranscriptionServer:
+    """Servidor de larga duración que transcribe varios streams con un único backend cargado.
+
+    Se controla con una API de líneas JSON sobre TCP, por ejemplo:
+        {"cmd": "add", "url": "...", "id": "canal1", "language": "es"}
+        {"cmd": "remove", "id": "canal1"}
+        {"cmd": "list"}
+
+    Con `dedup` (":memory:" o un fichero compartido con otros transcriptores), el audio que
+    varios streams emiten a la vez se transcribe una sola vez (ver SimulcastDedup).
+    """
+
+    def __init__(self, backend, output_dir="transcripciones", correct_words=None, workers=1,
+                 cache_size=100000, cache_file=None, dedup=None, dedup_window=DEDUP_WINDOW, dedup_wait=DEDUP_WAIT,
+                 **stream_defaults):
+        self.output_dir = output_dir
+        self.cache = configurar_cache_correcciones(cache_size, cache_file)
+        self.stream_defaults = stream_defaults
+        self.dedup = SimulcastDedup(dedup, dedup_window, dedup_wait) if dedup else None
+        self.scheduler = FairScheduler(backend, workers, self.dedup)
+        self.datos_correccion = load_correct_words(correct_words) if correct_words else None
+        self.pipelines = {}
+        self._counter = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def add_stream(self, url, stream_id=None, language=None):
+        if stream_id is None:
+            self._counter += 1
+            stream_id = f"stream-{self._counter}"
+        if stream_id in self.pipelines and self.pipelines[stream_id].is_alive():
+            raise ValueError(f"Ya existe un stream con id {stream_id}")
+
+        options = dict(self.stream_defaults)
+        if language:
+            options["language"] = language
+        pipeline = StreamPipeline(stream_id, url, self.scheduler, os.path.join(self.output_dir, f"{stream_id}.txt"),
+                                  self.datos_correccion, **options)
+        pipeline.start()
+        self.pipelines[stream_id] = pipeline
+        logger.info(f"[Servidor] Stream {stream_id} añadido: {url}")
+        return stream_id
+
+    def remove_stream(self, stream_id):
+        pipeline = self.pipelines.pop(stream_id, None)
+        if pipeline is None:
+            raise ValueError(f"No existe el stream {stream_id}")
+        pipeline.stop()
+        REGISTRY.unregister(stream=stream_id)
+        logger.info(f"[Servidor] Stream {stream_id} eliminado.")
+
+    def list_streams(self):
+        return [
+            {"id": stream_id, "url": p.youtube_url, "alive": p.is_alive(),
+             "pending_chunks": p.audio_queue.qsize(), "output": p.output_file, "language": p.languages.stats()}
+            for stream_id, p in self.pipelines.items()
+        ]
+
+    async def _dispatch(self, request):
+        loop = asyncio.get_running_loop()
+        cmd = request.get("cmd")
+        if cmd == "add":
+            stream_id = self.add_stream(request["url"], request.get("id"), request.get("language"))
+            return {"ok": True, "id": stream_id}
+        if cmd == "remove":
+            # Parar un stream espera a sus hilos: no bloquear el bucle de eventos
+            await loop.run_in_executor(None, self.remove_stream, request["id"])
+            return {"ok": True}
+        if cmd == "list":
+            response = {"ok": True, "streams": self.list_streams(), "cache": self.cache.estadisticas()}
+            if self.dedup:
+                response["dedup"] = self.dedup.stats()
+            return response
+        raise ValueError(f"Comando desconocido: {cmd}")
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self._dispatch(json.loads(line))
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self._handle_client, host, port)
+        logger.info(f"[Servidor] Escuchando en {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        for stream_id in list(self.pipelines):
+            self.remove_stream(stream_id)
+        self.scheduler.stop()
+        self.scheduler.backend.log_stats()
+        if self.dedup:
+            self.dedup.log_stats(self.scheduler.backend.stats.real_time_factor)
+            self.dedup.close()
+        if self.datos_correccion:
+            self.cache.registrar_estadisticas(logger)
+        self.cache.cerrar()
+        logger.info("[Servidor] Cierre ordenado completado.")
+
+
+def main(argv=None, prog=None):
+    """Punto de entrada de la línea de comandos (también `cli.py server`)."""
+
+    parser = argparse.ArgumentParser(prog=prog, description='Servidor que transcribe varios streams de YouTube con un único modelo.')
+    parser.add_argument('--host', type=str, default="127.0.0.1",
+                        help='Dirección en la que escucha la API de control')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Puerto de la API de control')
+    parser.add_argument('--model', type=str, default="small", choices=["tiny", "base", "small", "medium", "large"],
+                        help='Tamaño del modelo de Whisper compartido por todos los streams')
+    parser.add_argument('--backend', type=str, default="whisper", choices=sorted(INFERENCE_BACKENDS),
+                        help='Motor de inferencia: whisper (float32), int8 (cuantizado, CPU) o ctranslate2 (faster-whisper)')
+    parser.add_argument('--model-dir', type=str, default=None,
+                        help='Directorio donde guardar una instantánea local del modelo para arrancar más rápido')
+    parser.add_argument('--language', type=str, default=None,
+                        help='Código de idioma por defecto para la transcripción (ej: es, en, fr)')
+    parser.add_argument('--output-dir', type=str, default="transcripciones",
+                        help='Directorio donde se guarda la transcripción de cada stream')
+    parser.add_argument('--chunk-size', type=float, default=10,
+                        help='Tamaño del fragmento de audio en segundos')
+    parser.add_argument('--overlap', type=float, default=0.0,
+                        help='Solapamiento en segundos entre fragmentos consecutivos')
+    parser.add_argument('--vad', type=str, default=None, choices=sorted(VAD_BACKENDS),
+                        help='Detector de voz para descartar el silencio antes de transcribir')
+    parser.add_argument('--vad-min-silence', type=float, default=0.5,
+                        help='Segundos de silencio que cierran un segmento de voz')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Número de hilos de inferencia que comparten el modelo')
+    parser.add_argument('--max-queue', type=int, default=20,
+                        help='Número máximo de chunks en las colas de cada stream (0 sin límite)')
+    parser.add_argument('--overload-policy', type=str, default="block", choices=SERVER_OVERLOAD_POLICIES,
+                        help='Qué hacer con la cola de audio de un stream llena: block (esperar), drop-oldest, '
+                             'skip-silence o stride (ventanas más largas)')
+    parser.add_argument('--dedup', type=str, nargs='?', const=":memory:", default=None,
+                        help='Transcribir una sola vez el audio que varios streams emiten a la vez (simulcast); '
+                             'con un fichero SQLite, también con transcriptores de otros procesos')
+    parser.add_argument('--dedup-window', type=float, default=DEDUP_WINDOW,
+                        help='Segundos de audio de los otros streams con los que se compara cada chunk')
+    parser.add_argument('--dedup-wait', type=float, default=DEDUP_WAIT,
+                        help='Segundos como mucho que un chunk espera a que otro stream transcriba el mismo audio')
+    parser.add_argument('--correct-words', type=str, default=None,
+                        help='Archivo JSON con palabras correctas para corrección de transcripciones')
+    parser.add_argument('--cache-size', type=int, default=100000,
+                        help='Número máximo de palabras en la caché de correcciones')
+    parser.add_argument('--cache-file', type=str, default=None,
+                        help='Fichero SQLite donde persistir la caché de correcciones entre ejecuciones')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Puerto en el que exportar las métricas en formato Prometheus (/metrics)')
+    parser.add_argument('--metrics-host', type=str, default='127.0.0.1',
+                        help='Dirección en la que escuchar las métricas (0.0.0.0 para exponerlas fuera de la máquina)')
+    parser.add_argument('--metrics-interval', type=float, default=60,
+                        help='Segundos entre las líneas de métricas del log (0 para desactivarlas)')
+    parser.add_argument('--debug', action='store_true',
+                        help='Activar modo debug')
+
+    args = parser.parse_args(argv)
+    setup_logging(args.debug)
+
+    logger.info(f"Cargando modelo compartido: {args.model} (backend {args.backend})")
+    backend = get_inference_backend(args.backend, args.model, model_dir=args.model_dir)
+    server = TranscriptionServer(backend, args.output_dir, args.correct_words, args.workers,
+                                 args.cache_size, args.cache_file, args.dedup, args.dedup_window, args.dedup_wait,
+                                 language=args.language, chunk_size=args.chunk_size,
+                                 overlap=args.overlap, vad=args.vad, vad_min_silence=args.vad_min_silence,
+                                 max_queue=args.max_queue, overload_policy=args.overload_policy)
+    _, metrics_reporter = start_metrics(args.metrics_port, args.metrics_interval, args.metrics_host)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("[Servidor] Interrupción detectada.")
+    finally:
+        server.shutdown()
+        if metrics_reporter:
+            metrics_reporter.stop()
+
+
+if __name__ == "__main__":
+    main()
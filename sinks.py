@@ -0,0 +1,434 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Eventos que se acumulan antes de escribirlos en los destinos, y espera máxima para escribirlos
+BATCH_SIZE = 32
+FLUSH_INTERVAL = 1.0
+
+# Duración y longitud máximas de un subtítulo SRT/WebVTT
+CUE_SECONDS = 6.0
+CUE_CHARS = 84
+
+# Eventos pendientes por espectador conectado; si no los lee a tiempo, se le descartan los más antiguos
+CLIENT_BUFFER = 256
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+@dataclass
+class Caption:
+    """Texto transcrito con tiempos del medio (segundos desde el inicio del audio capturado)."""
+    text: str
+    start: float
+    end: float
+    final: bool = True
+    words: list = field(default_factory=list)   # [(inicio, fin, palabra)] en tiempo del medio
+    speaker: str = None
+    timestamp: str = None     # Hora del reloj (HH:MM:SS) en que se transcribió
+    captured_at: float = 0.0  # time.monotonic() al salir de la captura (para medir la latencia)
+
+    def to_dict(self):
+        data = {"type": "final" if self.final else "partial", "start": round(self.start, 3),
+                "end": round(self.end, 3), "text": self.text, "timestamp": self.timestamp,
+                "words": [{"start": round(start, 3), "end": round(end, 3), "word": word}
+                          for start, end, word in self.words]}
+        if self.speaker:
+            data["speaker"] = self.speaker
+        return data
+
+
+def segment_words(segments, offset=0.0):
+    """Palabras (inicio, fin, palabra) de los segmentos de un backend, con tiempos del medio.
+
+    Usa las marcas por palabra si el backend las da (Whisper con word_timestamps, WhisperX);
+    si no, reparte el segmento entre sus palabras en proporción a su número de caracteres.
+    """
+    words = []
+    for segment in segments:
+        start, end = segment["start"], segment["end"]
+        if segment.get("words"):
+            for word in segment["words"]:
+                word_start = word.get("start", start)
+                words.append((offset + word_start, offset + word.get("end", word_start), word["word"].strip()))
+                start = word.get("end", start)
+            continue
+
+        tokens = segment["text"].split()
+        total = sum(len(token) for token in tokens)
+        position = 0
+        for token in tokens:
+            word_start = start + (end - start) * position / total
+            position += len(token)
+            words.append((offset + word_start, offset + start + (end - start) * position / total, token))
+    return words
+
+
+def format_timestamp(seconds, separator=","):
+    """HH:MM:SS,mmm (SRT) o HH:MM:SS.mmm (WebVTT)."""
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+class Sink:
+    """Destino de los subtítulos. `write` recibe cada Caption y `flush` se llama tras cada lote.
+
+    Los destinos que añaden a un fichero (`appends`, en `path`) se recortan al reanudar
+    desde un checkpoint a lo que habían escrito entonces.
+    """
+
+    appends = False
+
+    def write(self, caption):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class TextSink(Sink):
+    """Líneas `[HH:MM:SS]: texto` con la hora de transcripción, como la salida clásica."""
+
+    appends = True
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, caption):
+        if caption.final and caption.text.strip():
+            prefix = f"{caption.speaker}: " if caption.speaker else ""
+            self._file.write(f"[{caption.timestamp}]: {prefix}{caption.text}\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlSink(Sink):
+    """Un objeto JSON por línea con los tiempos del segmento y de cada palabra.
+
+    Con `partials`, también se escriben los resultados provisionales (tipo "partial").
+    """
+
+    appends = True
+
+    def __init__(self, path, partials=False):
+        self.partials = partials
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, caption):
+        if caption.final or self.partials:
+            self._file.write(json.dumps(caption.to_dict(), ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def split_cues(caption, max_seconds=CUE_SECONDS, max_chars=CUE_CHARS):
+    """Divide un texto largo en subtítulos de como mucho `max_seconds` y `max_chars`, cortando entre palabras."""
+    if not caption.words:
+        return [(caption.start, caption.end, caption.text.strip())]
+    cues, current = [], []
+    for word in caption.words:
+        if current and (word[1] - current[0][0] > max_seconds
+                        or sum(len(w[2]) + 1 for w in current) + len(word[2]) > max_chars):
+            cues.append(current)
+            current = []
+        current.append(word)
+    cues.append(current)
+    return [(cue[0][0], cue[-1][1], " ".join(word for _, _, word in cue)) for cue in cues]
+
+
+class SubtitleSink(Sink):
+    """Fichero SRT o WebVTT con los últimos `window` subtítulos (0: todos).
+
+    El fichero se reescribe entero de forma atómica en cada lote, así que un reproductor que
+    lo relea siempre encuentra un fichero completo.
+    """
+
+    def __init__(self, path, fmt="srt", window=200):
+        self.path = path
+        self.fmt = fmt
+        self._cues = deque(maxlen=window or None)
+        self._counter = 0
+        self._dirty = False
+
+    def write(self, caption):
+        if not caption.final or not caption.text.strip():
+            return
+        prefix = f"{caption.speaker}: " if caption.speaker else ""
+        for start, end, text in split_cues(caption):
+            self._counter += 1
+            self._cues.append((self._counter, start, max(end, start + 0.5), prefix + text))
+        self._dirty = True
+
+    def render(self):
+        separator = "," if self.fmt == "srt" else "."
+        blocks = ["WEBVTT\n"] if self.fmt == "vtt" else []
+        for number, start, end, text in self._cues:
+            timing = f"{format_timestamp(start, separator)} --> {format_timestamp(end, separator)}"
+            blocks.append(f"{number}\n{timing}\n{text}\n")
+        return "\n".join(blocks)
+
+    def flush(self):
+        if not self._dirty:
+            return
+        temporal = f"{self.path}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temporal, self.path)
+        self._dirty = False
+
+
+class _Viewer:
+    """Eventos pendientes de un espectador conectado."""
+
+    def __init__(self):
+        self.events = deque(maxlen=CLIENT_BUFFER)
+        self.ready = threading.Event()
+
+
+class BroadcastSink(Sink):
+    """Servidor HTTP local que reenvía cada subtítulo a todos los espectadores conectados.
+
+    - GET /events: Server-Sent Events (una línea `data: {json}` por evento)
+    - GET /ws: WebSocket; cada evento es un mensaje de texto con el mismo JSON
+
+    Cada espectador tiene su propia cola acotada: uno lento no frena la transcripción ni a los demás.
+    """
+
+    def __init__(self, port, host="127.0.0.1", partials=True):
+        self.partials = partials
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._pending = []
+
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/events":
+                    sink._serve_sse(self)
+                elif path == "/ws" and self.headers.get("Upgrade", "").lower() == "websocket":
+                    sink._serve_websocket(self)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                logger.debug(f"[Difusión] {self.address_string()} {format % args}")
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="difusion-http", daemon=True).start()
+        logger.info(f"[Difusión] Subtítulos en http://{host}:{port}/events (SSE) y ws://{host}:{port}/ws")
+
+    def write(self, caption):
+        if caption.final or self.partials:
+            self._pending.append(json.dumps(caption.to_dict(), ensure_ascii=False))
+
+    def flush(self):
+        events, self._pending = self._pending, []
+        if not events:
+            return
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            # Con la cola llena, un espectador lento pierde los eventos más antiguos
+            client.events.extend(events)
+            client.ready.set()
+
+    def close(self):
+        self.flush()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _register(self):
+        client = _Viewer()
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def _unregister(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def _events(self, client):
+        """Espera los eventos de un espectador; None cada 15 s sin eventos (para mantener viva la conexión)."""
+        while True:
+            if not client.ready.wait(15):
+                yield None
+                continue
+            client.ready.clear()
+            while client.events:
+                yield client.events.popleft()
+
+    def _serve_sse(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Access-Control-Allow-Origin", "*")
+        handler.end_headers()
+        client = self._register()
+        try:
+            for event in self._events(client):
+                handler.wfile.write(b": \n\n" if event is None else f"data: {event}\n\n".encode("utf-8"))
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            pass
+        finally:
+            self._unregister(client)
+            handler.close_connection = True
+
+    def _serve_websocket(self, handler):
+        key = handler.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()).decode()
+        handler.send_response(101)
+        handler.send_header("Upgrade", "websocket")
+        handler.send_header("Connection", "Upgrade")
+        handler.send_header("Sec-WebSocket-Accept", accept)
+        handler.end_headers()
+        client = self._register()
+        try:
+            for event in self._events(client):
+                # Solo se envía: un ping sin datos en los silencios, y si no, una trama de texto
+                handler.wfile.write(b"\x89\x00" if event is None else _websocket_frame(event.encode("utf-8")))
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            pass
+        finally:
+            self._unregister(client)
+            handler.close_connection = True
+
+
+def _websocket_frame(payload):
+    """Trama WebSocket de texto, sin máscara (servidor a cliente)."""
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x81, length])
+    elif length < 1 << 16:
+        header = bytes([0x81, 126]) + length.to_bytes(2, "big")
+    else:
+        header = bytes([0x81, 127]) + length.to_bytes(8, "big")
+    return header + payload
+
+
+def _port(target):
+    host, _, port = target.rpartition(":")
+    return {"port": int(port), "host": host or "127.0.0.1"}
+
+
+def _index_sink(target, stream=None):
+    from transcript_index import IndexSink  # Import diferido: transcript_index depende de sinks
+    return IndexSink(target, stream)
+
+
+# Tipos de destino para --sink tipo:destino
+SINKS = {
+    'text': lambda target, **context: TextSink(target),
+    'jsonl': lambda target, **context: JsonlSink(target),
+    'jsonl+partial': lambda target, **context: JsonlSink(target, partials=True),
+    'srt': lambda target, **context: SubtitleSink(target, "srt"),
+    'vtt': lambda target, **context: SubtitleSink(target, "vtt"),
+    'http': lambda target, **context: BroadcastSink(**_port(target)),
+    'index': lambda target, **context: _index_sink(target, context.get("stream")),
+}
+
+
+def register_sink(name, factory):
+    """Registra un tipo de destino. `factory(destino, **contexto)` debe devolver un Sink."""
+    SINKS[name] = factory
+
+
+def create_sink(spec, **context):
+    """Crea un destino a partir de `tipo:destino`, p. ej. `jsonl:salida.jsonl` o `http:8090`.
+
+    `context` son datos de la transcripción para los destinos que los usan (`stream`: la URL).
+    """
+    kind, separator, target = spec.partition(":")
+    if not separator or kind not in SINKS:
+        raise ValueError(f"Destino no válido: {spec}. Formato tipo:destino con tipo en {', '.join(SINKS)}")
+    return SINKS[kind](target, **context)
+
+
+class SinkWriter:
+    """Reparte los subtítulos entre varios destinos desde un hilo propio, por lotes.
+
+    `publish` solo encola, así que un destino lento no retrasa la salida por consola. Cada
+    lote (hasta BATCH_SIZE eventos o FLUSH_INTERVAL segundos) se escribe en todos los
+    destinos y después se vacían sus buffers; el fallo de uno no afecta a los demás.
+    """
+
+    def __init__(self, sinks, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="destinos", daemon=True)
+        self._thread.start()
+
+    def publish(self, caption):
+        self._queue.put(caption)
+
+    def close(self):
+        """Escribe lo pendiente y cierra los destinos."""
+        self._queue.put(None)
+        self._thread.join(10)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    caption = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if caption is None:
+                    stop = True
+                    break
+                batch.append(caption)
+            if batch or stop:
+                self._write(batch)
+
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.error(f"[Destinos] Error cerrando {type(sink).__name__}: {e}")
+
+    def _write(self, batch):
+        for sink in self.sinks:
+            try:
+                for caption in batch:
+                    sink.write(caption)
+                sink.flush()
+            except Exception as e:
+                logger.error(f"[Destinos] Error escribiendo en {type(sink).__name__}: {e}")
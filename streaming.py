@@ -0,0 +1,209 @@
+import numpy as np
+from dataclasses import dataclass
+
+# Whisper trabaja con audio mono a 16 kHz
+SAMPLE_RATE = 16000
+
+# Factor de conversión de PCM int16 a float32 en [-1, 1)
+_ESCALA_PCM = np.float32(1.0 / 32768.0)
+
+
+@dataclass
+class AudioChunk:
+    """Ventana de audio lista para transcribir."""
+    start: float            # Inicio de la ventana en segundos de stream
+    audio: np.ndarray       # Muestras float32 a 16 kHz
+    final: bool = False     # Última ventana del stream
+    captured_at: float = 0.0  # time.monotonic() al salir de la captura (para medir la latencia)
+    overlap: float = None     # Solapamiento previsto con la siguiente ventana (None: el del deduplicador)
+    fingerprint: object = None  # AudioFingerprint si se registró para reutilizar transcripciones (fingerprint.py)
+
+    @property
+    def duration(self):
+        return len(self.audio) / SAMPLE_RATE
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+
+class RingBuffer:
+    """Buffer circular preasignado de muestras float32.
+
+    Cada muestra se guarda dos veces (en i y en i + capacidad) para que cualquier
+    ventana de hasta `capacity` muestras sea un slice contiguo, sin concatenar.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(capacity * 2, dtype=np.float32)
+        self.total_written = 0  # Muestras escritas desde el inicio del stream
+
+    def write(self, pcm_int16):
+        """Convierte muestras int16 a float32 directamente sobre el buffer."""
+        n = len(pcm_int16)
+        if n > self.capacity:
+            # Solo se conservan las últimas `capacity` muestras
+            self.total_written += n - self.capacity
+            pcm_int16 = pcm_int16[-self.capacity:]
+            n = self.capacity
+
+        pos = self.total_written % self.capacity
+        first = min(n, self.capacity - pos)
+        self._store(pos, pcm_int16[:first])
+        if first < n:
+            self._store(0, pcm_int16[first:])
+        self.total_written += n
+
+    def _store(self, pos, pcm_int16):
+        end = pos + len(pcm_int16)
+        np.multiply(pcm_int16, _ESCALA_PCM, out=self._data[pos:end])
+        self._data[pos + self.capacity:end + self.capacity] = self._data[pos:end]
+
+    def window(self, start, length):
+        """Devuelve una vista de `length` muestras a partir de la muestra absoluta `start`."""
+        if start < self.total_written - self.capacity or start + length > self.total_written:
+            raise ValueError(f"Ventana [{start}, {start + length}) fuera del buffer")
+        idx = start % self.capacity
+        return self._data[idx:idx + length]
+
+
+class SlidingWindowChunker:
+    """Genera ventanas solapadas de audio a partir de un flujo PCM s16le mono.
+
+    Cada ventana dura `window_seconds` y empieza `window_seconds - overlap_seconds`
+    segundos después de la anterior (el stride). `widen()` aumenta el stride en
+    caliente, hasta ventanas de `max_window_seconds`, cuando la transcripción no da abasto.
+    """
+
+    # Por debajo de este solapamiento, widen() lo elimina del todo
+    MIN_OVERLAP_SECONDS = 0.25
+
+    def __init__(self, window_seconds, overlap_seconds=0.0, sample_rate=SAMPLE_RATE, max_window_seconds=None):
+        if window_seconds <= 0:
+            raise ValueError("El tamaño de la ventana debe ser positivo")
+        if not 0 <= overlap_seconds < window_seconds:
+            raise ValueError("El solapamiento debe estar en [0, tamaño de ventana)")
+
+        self.sample_rate = sample_rate
+        self.window_samples = int(round(window_seconds * sample_rate))
+        self.overlap_samples = int(round(overlap_seconds * sample_rate))
+        self.stride_samples = self.window_samples - self.overlap_samples
+        self.max_window_samples = max(self.window_samples, int(round((max_window_seconds or 0) * sample_rate)))
+        self._pending_resize = None
+
+        # Cabe una ventana completa más el stride que se lee antes de emitirla
+        self._ring = RingBuffer(2 * self.max_window_samples)
+        self._pcm = np.empty(self.max_window_samples, dtype=np.int16)  # Buffer de lectura reutilizable
+        self._next_start = 0        # Muestra en la que empieza la siguiente ventana
+        self._covered_until = 0     # Última muestra ya entregada en alguna ventana
+
+    def widen(self):
+        """Aumenta el stride: primero reduce el solapamiento a la mitad y, sin solapamiento, alarga la ventana.
+
+        Se aplica a partir de la siguiente ventana. Devuelve una descripción del cambio, o None
+        si ya no se puede aumentar más.
+        """
+        window, overlap = self.window_samples, self.overlap_samples
+        if self._pending_resize:
+            window, overlap = self._pending_resize
+        if overlap:
+            overlap = overlap // 2 if overlap // 2 >= self.MIN_OVERLAP_SECONDS * self.sample_rate else 0
+        elif window < self.max_window_samples:
+            window = min(self.max_window_samples, int(window * 1.5))
+        else:
+            return None
+        self._pending_resize = (window, overlap)
+        return (f"ventanas de {window / self.sample_rate:.1f} s con {overlap / self.sample_rate:.2f} s "
+                f"de solapamiento (stride {(window - overlap) / self.sample_rate:.1f} s)")
+
+    def _apply_resize(self, previous_start):
+        """Aplica el cambio pedido con widen() y calcula el inicio de la siguiente ventana."""
+        previous_window, previous_overlap = self.window_samples, self.overlap_samples
+        if self._pending_resize:
+            self.window_samples, self.overlap_samples = self._pending_resize
+            self.stride_samples = self.window_samples - self.overlap_samples
+            self._pending_resize = None
+        # La ventana anterior dejó sin confirmar la mitad de su solapamiento: la siguiente
+        # tiene que empezar como muy tarde ahí para no perder ese texto
+        return min(previous_start + self.stride_samples,
+                   previous_start + previous_window - previous_overlap // 2)
+
+    def _read_stride(self, stream):
+        """Lee hasta un stride de muestras del pipe sobre el buffer preasignado."""
+        view = memoryview(self._pcm[:self.stride_samples]).cast('B')
+        got = 0
+        while got < len(view):
+            n = stream.readinto(view[got:])
+            if not n:
+                break
+            got += n
+        return got // 2
+
+    def _make_chunk(self, start, length, final):
+        # Copia necesaria: la ventana viaja a otro hilo y el buffer se sobrescribe
+        audio = self._ring.window(start, length).copy()
+        self._covered_until = start + length
+        return AudioChunk(start / self.sample_rate, audio, final, overlap=self.overlap_samples / self.sample_rate)
+
+    def chunks(self, stream):
+        """Itera sobre las ventanas (AudioChunk) del stream hasta EOF."""
+        while True:
+            n = self._read_stride(stream)
+            if n:
+                self._ring.write(self._pcm[:n])
+
+            total = self._ring.total_written
+            eof = n < self.stride_samples
+
+            if total - self._next_start >= self.window_samples:
+                final = eof and self._next_start + self.window_samples == total
+                yield self._make_chunk(self._next_start, self.window_samples, final)
+                if final:
+                    return
+                self._next_start = self._apply_resize(self._next_start)
+
+            if eof:
+                # Entregar como ventana final el audio sin cubrir, o el solapamiento
+                # que la última ventana dejó pendiente de confirmar
+                start = max(self._next_start, total - self.window_samples)
+                if start < total and (total > self._covered_until or self.overlap_samples):
+                    yield self._make_chunk(start, total - start, True)
+                return
+
+
+class HypothesisDeduper:
+    """Descarta hipótesis repetidas en la zona de solapamiento entre ventanas.
+
+    Trabaja con marcas de tiempo absolutas: un segmento se acepta si su punto medio
+    cae entre lo ya confirmado y el horizonte de la ventana (la mitad del solapamiento
+    final); lo que queda después se deja para la siguiente ventana, que lo ve con más contexto.
+    """
+
+    def __init__(self, overlap_seconds=0.0):
+        self.overlap = overlap_seconds
+        self.committed_until = 0.0
+
+    def filter(self, segments, chunk):
+        """Devuelve los segmentos nuevos de `chunk` con tiempos absolutos."""
+        overlap = self.overlap if chunk.overlap is None else chunk.overlap
+        if chunk.final or overlap <= 0:
+            horizon = float("inf")
+        else:
+            horizon = chunk.end - overlap / 2
+
+        accepted = []
+        for segment in segments:
+            start = chunk.start + segment["start"]
+            end = chunk.start + segment["end"]
+            middle = (start + end) / 2
+            if middle < self.committed_until or middle >= horizon:
+                continue
+            segment = {**segment, "start": start, "end": end}
+            if segment.get("words"):
+                segment["words"] = [{**word, "start": chunk.start + word["start"], "end": chunk.start + word["end"]}
+                                    for word in segment["words"] if "start" in word]
+            accepted.append(segment)
+
+        self.committed_until = max(self.committed_until, min(horizon, chunk.end))
+        return accepted
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import SAMPLE_RATE, AudioChunk  # noqa: E402
+
+
+@pytest.fixture
+def make_chunk():
+    """Fábrica de AudioChunk de nivel constante: make_chunk(inicio, nivel=0.1, segundos=1)."""
+    def make(start, level=0.1, seconds=1):
+        return AudioChunk(float(start), np.full(int(seconds * SAMPLE_RATE), level, dtype=np.float32))
+    return make
@@ -0,0 +1,47 @@
+from checkpoint import Checkpoint, CheckpointSink
+from sinks import Caption, JsonlSink, SubtitleSink, TextSink
+
+
+def caption(i):
+    return Caption(f"texto {i}", float(i), float(i + 1), timestamp="00:00:00")
+
+
+def write(sinks, captions):
+    for sink in sinks:
+        for c in captions:
+            sink.write(c)
+        sink.flush()
+
+
+def test_resume_truncates_append_sinks_to_the_checkpoint(tmp_path):
+    output, jsonl, srt, state = (str(tmp_path / name) for name in ("salida.txt", "salida.jsonl", "salida.srt",
+                                                                    "checkpoint.json"))
+    checkpoint = Checkpoint("url")
+    extra = [JsonlSink(jsonl), SubtitleSink(srt)]
+    saver = CheckpointSink(state, checkpoint, output, interval=3600)
+    saver.track(extra)
+    sinks = [TextSink(output)] + extra + [saver]
+
+    write(sinks, [caption(0), caption(1)])
+    saver.flush(force=True)
+    # Escritos tras el último checkpoint: se pierden al caerse el proceso
+    write(sinks, [caption(2)])
+    for sink in sinks[:-1]:
+        sink.close()
+
+    resumed = Checkpoint.load(state)
+    assert resumed.position == 2.0
+    assert set(resumed.sink_offsets) == {jsonl}
+    resumed.truncate_output(output)
+    with open(output, encoding="utf-8") as f:
+        assert f.read().count("\n") == 2
+    with open(jsonl, encoding="utf-8") as f:
+        assert [line.count('"texto') for line in f] == [1, 1]
+
+    # Al reanudar se escribe de nuevo el tercero, una sola vez
+    again = [TextSink(output), JsonlSink(jsonl)]
+    write(again, [caption(2)])
+    for sink in again:
+        sink.close()
+    with open(jsonl, encoding="utf-8") as f:
+        assert sum("texto 2" in line for line in f) == 1
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import correccion
+from correccion import corregir_archivos, corregir_texto_marcado, corregir_textos, recoger_palabras
+from utils import configurar_cache_correcciones, corregir_texto, crear_datos_precalculados
+
+VOCABULARIO = {"Sheinbaum", "Ebrard", "Tlatelolco", "Ciudad de México", "Zacatecas"}
+
+TEXTOS = ["La presidenta Shainbaum habló en Tlatelolko.",
+          "Shainbaum y shainbaum, otra vez Shainbaum con Ebrar",
+          "Llegó a la ciudad de mexico desde Zacatecaz",
+          "",
+          "Nada que corregir aquí",
+          "Sheinbaum (corregida) ya estaba corregida, Ebrar no"]
+
+
+@pytest.fixture
+def datos():
+    configurar_cache_correcciones()
+    yield crear_datos_precalculados(VOCABULARIO)
+    configurar_cache_correcciones()
+
+
+def uno_a_uno(textos, datos):
+    """Lo que haría el flujo sin lotes: cada texto por separado y sin caché compartida."""
+    resultado = []
+    for texto in textos:
+        configurar_cache_correcciones()
+        resultado.append(corregir_texto_marcado(texto, datos, 0.7))
+    return resultado
+
+
+def test_recoger_palabras_busca_cada_palabra_una_sola_vez(datos):
+    palabras = recoger_palabras(TEXTOS[:2], datos)
+    assert list(palabras).count("shainbaum") == 1
+    # Las palabras del vocabulario y las ya corregidas no se buscan
+    assert "sheinbaum" not in recoger_palabras(["Sheinbaum (corregida) habló"], datos)
+
+
+def test_el_lote_corrige_igual_que_texto_a_texto(datos):
+    esperados = uno_a_uno(TEXTOS, datos)
+    configurar_cache_correcciones()
+    assert corregir_textos(TEXTOS, datos, 0.7) == esperados
+    assert esperados[0] == corregir_texto(TEXTOS[0], datos, 0.7)
+    assert "Sheinbaum (corregida)" in esperados[1] and "Ciudad de México (corregida)" in esperados[2]
+
+
+def test_corregir_dos_veces_no_cambia_el_texto(datos):
+    corregidos = corregir_textos(TEXTOS, datos, 0.7)
+    assert corregir_textos(corregidos, datos, 0.7) == corregidos
+    assert corregidos[5].count("(corregida)") == 2
+
+
+def test_la_busqueda_en_procesos_da_el_mismo_resultado(datos, tmp_path, monkeypatch):
+    ruta = tmp_path / "palabras.json"
+    ruta.write_text(json.dumps(sorted(VOCABULARIO), ensure_ascii=False), encoding="utf-8")
+    esperados = uno_a_uno(TEXTOS, datos)
+    configurar_cache_correcciones()
+    monkeypatch.setattr(correccion, "MIN_PALABRAS_PROCESOS", 1)
+    assert corregir_textos(TEXTOS, datos, 0.7, procesos=2, correct_words=str(ruta)) == esperados
+
+
+def test_corregir_archivos_respeta_marcas_de_tiempo_y_jsonl(datos, tmp_path):
+    texto = tmp_path / "directo.txt"
+    texto.write_text("[00:00:01]: SPEAKER_00: Habló Shainbaum\n[00:00:05]: Nada que corregir\n", encoding="utf-8")
+    jsonl = tmp_path / "directo.jsonl"
+    jsonl.write_text(json.dumps({"start": 1.0, "text": "Habló Shainbaum"}) + "\n", encoding="utf-8")
+
+    resultados = corregir_archivos([str(texto), str(jsonl)], datos, 0.7)
+    assert resultados == {str(texto): (2, 1), str(jsonl): (1, 1)}
+    assert (tmp_path / "directo.corregida.txt").read_text(encoding="utf-8").splitlines() == \
+           ["[00:00:01]: SPEAKER_00: Habló Sheinbaum (corregida)", "[00:00:05]: Nada que corregir"]
+    linea = json.loads((tmp_path / "directo.corregida.jsonl").read_text(encoding="utf-8"))
+    assert linea == {"start": 1.0, "text": "Habló Sheinbaum (corregida)"}
@@ -0,0 +1,96 @@
+import numpy as np
+
+from diarization import IncrementalDiarizer, SpeakerRegistry
+from streaming import SAMPLE_RATE, AudioChunk
+
+VOICES = np.eye(4, dtype=np.float32)
+
+
+def chunk(start, seconds=10):
+    return AudioChunk(float(start), np.zeros(seconds * SAMPLE_RATE, dtype=np.float32))
+
+
+def diarization(turns):
+    return {"start": [t[0] for t in turns], "end": [t[1] for t in turns], "speaker": [t[2] for t in turns]}
+
+
+class EmbeddingPipeline:
+    """Pipeline falso con embeddings: devuelve por orden las ventanas de `script` y anota el audio recibido."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.seconds = []
+
+    def __call__(self, audio, return_embeddings=False):
+        self.seconds.append(len(audio) / SAMPLE_RATE)
+        turns, embeddings = self.script.pop(0)
+        return diarization(turns), embeddings
+
+
+class PlainPipeline(EmbeddingPipeline):
+    """Pipeline de versiones de WhisperX sin return_embeddings."""
+
+    def __call__(self, audio):
+        self.seconds.append(len(audio) / SAMPLE_RATE)
+        return diarization(self.script.pop(0))
+
+
+def test_registry_keeps_labels_when_local_labels_swap():
+    registry = SpeakerRegistry()
+    assert registry.match({"SPEAKER_00": VOICES[0], "SPEAKER_01": VOICES[1]}) == \
+           {"SPEAKER_00": "SPEAKER_00", "SPEAKER_01": "SPEAKER_01"}
+    # En la ventana siguiente el modelo numera a los hablantes al revés
+    assert registry.match({"SPEAKER_00": VOICES[1] + 0.1 * VOICES[2], "SPEAKER_01": VOICES[0]}) == \
+           {"SPEAKER_00": "SPEAKER_01", "SPEAKER_01": "SPEAKER_00"}
+    assert registry.match({"SPEAKER_00": VOICES[3]}) == {"SPEAKER_00": "SPEAKER_02"}
+    assert len(registry) == 3
+
+
+def test_registry_never_gives_two_local_speakers_the_same_label():
+    registry = SpeakerRegistry()
+    registry.match({"SPEAKER_00": VOICES[0]})
+    mapping = registry.match({"SPEAKER_00": VOICES[0], "SPEAKER_01": VOICES[0] + 0.2 * VOICES[1]})
+    assert mapping == {"SPEAKER_00": "SPEAKER_00", "SPEAKER_01": "SPEAKER_01"}
+
+
+def test_labels_are_stable_across_windows_with_embeddings():
+    pipeline = EmbeddingPipeline([
+        ([(0, 5, "SPEAKER_00"), (5, 10, "SPEAKER_01")], {"SPEAKER_00": VOICES[0], "SPEAKER_01": VOICES[1]}),
+        # Ventana 0-20 s: el modelo ha cambiado la numeración
+        ([(0, 5, "SPEAKER_01"), (5, 10, "SPEAKER_00"), (10, 20, "SPEAKER_01")],
+         {"SPEAKER_01": VOICES[0], "SPEAKER_00": VOICES[1]}),
+    ])
+    diarizer = IncrementalDiarizer(pipeline)
+    assert diarizer.process([chunk(0)]) == [(0.0, 5.0, "SPEAKER_00"), (5.0, 10.0, "SPEAKER_01")]
+    # Solo se devuelven los turnos del audio nuevo
+    assert diarizer.process([chunk(10)]) == [(10.0, 20.0, "SPEAKER_00")]
+    assert pipeline.seconds == [10, 20]
+
+
+def test_labels_follow_the_overlap_without_embeddings():
+    pipeline = PlainPipeline([
+        [(0, 10, "SPEAKER_00")],
+        [(0, 10, "SPEAKER_01"), (10, 15, "SPEAKER_01"), (15, 20, "SPEAKER_00")],
+    ])
+    diarizer = IncrementalDiarizer(pipeline)
+    assert diarizer.process([chunk(0)]) == [(0.0, 10.0, "SPEAKER_00")]
+    # SPEAKER_01 local coincide con el SPEAKER_00 global en 0-10 s; SPEAKER_00 local es nuevo
+    assert diarizer.process([chunk(10)]) == [(10.0, 15.0, "SPEAKER_00"), (15.0, 20.0, "SPEAKER_01")]
+
+
+def test_window_keeps_only_the_last_seconds_of_context():
+    pipeline = EmbeddingPipeline([([(0, 10, "SPEAKER_00")], {"SPEAKER_00": VOICES[0]})] * 3)
+    diarizer = IncrementalDiarizer(pipeline, window=20)
+    for start in (0, 10, 20):
+        diarizer.process([chunk(start)])
+    assert pipeline.seconds == [10, 20, 20]
+
+
+def test_gap_resets_the_buffer():
+    pipeline = PlainPipeline([[(0, 10, "SPEAKER_00")], [(0, 10, "SPEAKER_00")]])
+    diarizer = IncrementalDiarizer(pipeline)
+    diarizer.process([chunk(0)])
+    # Se ha descartado audio entre 10 y 30 s: el contexto anterior ya no es contiguo
+    turns = diarizer.process([chunk(30)])
+    assert pipeline.seconds == [10, 10]
+    assert turns == [(30.0, 40.0, "SPEAKER_01")]
@@ -0,0 +1,88 @@
+import types
+
+import numpy as np
+import pytest
+
+import fingerprint
+from fingerprint import SimulcastDedup
+from streaming import SAMPLE_RATE, AudioChunk
+
+CHUNK = 10
+# Desfase entre los streams que no es múltiplo del salto de 16 ms del fingerprint
+OFFSET = 2.3
+
+
+def speech_like(seconds, seed):
+    """Ruido con tres formantes que cambian cada 80 ms y envolvente silábica de 4 Hz."""
+    rng = np.random.default_rng(seed)
+    n = seconds * SAMPLE_RATE
+    noise = rng.standard_normal(n)
+    out = np.zeros(n)
+    step = 1280
+    freqs = np.fft.rfftfreq(step, 1 / SAMPLE_RATE)
+    for k in range(0, n, step):
+        formants = rng.uniform([300, 900, 2000], [900, 2000, 3500])
+        envelope = sum(np.exp(-((freqs - f) / bw) ** 2) for f, bw in zip(formants, (80, 120, 200)))
+        out[k:k + step] = np.fft.irfft(np.fft.rfft(noise[k:k + step]) * envelope, step)
+    t = np.arange(n) / SAMPLE_RATE
+    out *= 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)
+    return (out / np.abs(out).max() * 0.8).astype(np.float32)
+
+
+def low_pass(audio):
+    return np.convolve(audio, [0.25, 0.5, 0.25], mode="same").astype(np.float32)
+
+
+def mu_law(audio, mu=255):
+    """Codifica y decodifica con μ-law de 8 bits (como la telefonía)."""
+    code = np.round(np.sign(audio) * np.log1p(mu * np.abs(audio)) / np.log1p(mu) * 127) / 127
+    return (np.sign(code) * ((1 + mu) ** np.abs(code) - 1) / mu).astype(np.float32)
+
+
+def gain_int16(audio):
+    return (np.round(0.7 * audio * 32767) / 32767).astype(np.float32)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj falso: los chunks se registran cuando terminan de capturarse."""
+    now = [1000.0]
+    monkeypatch.setattr(fingerprint, "time", types.SimpleNamespace(time=lambda: now[0], sleep=lambda s: None))
+    return now
+
+
+def register_pair(clock, first, second):
+    """Registra dos streams por chunks; el primero recibe el audio antes y lo transcribe."""
+    dedup = SimulcastDedup(window=1e6, wait=0)
+    pairs = []
+    for start in range(0, len(first) // SAMPLE_RATE - CHUNK + 1, CHUNK):
+        a = AudioChunk(float(start), first[start * SAMPLE_RATE:(start + CHUNK) * SAMPLE_RATE])
+        b = AudioChunk(float(start), second[start * SAMPLE_RATE:(start + CHUNK) * SAMPLE_RATE])
+        clock[0] = 1000.0 + a.end
+        dedup.register("a", a)
+        dedup.store(a, {"segments": [{"start": 0.0, "end": float(CHUNK), "text": f" chunk {start}"}]})
+        clock[0] = 1000.0 + b.end + 0.5
+        dedup.register("b", b)
+        pairs.append(b)
+    clock[0] += CHUNK
+    return dedup, pairs
+
+
+@pytest.mark.parametrize("distortion", [lambda x: x, low_pass, mu_law, gain_int16],
+                         ids=["identity", "low-pass", "mu-law", "gain-int16"])
+def test_distorted_copy_offset_by_a_fraction_of_a_hop_is_reused(clock, distortion):
+    signal = speech_like(60, seed=0)
+    shift = int(OFFSET * SAMPLE_RATE)
+    # El stream b emite el mismo audio OFFSET segundos más tarde y con otra codificación
+    dedup, chunks = register_pair(clock, signal[shift:], distortion(signal[:-shift]))
+    # El primer chunk de b empieza antes que el audio de a
+    states = [dedup._match(chunk)[0] for chunk in chunks[1:]]
+    assert states == ["hit"] * len(states)
+
+    result = dedup.lookup(chunks[2])
+    assert result["segments"] and all(0.0 <= s["start"] <= s["end"] <= CHUNK for s in result["segments"])
+
+
+def test_unrelated_audio_is_not_reused(clock):
+    dedup, chunks = register_pair(clock, speech_like(40, seed=0), speech_like(40, seed=1))
+    assert all(dedup._match(chunk)[0] == "miss" for chunk in chunks)
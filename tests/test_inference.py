@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from inference import InferenceBackend, InferencePool, share_weights
+
+torch = pytest.importorskip("torch")
+
+
+def quantized_model():
+    model = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 8))
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def test_share_weights_shares_float_parameters():
+    model = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.Linear(64, 8))
+    replica = share_weights(model)
+    assert replica[0] is not model[0]
+    assert replica[0].weight is model[0].weight
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_share_weights_shares_int8_packed_weights():
+    model = quantized_model()
+    replica = share_weights(model)
+    # Módulos propios (los hooks de cada hilo no se mezclan) con los mismos pesos int8
+    assert replica[0] is not model[0]
+    assert replica[0]._packed_params is model[0]._packed_params
+    replica[0].register_forward_hook(lambda *args: None)
+    assert not model[0]._forward_hooks
+
+    x = torch.randn(3, 64)
+    assert torch.equal(replica(x), model(x))
+
+
+class RecordingBackend(InferenceBackend):
+    name = "recording"
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def _transcribe(self, chunks, language, prompt):
+        self.calls.append([chunk.start for chunk in chunks])
+        return [{"text": f" {chunk.start:.0f}", "segments": [{"start": 0.0, "end": chunk.duration,
+                                                               "text": f" {chunk.start:.0f}"}]}
+                for chunk in chunks]
+
+
+class WaitingDedup:
+    """SimulcastDedup falso: el chunk 0 está pendiente en otro stream hasta `release`."""
+
+    def __init__(self):
+        self.released = threading.Event()
+
+    def pending(self, chunk):
+        return chunk.start == 0 and not self.released.is_set()
+
+    def transcribe(self, backend, chunks, language=None, prompt=None):
+        return backend.transcribe(chunks, language, prompt)
+
+
+def test_pool_keeps_transcribing_while_a_chunk_waits_for_another_stream(make_chunk):
+    backend, dedup = RecordingBackend(), WaitingDedup()
+    results = []
+    pool = InferencePool(backend, workers=1, dedup=dedup,
+                         on_result=lambda text, chunk, segments: results.append(text))
+    for start in (0, 1, 2):
+        pool.submit(make_chunk(start))
+
+    deadline = time.monotonic() + 5
+    while backend.calls != [[1.0], [2.0]] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # El único hilo no se ha quedado esperando al chunk 0, pero el orden de salida se mantiene
+    assert backend.calls == [[1.0], [2.0]] and results == []
+    dedup.released.set()
+    pool.close(timeout=5)
+    assert backend.calls == [[1.0], [2.0], [0.0]]
+    assert results == [" 0", " 1", " 2"]
+
+
+def test_pool_transcribes_deferred_chunks_on_close(make_chunk):
+    backend, dedup = RecordingBackend(), WaitingDedup()
+    results = []
+    pool = InferencePool(backend, workers=1, dedup=dedup,
+                         on_result=lambda text, chunk, segments: results.append(text))
+    pool.submit(make_chunk(0))
+    pool.close(timeout=5)
+    assert results == [" 0"]
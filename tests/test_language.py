@@ -0,0 +1,105 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from language import MIN_CONFIDENCE, LanguageTracker
+from streaming import SAMPLE_RATE, AudioChunk
+
+_ids = itertools.count()
+
+
+class ScriptedBackend:
+    """Backend falso: detect_language devuelve por orden los resultados de `script`."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    def replicate(self):
+        return self
+
+    def detect_language(self, audio):
+        self.calls += 1
+        return self.script.pop(0)
+
+
+def speech(start, seconds=5):
+    return AudioChunk(float(start), np.full(seconds * SAMPLE_RATE, 0.1, dtype=np.float32))
+
+
+def silence(start, seconds=5):
+    return AudioChunk(float(start), np.zeros(seconds * SAMPLE_RATE, dtype=np.float32))
+
+
+def tracker(backend, **kwargs):
+    # Etiquetas propias en cada test: el registro de métricas es global
+    return LanguageTracker(backend, labels={"test": str(next(_ids))}, **kwargs)
+
+
+def pinned(*script, recheck_seconds=10.0):
+    """Tracker con el español ya fijado en el primer chunk de voz."""
+    backend = ScriptedBackend(("es", 0.95), *script)
+    languages = tracker(backend, detect_seconds=5, recheck_seconds=recheck_seconds)
+    assert languages.observe(speech(0)) == "es"
+    return backend, languages
+
+
+def test_user_language_is_never_detected():
+    backend = ScriptedBackend()
+    languages = tracker(backend, language="fr")
+    assert languages.observe(speech(0)) == "fr"
+    assert backend.calls == 0
+
+
+def test_pins_only_above_min_confidence():
+    backend = ScriptedBackend(("es", MIN_CONFIDENCE - 0.1), ("es", MIN_CONFIDENCE + 0.1))
+    languages = tracker(backend, detect_seconds=10)
+    # El silencio no cuenta como voz para la detección
+    assert [languages.observe(chunk) for chunk in (speech(0), silence(5), speech(10))] == [None, None, None]
+    assert backend.calls == 1
+    assert languages.observe(speech(15)) == "es"
+    assert languages.observe(speech(20)) == "es"
+    assert backend.calls == 2 and languages.detections == 2
+
+
+def test_backend_without_detection_falls_back_to_per_chunk():
+    languages = tracker(ScriptedBackend(None), detect_seconds=5)
+    assert languages.observe(speech(0)) is None
+    assert languages.fixed and languages.observe(speech(5)) is None
+
+
+def test_switches_only_after_two_consecutive_confident_detections():
+    backend, languages = pinned(("en", 0.9), ("en", 0.9))
+    assert languages.observe(speech(5)) == "es"       # 5 s desde la última comprobación
+    assert languages.observe(speech(10)) == "es"      # Primera detección de otro idioma: solo candidato
+    assert languages.observe(speech(15)) == "en"      # Se confirma en el siguiente chunk de voz
+    assert languages.switches == 1 and backend.calls == 3
+
+
+def test_isolated_or_unconfident_detections_do_not_switch():
+    backend, languages = pinned(("en", 0.9), ("es", 0.9), ("en", 0.9), ("en", MIN_CONFIDENCE - 0.1))
+    for start in range(5, 40, 5):
+        assert languages.observe(speech(start)) == "es"
+    assert languages.switches == 0 and backend.calls == 5
+
+
+def test_low_logprob_brings_the_recheck_forward():
+    backend, languages = pinned(("en", 0.9), recheck_seconds=300.0)
+    languages.feedback([{"avg_logprob": -0.3}])
+    languages.observe(speech(5))
+    assert backend.calls == 1
+    languages.feedback([{"avg_logprob": -1.4}, {"avg_logprob": -1.2}])
+    # La comprobación espera al siguiente chunk con voz
+    languages.observe(silence(10))
+    assert backend.calls == 1
+    languages.observe(speech(15))
+    assert backend.calls == 2 and languages.language == "es"
+
+
+def test_stats_count_audio_per_language():
+    _, languages = pinned(("en", 0.9), ("en", 0.9))
+    for start in (5, 10, 15, 20):
+        languages.observe(speech(start))
+    assert languages.stats()["audio_seconds"] == {"es": 15.0, "en": 10.0}
+    assert languages.stats()["switches"] == 1
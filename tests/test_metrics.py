@@ -0,0 +1,27 @@
+import urllib.request
+
+from metrics import MetricsRegistry, serve_metrics
+
+
+def test_prometheus_escapes_label_values():
+    registry = MetricsRegistry()
+    registry.counter("chunks_total", "Chunks", stream='canal "uno"\\a\nb').inc(2)
+    text = registry.render_prometheus()
+    assert 'stream="canal \\"uno\\"\\\\a\\nb"' in text
+    # Cada muestra sigue en una sola línea
+    assert [line for line in text.splitlines() if not line.startswith("#")] == [
+        'transcriptor_chunks_total{stream="canal \\"uno\\"\\\\a\\nb"} 2']
+
+
+def test_metrics_listen_only_locally_by_default():
+    registry = MetricsRegistry()
+    registry.counter("chunks_total", "Chunks").inc()
+    server = serve_metrics(0, registry=registry)
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert b"chunks_total 1" in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
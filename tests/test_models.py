@@ -0,0 +1,48 @@
+import pytest
+
+import models
+
+torch = pytest.importorskip("torch")
+whisper = pytest.importorskip("whisper")
+from whisper.model import ModelDimensions, Whisper  # noqa: E402
+
+DIMS = ModelDimensions(n_mels=80, n_audio_ctx=8, n_audio_state=16, n_audio_head=2, n_audio_layer=1,
+                       n_vocab=64, n_text_ctx=8, n_text_state=16, n_text_head=2, n_text_layer=1)
+
+
+@pytest.fixture
+def fake_load_model(monkeypatch):
+    """whisper.load_model sin descargas: un modelo diminuto en CPU; anota el dispositivo pedido."""
+    devices = []
+
+    def load_model(name, device=None):
+        devices.append(device)
+        torch.manual_seed(0)
+        return Whisper(DIMS)
+
+    monkeypatch.setattr(whisper, "load_model", load_model)
+    return devices
+
+
+def test_snapshot_opens_with_the_same_weights_and_device(tmp_path, fake_load_model):
+    loaded = models.open_whisper("tiny", snapshot_dir=str(tmp_path))
+    snapshot = models.open_whisper("tiny", snapshot_dir=str(tmp_path))
+    assert fake_load_model == ["cpu"]  # La segunda vez se abre la instantánea
+    assert next(snapshot.parameters()).device == next(loaded.parameters()).device
+    for (name, a), (_, b) in zip(loaded.state_dict().items(), snapshot.state_dict().items()):
+        assert torch.equal(a.to_dense() if a.is_sparse else a, b.to_dense() if b.is_sparse else b), name
+
+
+def test_snapshot_uses_the_gpu_like_load_model(tmp_path, monkeypatch, fake_load_model):
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    opened = []
+    real_open = models.load_whisper_snapshot
+
+    def load_snapshot(path, device=None):
+        opened.append(device)
+        return real_open(path)  # Sin GPU en los tests: se queda en CPU
+
+    monkeypatch.setattr(models, "load_whisper_snapshot", load_snapshot)
+    models.open_whisper("tiny", snapshot_dir=str(tmp_path))
+    models.open_whisper("tiny", snapshot_dir=str(tmp_path))
+    assert fake_load_model == ["cuda"] and opened == ["cuda"]
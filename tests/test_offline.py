@@ -0,0 +1,41 @@
+import pytest
+
+import offline
+from offline import MAX_WORKERS_WITHOUT_SNAPSHOT, default_workers
+
+
+@pytest.fixture
+def host(monkeypatch):
+    """Máquina de 32 núcleos y 64 GB libres, sin GPU salvo que el test la active."""
+    state = {"cuda": False, "memory": 64 * 1024}
+    monkeypatch.setattr(offline.os, "cpu_count", lambda: 32)
+    monkeypatch.setattr(offline, "_uses_cuda", lambda backend: state["cuda"] and backend != "int8")
+    monkeypatch.setattr(offline, "_available_memory_mb", lambda: state["memory"])
+    return state
+
+
+def test_one_process_per_core_with_a_shared_snapshot(host):
+    assert default_workers("medium", model_dir="modelos") == 32
+
+
+def test_without_snapshot_the_process_count_is_capped(host):
+    assert default_workers("tiny") == MAX_WORKERS_WITHOUT_SNAPSHOT
+
+
+def test_without_snapshot_only_the_copies_that_fit_in_memory(host):
+    host["memory"] = 10 * 1024
+    assert default_workers("large") == 1
+    assert default_workers("small") == MAX_WORKERS_WITHOUT_SNAPSHOT
+    host["memory"] = 4 * 1024
+    assert default_workers("small") == 2
+    # Sin memoria suficiente ni para uno, se intenta igualmente con uno
+    host["memory"] = 100
+    assert default_workers("medium") == 1
+
+
+def test_a_single_process_on_the_gpu(host):
+    host["cuda"] = True
+    assert default_workers("small") == 1
+    assert default_workers("small", model_dir="modelos") == 1
+    # int8 siempre es CPU
+    assert default_workers("small", model_dir="modelos", backend="int8") == 32
@@ -0,0 +1,138 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+from overload import OverloadQueue
+
+_ids = itertools.count()
+
+
+def overload_queue(policy, maxsize=2, **kwargs):
+    # Etiquetas propias en cada test: el registro de métricas es global
+    return OverloadQueue(maxsize, policy, labels={"test": str(next(_ids))}, **kwargs)
+
+
+def starts(q):
+    return [item.start for item in q.queue]
+
+
+def put_in_background(q, item):
+    thread = threading.Thread(target=q.put, args=(item,), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        OverloadQueue(2, "drop-newest")
+
+
+def test_drop_oldest_discards_the_head(make_chunk):
+    q = overload_queue("drop-oldest")
+    for start in range(4):
+        q.put(make_chunk(start))
+    assert starts(q) == [2.0, 3.0]
+    assert q.dropped.value == 2
+    assert q.unfinished_tasks == 2
+
+
+def test_skip_silence_discards_the_quietest_chunk_below_the_threshold(make_chunk):
+    q = overload_queue("skip-silence", silence_db=-45.0)
+    q.put(make_chunk(0, level=0.1))
+    q.put(make_chunk(1, level=1e-4))
+    q.put(make_chunk(2, level=0.1))
+    assert starts(q) == [0.0, 2.0]
+    # El chunk nuevo también puede ser el descartado
+    q.put(make_chunk(3, level=0.0))
+    assert starts(q) == [0.0, 2.0]
+    assert q.dropped.value == 2
+
+
+def test_skip_silence_discards_the_oldest_when_every_chunk_has_speech(make_chunk):
+    q = overload_queue("skip-silence", silence_db=-45.0)
+    for start in range(3):
+        q.put(make_chunk(start, level=0.05 * (start + 1)))
+    assert starts(q) == [1.0, 2.0]
+    assert q.dropped.value == 1
+
+
+def test_block_waits_for_the_consumer_without_losing_audio(make_chunk):
+    q = overload_queue("block", maxsize=1)
+    q.put(make_chunk(0))
+    thread = put_in_background(q, make_chunk(1))
+    time.sleep(0.1)
+    assert thread.is_alive()
+    assert q.get().start == 0.0
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert starts(q) == [1.0]
+    assert q.dropped.value == 0
+    assert q.blocked_seconds.value > 0
+
+
+def test_block_gives_up_on_shutdown(make_chunk):
+    shutdown = threading.Event()
+    q = overload_queue("block", maxsize=1, shutdown_event=shutdown)
+    q.put(make_chunk(0))
+    thread = put_in_background(q, make_chunk(1))
+    shutdown.set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert starts(q) == [0.0]
+    assert q.dropped.value == 1
+
+
+@pytest.mark.parametrize("policy", ["downgrade", "stride"])
+def test_adaptive_policy_adapts_once_per_cooldown(policy, make_chunk):
+    calls = []
+
+    def adapt():
+        calls.append(time.monotonic())
+        # Con menos carga la transcripción vuelve a dar abasto y libera sitio
+        q.get_nowait()
+        return "modelo más pequeño"
+
+    q = overload_queue(policy, maxsize=1, adapt=adapt, cooldown=30.0)
+    q.put(make_chunk(0))
+    q.put(make_chunk(1))
+    assert len(calls) == 1 and starts(q) == [1.0]
+
+    # Dentro del enfriamiento no se vuelve a adaptar: la captura espera al consumidor
+    thread = put_in_background(q, make_chunk(2))
+    time.sleep(0.1)
+    assert thread.is_alive()
+    q.get()
+    thread.join(timeout=5)
+    assert len(calls) == 1 and starts(q) == [2.0]
+    assert q.dropped.value == 0
+
+
+@pytest.mark.parametrize("policy", ["downgrade", "stride"])
+def test_adaptive_policy_drops_the_oldest_once_exhausted(policy, make_chunk):
+    calls = []
+    q = overload_queue(policy, maxsize=1, adapt=lambda: calls.append(1), cooldown=0.0)
+    for start in range(3):
+        q.put(make_chunk(start))
+    # adapt() no pudo reducir más la carga: no se le vuelve a llamar y se descarta lo antiguo
+    assert calls == [1]
+    assert starts(q) == [2.0]
+    assert q.dropped.value == 2
+
+
+def test_stride_uses_the_attached_splitter(make_chunk):
+    widened = []
+
+    class Splitter:
+        def widen(self):
+            widened.append(1)
+            q.get_nowait()
+            return "ventanas de 20 s"
+
+    q = overload_queue("stride", maxsize=1)
+    q.attach_source(Splitter())
+    q.put(make_chunk(0))
+    q.put(make_chunk(1))
+    assert widened == [1]
+    assert starts(q) == [1.0]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from partial import LocalAgreement, PartialTranscriber
+from streaming import SAMPLE_RATE, AudioChunk
+
+
+class SilenceBackend:
+    """Backend que no reconoce ninguna palabra y apunta la duración de cada decodificación."""
+
+    def __init__(self):
+        self.durations = []
+
+    def transcribe(self, chunks, language=None, prompt=None):
+        self.durations.extend(chunk.duration for chunk in chunks)
+        return [{"text": "", "segments": []} for _ in chunks]
+
+
+def test_silence_keeps_buffer_within_max_buffer():
+    backend = SilenceBackend()
+    transcriber = PartialTranscriber(backend, interval=1.0, max_buffer=5.0)
+    for second in range(40):
+        transcriber.push(AudioChunk(float(second), np.zeros(SAMPLE_RATE, dtype=np.float32)))
+        assert len(transcriber._audio) <= 5 * SAMPLE_RATE
+
+    # Cada decodificación ve como mucho max_buffer más el audio nuevo: no crece con el silencio
+    assert len(backend.durations) == 40
+    assert max(backend.durations) <= 5.0 + 1.0 + 1e-6
+    assert transcriber._buffer_start == 35.0
+
+
+def test_local_agreement_commits_words_two_hypotheses_agree_on():
+    agreement = LocalAgreement()
+    assert agreement.insert([(0.0, 0.5, "hola"), (0.5, 1.0, "a")]) == []
+    committed = agreement.insert([(0.0, 0.5, "Hola,"), (0.5, 1.0, "a"), (1.0, 1.5, "todos")])
+    assert [word for _, _, word in committed] == ["Hola,", "a"]
+    assert agreement.committed_until == 1.0
+    assert agreement.pending() == [(1.0, 1.5, "todos")]
+
+
+def test_local_agreement_drops_repeated_committed_words():
+    agreement = LocalAgreement()
+    agreement.insert([(0.0, 0.5, "buenas"), (0.5, 1.0, "tardes")])
+    agreement.insert([(0.0, 0.5, "buenas"), (0.5, 1.0, "tardes")])
+    # La nueva hipótesis repite lo confirmado con otros tiempos
+    agreement.insert([(0.95, 1.3, "tardes"), (1.3, 1.8, "amigos")])
+    committed = agreement.insert([(1.3, 1.8, "amigos"), (1.8, 2.0, "míos")])
+    assert [word for _, _, word in committed] == ["amigos"]
+
+
+def test_local_agreement_flush_commits_pending():
+    agreement = LocalAgreement()
+    agreement.insert([(0.0, 0.5, "uno"), (0.5, 1.0, "dos")])
+    assert [word for _, _, word in agreement.flush()] == ["uno", "dos"]
+    assert agreement.pending() == []
+    assert agreement.committed_until == 1.0
@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+import resolver as resolver_module
+import utils
+from resolver import StreamResolver, configure_resolver, url_expiry
+
+URL = "https://www.youtube.com/watch?v=abc"
+
+
+class FakeExtractor:
+    """Extractor que devuelve una URL de googlevideo distinta en cada resolución."""
+
+    def __init__(self, expire=None, fail=False):
+        self.calls = 0
+        self.expire = expire
+        self.fail = fail
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, url):
+        self.release.wait(5)
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("HTTP Error 403: Forbidden")
+        query = f"?expire={self.expire}" if self.expire else ""
+        return {"url": f"https://rr1.googlevideo.com/videoplayback/{self.calls}{query}", "is_live": True}
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def wait_idle(resolver):
+    for future in list(resolver._pending.values()):
+        future.result(5)
+
+
+def test_url_expiry_reads_query_and_path():
+    assert url_expiry("https://x.googlevideo.com/videoplayback?expire=1700000000&id=1") == 1700000000.0
+    assert url_expiry("https://manifest.googlevideo.com/api/manifest/hls/expire/1700000001/id/1") == 1700000001.0
+    assert url_expiry("https://example.com/audio.m4a") is None
+
+
+def test_cached_until_ttl_then_resolved_again(clock):
+    extractor = FakeExtractor()
+    resolver = StreamResolver(extractor, clock=clock, ttl=100, refresh_margin=0)
+    first = resolver.resolve(URL)
+    clock.now += 99
+    assert resolver.resolve(URL) is first
+    assert extractor.calls == 1
+    clock.now += 1
+    assert resolver.resolve(URL)["url"].endswith("/2")
+    assert extractor.calls == 2
+    resolver.close()
+
+
+def test_expiry_comes_from_the_googlevideo_url(clock):
+    extractor = FakeExtractor(expire=1050)
+    resolver = StreamResolver(extractor, clock=clock, ttl=3600, refresh_margin=0)
+    resolver.resolve(URL)
+    clock.now = 1049
+    resolver.resolve(URL)
+    assert extractor.calls == 1
+    clock.now = 1050
+    resolver.resolve(URL)
+    assert extractor.calls == 2
+    resolver.close()
+
+
+def test_refreshes_in_background_before_expiring(clock):
+    extractor = FakeExtractor()
+    resolver = StreamResolver(extractor, clock=clock, ttl=100, refresh_margin=30)
+    resolver.resolve(URL)
+    clock.now += 80
+    # Aún vigente: devuelve la entrada actual y la renueva en segundo plano
+    assert resolver.resolve(URL)["url"].endswith("/1")
+    wait_idle(resolver)
+    assert extractor.calls == 2
+    assert resolver.resolve(URL)["url"].endswith("/2")
+    resolver.close()
+
+
+def test_refresh_after_403_bypasses_the_cache(monkeypatch):
+    monkeypatch.setattr(resolver_module, "_resolver", None)  # Se restaura el global al terminar
+    extractor = FakeExtractor()
+    resolver = configure_resolver(extractor)
+    stale = utils.get_audio_stream_info(URL)["url"]
+    assert utils.get_audio_stream_info(URL)["url"] == stale
+    # FFmpeg recibió un 403 con la URL caducada: la captura vuelve a resolver con refresh
+    fresh = utils.get_audio_stream_info(URL, refresh=True)["url"]
+    assert fresh != stale
+    assert utils.get_audio_stream_info(URL)["url"] == fresh
+    assert extractor.calls == 2
+    resolver.close()
+
+
+def test_concurrent_lookups_share_one_extraction(clock):
+    extractor = FakeExtractor()
+    extractor.release.clear()
+    resolver = StreamResolver(extractor, clock=clock)
+    futures = [resolver._lookup(URL, False) for _ in range(5)]
+    extractor.release.set()
+    assert len({id(future.result(5)) for future in futures}) == 1
+    assert extractor.calls == 1
+    resolver.close()
+
+
+def test_errors_are_not_cached(clock):
+    extractor = FakeExtractor(fail=True)
+    resolver = StreamResolver(extractor, clock=clock)
+    results = resolver.resolve_many([URL, URL])
+    assert isinstance(results[URL], RuntimeError)
+    extractor.fail = False
+    assert resolver.resolve(URL)["url"].endswith("/2")
+    resolver.close()
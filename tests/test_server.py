@@ -0,0 +1,78 @@
+import time
+
+from server import FairScheduler, StreamPipeline
+
+
+class EchoBackend:
+    name = "echo"
+
+    def transcribe(self, chunks, language=None, prompt=None):
+        return [{"text": f" {chunk.start:.0f}", "segments": [{"start": 0.0, "end": chunk.duration,
+                                                               "text": f" {chunk.start:.0f}"}]}
+                for chunk in chunks]
+
+    def replicate(self):
+        return self
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_stalled_output_does_not_block_the_shared_worker(tmp_path, make_chunk):
+    scheduler = FairScheduler(EchoBackend(), workers=1)
+    # Sin arrancar los pipelines: nadie lee sus textos, como una salida atascada
+    stalled = StreamPipeline("atascado", "url", scheduler, str(tmp_path / "a.txt"), language="es",
+                             max_queue=2, overload_policy="drop-oldest")
+    healthy = StreamPipeline("sano", "url", scheduler, str(tmp_path / "b.txt"), language="es", max_queue=2)
+    scheduler.register(stalled)
+    scheduler.register(healthy)
+    try:
+        for start in range(4):
+            stalled.audio_queue.put(make_chunk(start))
+        wait_until(lambda: stalled.overloaded)
+        healthy.audio_queue.put(make_chunk(0))
+        # El único worker sigue atendiendo a los demás streams
+        wait_until(lambda: healthy.text_queue.qsize() == 1)
+
+        # El atascado no recibe más turnos: su cola de audio aplica su política (drop-oldest)
+        for start in range(4, 8):
+            stalled.audio_queue.put(make_chunk(start))
+        assert stalled.text_queue.qsize() == 2
+        assert [c.start for c in stalled.audio_queue.queue] == [6.0, 7.0]
+
+        # Al vaciarse la salida vuelve a tener turno
+        stalled.text_queue.get()
+        stalled.text_queue.get()
+        scheduler.notify()
+        wait_until(lambda: stalled.audio_queue.empty())
+        assert [text for _, text, _ in list(stalled.text_queue.queue)] == [" 6", " 7"]
+    finally:
+        scheduler.stop()
+
+
+def test_pipeline_passes_vad_min_silence_and_writes_through_correction(tmp_path, monkeypatch, make_chunk):
+    captured = {}
+
+    def fake_capture(url, out_queue, shutdown_event, chunk_size, overlap, vad, vad_min_silence, **kwargs):
+        captured["vad_min_silence"] = vad_min_silence
+        for start in range(3):
+            out_queue.put(make_chunk(start))
+        out_queue.put(None)
+
+    monkeypatch.setattr("server.capture_stream", fake_capture)
+    scheduler = FairScheduler(EchoBackend(), workers=1)
+    output = tmp_path / "canal.txt"
+    pipeline = StreamPipeline("canal", "url", scheduler, str(output), language="es", vad="energy",
+                              vad_min_silence=1.5)
+    try:
+        pipeline.start()
+        wait_until(lambda: not pipeline.is_alive())
+    finally:
+        scheduler.stop()
+    assert captured["vad_min_silence"] == 1.5
+    assert [line.split(": ", 1)[1] for line in output.read_text(encoding="utf-8").splitlines()] == ["0", "1", "2"]
+    assert [thread.name for thread in pipeline._threads] == ["captura-canal", "correccion-canal", "salida-canal"]
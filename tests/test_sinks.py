@@ -0,0 +1,114 @@
+import pytest
+
+from sinks import Caption, Sink, SinkWriter, SubtitleSink, _websocket_frame, segment_words, split_cues
+
+
+def test_segment_words_interpolates_by_characters():
+    words = segment_words([{"start": 1.0, "end": 2.0, "text": " ab cdef ghij"}], offset=10.0)
+    assert [word for _, _, word in words] == ["ab", "cdef", "ghij"]
+    assert [(start, end) for start, end, _ in words] == [
+        pytest.approx((11.0, 11.2)), pytest.approx((11.2, 11.6)), pytest.approx((11.6, 12.0))]
+
+
+def test_segment_words_uses_word_timestamps():
+    segment = {"start": 0.0, "end": 1.0, "text": " Hola mundo",
+               "words": [{"word": " Hola", "start": 0.1, "end": 0.4}, {"word": " mundo"}]}
+    # Una palabra sin marcas (p. ej. un número en WhisperX) empieza donde acabó la anterior
+    assert segment_words([segment], offset=5.0) == [(5.1, 5.4, "Hola"), (5.4, 5.4, "mundo")]
+
+
+def words(count, seconds, word="palabra"):
+    return [(i * seconds, (i + 1) * seconds, word) for i in range(count)]
+
+
+def test_split_cues_without_words_is_a_single_cue():
+    assert split_cues(Caption(" Hola mundo ", 1.0, 9.0)) == [(1.0, 9.0, "Hola mundo")]
+
+
+def test_split_cues_limits_duration():
+    cues = split_cues(Caption("", 0.0, 10.0, words=words(10, 1.0)), max_seconds=6.0)
+    assert [(start, end) for start, end, _ in cues] == [(0.0, 6.0), (6.0, 10.0)]
+    assert cues[0][2] == " ".join(["palabra"] * 6)
+
+
+def test_split_cues_limits_characters_between_words():
+    cues = split_cues(Caption("", 0.0, 0.5, words=words(5, 0.1, "abcdefghij")), max_chars=25)
+    assert [text for _, _, text in cues] == ["abcdefghij abcdefghij"] * 2 + ["abcdefghij"]
+    assert all(len(text) <= 25 for _, _, text in cues)
+
+
+def subtitles(fmt, window=200):
+    sink = SubtitleSink("unused", fmt, window)
+    sink.write(Caption("Hola mundo", 1.0, 1.2, speaker="SPEAKER_00"))
+    sink.write(Caption("provisional", 2.0, 3.0, final=False))
+    sink.write(Caption("Adiós", 3661.5, 3663.25))
+    return sink
+
+
+def test_render_srt():
+    assert subtitles("srt").render() == ("1\n00:00:01,000 --> 00:00:01,500\nSPEAKER_00: Hola mundo\n\n"
+                                         "2\n01:01:01,500 --> 01:01:03,250\nAdiós\n")
+
+
+def test_render_vtt():
+    assert subtitles("vtt").render() == ("WEBVTT\n\n"
+                                         "1\n00:00:01.000 --> 00:00:01.500\nSPEAKER_00: Hola mundo\n\n"
+                                         "2\n01:01:01.500 --> 01:01:03.250\nAdiós\n")
+
+
+def test_subtitle_window_keeps_the_last_cues_and_their_numbers(tmp_path):
+    sink = subtitles("srt", window=1)
+    sink.path = str(tmp_path / "directo.srt")
+    sink.flush()
+    assert (tmp_path / "directo.srt").read_text(encoding="utf-8") == "2\n01:01:01,500 --> 01:01:03,250\nAdiós\n"
+    assert not (tmp_path / "directo.srt.tmp").exists()
+
+
+@pytest.mark.parametrize("length, header", [
+    (5, b"\x81\x05"),
+    (125, b"\x81\x7d"),
+    (126, b"\x81\x7e\x00\x7e"),
+    (65535, b"\x81\x7e\xff\xff"),
+    (65536, b"\x81\x7f\x00\x00\x00\x00\x00\x01\x00\x00"),
+])
+def test_websocket_frame_length_encodings(length, header):
+    payload = b"x" * length
+    assert _websocket_frame(payload) == header + payload
+
+
+class RecordingSink(Sink):
+    def __init__(self, events):
+        self.events = events
+
+    def write(self, caption):
+        self.events.append(("write", caption.text))
+
+    def flush(self):
+        self.events.append(("flush",))
+
+    def close(self):
+        self.events.append(("close",))
+
+
+class BrokenSink(Sink):
+    def __init__(self):
+        self.closed = False
+
+    def write(self, caption):
+        raise OSError("disco lleno")
+
+    def close(self):
+        self.closed = True
+        raise OSError("disco lleno")
+
+
+def test_sink_writer_isolates_failing_sinks_and_flushes_on_close():
+    events = []
+    broken = BrokenSink()
+    writer = SinkWriter([broken, RecordingSink(events)], batch_size=100, flush_interval=60.0)
+    for text in ("uno", "dos", "tres"):
+        writer.publish(Caption(text, 0.0, 1.0))
+    writer.close()
+    # El lote pendiente se escribe al cerrar aunque no se haya llenado ni vencido el intervalo
+    assert events == [("write", "uno"), ("write", "dos"), ("write", "tres"), ("flush",), ("close",)]
+    assert broken.closed
@@ -0,0 +1,108 @@
+import io
+
+import numpy as np
+import pytest
+
+from streaming import SAMPLE_RATE, AudioChunk, HypothesisDeduper, SlidingWindowChunker
+
+
+def pcm(seconds):
+    """Rampa int16 en la que cada muestra identifica su posición."""
+    samples = (np.arange(int(seconds * SAMPLE_RATE)) % 30000).astype(np.int16)
+    return samples, io.BytesIO(samples.tobytes())
+
+
+def spans(chunks):
+    return [(chunk.start, round(chunk.duration, 3), chunk.final) for chunk in chunks]
+
+
+def assert_matches_source(chunks, samples):
+    for chunk in chunks:
+        first = int(round(chunk.start * SAMPLE_RATE))
+        expected = samples[first:first + len(chunk.audio)].astype(np.float32) / 32768
+        np.testing.assert_array_equal(chunk.audio, expected)
+
+
+def test_chunker_without_overlap_delivers_the_tail():
+    samples, stream = pcm(25)
+    chunks = list(SlidingWindowChunker(10).chunks(stream))
+    assert spans(chunks) == [(0.0, 10.0, False), (10.0, 10.0, False), (20.0, 5.0, True)]
+    assert_matches_source(chunks, samples)
+
+
+def test_chunker_exact_fit_adds_no_empty_tail():
+    _, stream = pcm(20)
+    # El EOF llega con la lectura siguiente: sin solapamiento no queda nada por entregar
+    assert spans(SlidingWindowChunker(10).chunks(stream)) == [(0.0, 10.0, False), (10.0, 10.0, False)]
+
+
+def test_chunker_with_overlap_advances_by_the_stride():
+    samples, stream = pcm(30)
+    chunks = list(SlidingWindowChunker(10, 2).chunks(stream))
+    assert spans(chunks) == [(0.0, 10.0, False), (8.0, 10.0, False), (16.0, 10.0, False), (24.0, 6.0, True)]
+    assert all(chunk.overlap == 2.0 for chunk in chunks)
+    assert_matches_source(chunks, samples)
+
+
+def test_chunker_widen_halves_overlap_then_grows_the_window():
+    chunker = SlidingWindowChunker(10, 2, max_window_seconds=20)
+    steps = []
+    while chunker.widen():
+        window, overlap = chunker._pending_resize
+        steps.append((window / SAMPLE_RATE, overlap / SAMPLE_RATE))
+    assert steps == [(10, 1), (10, 0.5), (10, 0.25), (10, 0), (15, 0), (20, 0)]
+
+
+def test_chunker_widen_keeps_the_unconfirmed_audio():
+    samples, stream = pcm(60)
+    chunker = SlidingWindowChunker(10, max_window_seconds=15)
+    chunks = []
+    for chunk in chunker.chunks(stream):
+        chunks.append(chunk)
+        if len(chunks) == 1:
+            chunker.widen()
+    # La segunda ventana (ya de 15 s) empieza donde terminó la primera, no un stride nuevo después
+    assert spans(chunks) == [(0.0, 10.0, False), (10.0, 15.0, False), (25.0, 15.0, False), (40.0, 15.0, False),
+                             (55.0, 5.0, True)]
+    assert_matches_source(chunks, samples)
+
+
+@pytest.mark.parametrize("window, overlap", [(0, 0), (10, 10), (10, -1)])
+def test_chunker_rejects_invalid_sizes(window, overlap):
+    with pytest.raises(ValueError):
+        SlidingWindowChunker(window, overlap)
+
+
+def chunk(start, seconds, overlap, final=False):
+    return AudioChunk(float(start), np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32), final, overlap=overlap)
+
+
+def segment(start, end, text, **extra):
+    return {"start": start, "end": end, "text": text, **extra}
+
+
+def test_deduper_keeps_each_overlapping_segment_once():
+    deduper = HypothesisDeduper()
+    first = deduper.filter([segment(0.0, 4.0, "a"), segment(7.5, 8.5, "b"), segment(8.8, 9.8, "c")],
+                           chunk(0, 10, 2))
+    # Horizonte en 9 s (mitad del solapamiento): "c" queda para la ventana siguiente
+    assert [(s["text"], s["start"]) for s in first] == [("a", 0.0), ("b", 7.5)]
+
+    second = deduper.filter([segment(0.0, 0.5, "b"), segment(0.8, 1.8, "c"), segment(2.0, 5.0, "d")],
+                            chunk(8, 10, 2, final=True))
+    assert [(s["text"], s["start"], s["end"]) for s in second] == [("c", 8.8, 9.8), ("d", 10.0, 13.0)]
+
+
+def test_deduper_moves_word_times_to_stream_time():
+    deduper = HypothesisDeduper(2.0)
+    words = [{"word": "hola", "start": 0.1, "end": 0.4}, {"word": "sin tiempo"}]
+    [accepted] = deduper.filter([segment(0.0, 0.5, " hola", words=words)], chunk(30, 10, None))
+    assert accepted["start"] == 30.0
+    assert accepted["words"] == [{"word": "hola", "start": 30.1, "end": 30.4}]
+
+
+def test_deduper_without_overlap_accepts_everything():
+    deduper = HypothesisDeduper()
+    segments = [segment(0.0, 5.0, "a"), segment(5.0, 10.0, "b")]
+    assert len(deduper.filter(segments, chunk(0, 10, 0))) == 2
+    assert deduper.committed_until == 10.0
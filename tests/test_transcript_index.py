@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+from sinks import Caption
+from transcript_index import IndexSink, search
+
+
+def test_index_sink_round_trip(tmp_path):
+    path = str(tmp_path / "indice.db")
+    sink = IndexSink(f"{path}#canal")
+    sink.write(Caption("Buenas tardes, León", 12.0, 14.0))
+    sink.write(Caption("provisional", 14.0, 15.0, final=False))
+    sink.close()
+    results = search(path, ["leon"])
+    assert [(r["stream"], r["start"], r["text"]) for r in results] == [("canal", 12.0, "Buenas tardes, León")]
+
+
+def test_index_sink_fails_fast_on_a_bad_path(tmp_path):
+    with pytest.raises(sqlite3.Error):
+        IndexSink(str(tmp_path / "no-existe" / "indice.db"))
+
+
+def test_index_sink_drops_captions_once_its_thread_died(tmp_path, monkeypatch):
+    sink = IndexSink(str(tmp_path / "indice.db"))
+
+    def fail(index, batch):
+        raise RuntimeError("fallo inesperado")
+
+    monkeypatch.setattr(sink, "_write", fail)
+    sink.write(Caption("uno", 0.0, 1.0))
+    sink._thread.join(10)
+    assert not sink._thread.is_alive()
+    for i in range(100):
+        sink.write(Caption("otro", float(i), float(i + 1)))
+    assert sink._queue.empty()
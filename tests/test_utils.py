@@ -0,0 +1,63 @@
+import pytest
+
+import utils
+from utils import CacheCorrecciones, configurar_cache_correcciones, corregir_texto, crear_datos_precalculados
+
+
+@pytest.fixture(autouse=True)
+def cache_vacia():
+    """Cada test empieza con la caché global vacía y en memoria."""
+    yield configurar_cache_correcciones()
+    configurar_cache_correcciones()
+
+
+def test_cache_lru_expulsa_la_entrada_menos_usada():
+    cache = CacheCorrecciones(max_entradas=2)
+    cache.guardar("v", "a", "A")
+    cache.guardar("v", "b", "B")
+    assert cache.obtener("v", "a") == (True, "A")  # "a" pasa a ser la más reciente
+    cache.guardar("v", "c", "C")
+    assert cache.obtener("v", "b") == (False, None)
+    assert cache.obtener("v", "a") == (True, "A")
+    assert cache.obtener("v", "c") == (True, "C")
+    e = cache.estadisticas()
+    assert (e["entradas"], e["aciertos"], e["fallos"], e["expulsiones"]) == (2, 3, 1, 1)
+
+
+def test_cache_guarda_las_palabras_sin_correccion():
+    cache = CacheCorrecciones()
+    cache.guardar("v", "hola", CacheCorrecciones.SIN_CORRECCION)
+    assert cache.obtener("v", "hola") == (True, None)
+
+
+def test_cache_separa_ambitos():
+    cache = CacheCorrecciones()
+    cache.guardar("vocabulario-1:0.7", "chinbaum", "Sheinbaum")
+    assert cache.obtener("vocabulario-2:0.7", "chinbaum") == (False, None)
+    assert cache.obtener("vocabulario-1:0.8", "chinbaum") == (False, None)
+
+
+def test_cache_persistida_sobrevive_al_proceso(tmp_path):
+    ruta = str(tmp_path / "cache.db")
+    cache = CacheCorrecciones(ruta=ruta)
+    cache.guardar("v", "ebrar", "Ebrard")
+    cache.guardar("v", "hola", None)
+    cache.cerrar()
+
+    # Una caché nueva (memoria vacía y límite pequeño) las lee de SQLite
+    cache = CacheCorrecciones(max_entradas=1, ruta=ruta)
+    assert cache.obtener("v", "ebrar") == (True, "Ebrard")
+    assert cache.obtener("v", "hola") == (True, None)
+    assert cache.obtener("v", "ebrar") == (True, "Ebrard")  # Expulsada de memoria, sigue en disco
+    assert cache.obtener("v", "otra") == (False, None)
+    cache.cerrar()
+
+
+def test_corregir_texto_no_reutiliza_correcciones_de_otro_vocabulario(cache_vacia):
+    datos = crear_datos_precalculados({"Sheinbaum"})
+    otros = crear_datos_precalculados({"Shainbaun"})
+    assert corregir_texto("habló Shainbaum", datos, 0.7) == "habló Sheinbaum (corregida)"
+    # La misma palabra está en la caché, pero con el ámbito del otro vocabulario
+    assert corregir_texto("habló Shainbaum", otros, 0.7) == "habló Shainbaun (corregida)"
+    assert corregir_texto("habló Shainbaum", datos, 0.7) == "habló Sheinbaum (corregida)"
+    assert utils.obtener_cache_correcciones() is cache_vacia
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from metrics import REGISTRY
+from streaming import SAMPLE_RATE, AudioChunk
+from vad import FRAME_MS, EnergyVAD, VADSegmenter, get_vad_backend, speech_chunks
+
+FRAME = SAMPLE_RATE * FRAME_MS // 1000
+
+
+class ThresholdVAD:
+    """VAD determinista: hay voz en las tramas con alguna muestra por encima de 0.05."""
+
+    def speech_flags(self, frames):
+        return np.abs(frames).max(axis=1) > 0.05
+
+
+def tone(frames, level=0.5):
+    t = np.arange(frames * FRAME) / SAMPLE_RATE
+    return (level * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def silence(frames):
+    return np.zeros(frames * FRAME, dtype=np.float32)
+
+
+def segment(audio, **kwargs):
+    segmenter = VADSegmenter(ThresholdVAD(), **kwargs)
+    return segmenter, segmenter.process(audio) + segmenter.flush()
+
+
+def frames_of(chunk):
+    return round(chunk.start * 1000 / FRAME_MS), len(chunk.audio) // FRAME
+
+
+def test_splits_on_silence_and_keeps_padding():
+    audio = np.concatenate([silence(40), tone(50), silence(40), tone(30), silence(40)])
+    segmenter, chunks = segment(audio, min_silence=0.3, padding=0.15)
+    # 5 tramas de relleno antes y después de cada tramo de voz
+    assert [frames_of(chunk) for chunk in chunks] == [(35, 60), (125, 40)]
+    assert chunks[-1].final is False
+    assert segmenter.total_frames == 200
+    assert segmenter.skipped_frames == 200 - 60 - 40
+
+
+def test_short_pauses_do_not_split():
+    audio = np.concatenate([tone(30), silence(5), tone(30), silence(40)])
+    _, chunks = segment(audio, min_silence=0.3, padding=0.0)
+    assert [frames_of(chunk) for chunk in chunks] == [(0, 65)]
+
+
+def test_drops_impulses_shorter_than_min_speech():
+    audio = np.concatenate([silence(20), tone(3), silence(40), tone(20), silence(40)])
+    _, chunks = segment(audio, min_silence=0.3, min_speech=0.25, padding=0.0)
+    assert [frames_of(chunk) for chunk in chunks] == [(63, 20)]
+
+
+def test_long_speech_is_cut_at_the_quietest_frame_of_the_second_half():
+    audio = np.concatenate([tone(70), tone(1, level=0.06), tone(60)])
+    _, chunks = segment(audio, max_segment=3.0, min_silence=0.3, padding=0.0)
+    # 100 tramas como mucho: se corta tras la trama 70, la más silenciosa de la segunda mitad
+    assert [frames_of(chunk) for chunk in chunks] == [(0, 71), (71, 60)]
+    np.testing.assert_array_equal(np.concatenate([chunk.audio for chunk in chunks]), audio)
+
+
+def test_pieces_of_any_size_give_the_same_segments():
+    audio = np.concatenate([silence(30), tone(40), silence(30), tone(25), silence(30)])
+    _, whole = segment(audio, min_silence=0.3)
+    segmenter = VADSegmenter(ThresholdVAD(), min_silence=0.3)
+    pieces = [AudioChunk(0.0, piece) for piece in np.array_split(audio, 37)]
+    split = list(speech_chunks(pieces, segmenter))
+    assert [(c.start, len(c.audio)) for c in split] == [(c.start, len(c.audio)) for c in whole]
+
+
+def test_flush_closes_the_open_segment_as_final():
+    _, chunks = segment(np.concatenate([silence(10), tone(40)]), padding=0.0)
+    assert [frames_of(chunk) for chunk in chunks] == [(10, 40)]
+    assert chunks[0].final
+
+
+def test_energy_vad_separates_tone_from_background_noise():
+    rng = np.random.default_rng(0)
+    noise = 0.001 * rng.standard_normal(60 * FRAME).astype(np.float32)
+    audio = np.concatenate([noise, tone(30, level=0.3) + noise[:30 * FRAME], noise])
+    flags = get_vad_backend("energy").speech_flags(audio.reshape(-1, FRAME))
+    assert not flags[:60].any() and flags[60:90].all() and not flags[90:].any()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_vad_backend("nada")
+    assert isinstance(get_vad_backend("energy", min_db=-50.0), EnergyVAD)
+
+
+def test_skipped_seconds_are_exported_while_the_stream_runs():
+    segmenter = VADSegmenter(ThresholdVAD(), min_silence=0.3, padding=0.15, labels={"stream": "vad-test"})
+    metric = REGISTRY.counter("vad_skipped_seconds_total", stream="vad-test")
+    segmenter.process(np.concatenate([silence(40), tone(50), silence(40)]))
+    # Sin flush: el silencio descartado ya se ve en la métrica
+    assert metric.value > 0
+    assert metric.value == pytest.approx(segmenter.skipped_seconds)
+    segmenter.flush()
+    assert metric.value == pytest.approx(segmenter.skipped_seconds)
@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+from utils import configurar_cache_correcciones, corregir_texto, crear_datos_precalculados
+from vocab_index import VERSION_INDICE, abrir_indice, cargar_vocabulario, compilar_indice, ruta_indice_por_defecto
+
+PALABRAS = {"personas": ["Sheinbaum", "Marcelo Ebrard", "López Obrador"],
+            "lugares": ["Tlatelolco", "Ciudad de México", "Zacatecas", "Oaxaca"],
+            "otros": ["Morena", "Senado", "Cámara de Diputados", "ñandú"]}
+
+FRASES = ["La presidenta Shainbaum habló con Marcelo Ebrar en Tlatelolko.",
+          "el senado de zacatecaz y la camara de diputados",
+          "Lopez obrador visitó Oaxaka y la ciudad de mexico",
+          "un nandu en morena"]
+
+
+@pytest.fixture
+def vocabulario(tmp_path):
+    ruta = tmp_path / "palabras.json"
+    ruta.write_text(json.dumps(PALABRAS, ensure_ascii=False), encoding="utf-8")
+    configurar_cache_correcciones()
+    yield str(ruta)
+    configurar_cache_correcciones()
+
+
+def palabras():
+    return {w for lista in PALABRAS.values() for w in lista}
+
+
+def test_el_indice_compilado_da_los_mismos_datos_que_en_memoria(vocabulario):
+    compilar_indice(vocabulario)
+    indice = abrir_indice(ruta_indice_por_defecto(vocabulario))
+    assert indice.compatible and indice.vigente(vocabulario)
+    cargados = indice.datos_correccion()
+    esperados = crear_datos_precalculados(palabras())
+
+    for clave in ("set_palabras_correctas", "hash_vocabulario", "trie_frases"):
+        assert cargados[clave] == esperados[clave]
+    assert {k: sorted(v) for k, v in cargados["indice_fonetico"].items()} == \
+           {k: sorted(v) for k, v in esperados["indice_fonetico"].items()}
+    # El índice guarda las listas ordenadas; en memoria siguen el orden del set
+    assert sorted(zip(*cargados["listas_palabras_correctas"])) == \
+           sorted(zip(*esperados["listas_palabras_correctas"]))
+
+    # Las posiciones apuntan a las listas de cada uno: se comparan por la palabra a la que apuntan
+    difuso, esperado = cargados["indice_difuso"], esperados["indice_difuso"]
+    assert difuso["alfabeto"] == esperado["alfabeto"]
+    assert {p: cargados["listas_palabras_correctas"][0][i] for p, i in difuso["posiciones"].items()} == \
+           {p: esperados["listas_palabras_correctas"][0][i] for p, i in esperado["posiciones"].items()}
+    assert difuso["grupos"].keys() == esperado["grupos"].keys()
+    for longitud, (grupo, conteos) in esperado["grupos"].items():
+        compilado = dict(zip(difuso["grupos"][longitud][0], difuso["grupos"][longitud][1].tolist()))
+        assert compilado == dict(zip(grupo, conteos.tolist()))
+
+def test_corrige_igual_con_el_indice_compilado(vocabulario):
+    en_memoria = crear_datos_precalculados(palabras())
+    esperadas = [corregir_texto(frase, en_memoria, 0.7) for frase in FRASES]
+    configurar_cache_correcciones()
+    desde_indice = cargar_vocabulario(vocabulario)
+    assert [corregir_texto(frase, desde_indice, 0.7) for frase in FRASES] == esperadas
+    assert any("(corregida)" in texto for texto in esperadas)
+
+
+def test_se_recompila_si_cambia_el_json(vocabulario):
+    cargar_vocabulario(vocabulario)
+    with open(vocabulario, "w", encoding="utf-8") as f:
+        json.dump({"lugares": ["Tlatelolco", "Querétaro"]}, f, ensure_ascii=False)
+    assert not abrir_indice(ruta_indice_por_defecto(vocabulario)).vigente(vocabulario)
+    assert cargar_vocabulario(vocabulario)["set_palabras_correctas"] == {"Tlatelolco", "Querétaro"}
+    assert abrir_indice(ruta_indice_por_defecto(vocabulario)).vigente(vocabulario)
+
+
+def test_sigue_vigente_si_solo_cambia_la_fecha(vocabulario):
+    cargar_vocabulario(vocabulario)
+    os.utime(vocabulario, ns=(0, 0))
+    assert abrir_indice(ruta_indice_por_defecto(vocabulario)).vigente(vocabulario)
+
+
+def test_indice_corrupto_u_obsoleto_se_recompila(vocabulario):
+    ruta = ruta_indice_por_defecto(vocabulario)
+    cargar_vocabulario(vocabulario)
+    with open(ruta, "r+b") as f:
+        f.write(b"BASURA!!")
+    assert abrir_indice(ruta) is None
+    assert cargar_vocabulario(vocabulario)["hash_vocabulario"] == crear_datos_precalculados(
+        palabras())["hash_vocabulario"]
+
+    with open(ruta, "r+b") as f:
+        f.seek(8)
+        f.write((VERSION_INDICE + 1).to_bytes(4, "little"))
+    assert not abrir_indice(ruta).compatible
+    cargar_vocabulario(vocabulario)
+    assert abrir_indice(ruta).compatible
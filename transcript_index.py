@@ -0,0 +1,313 @@
+import argparse
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from sinks import Sink, format_timestamp
+from utils import MARCA_CORREGIDA, normalizar_palabra, setup_logging, _PATRON_PALABRA
+
+logger = logging.getLogger(__name__)
+
+# Versión del esquema de la base de datos
+SCHEMA_VERSION = 1
+
+# Subtítulos que se escriben en una misma transacción, y espera máxima para confirmarlos
+COMMIT_SIZE = 256
+COMMIT_INTERVAL = 2.0
+
+# Segundos que se espera a que otro proceso (otro stream) termine de escribir en el mismo índice
+BUSY_TIMEOUT = 60.0
+
+# Resultados por defecto de una búsqueda
+SEARCH_LIMIT = 20
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS streams (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    stream_id INTEGER NOT NULL REFERENCES streams(id),
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    text TEXT NOT NULL,
+    speaker TEXT,
+    words TEXT,
+    indexed_at REAL NOT NULL,
+    UNIQUE (stream_id, start)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(text, tokenize='unicode61 remove_diacritics 0');
+PRAGMA user_version = {SCHEMA_VERSION};
+"""
+
+
+def normalize_text(text):
+    """Texto tal como se indexa y se busca: palabras normalizadas con normalizar_palabra, sin la marca (corregida)."""
+    words = _PATRON_PALABRA.findall(text.replace(MARCA_CORREGIDA, " "))
+    return " ".join(normalizar_palabra(word) for word in words)
+
+
+def connect(path):
+    """Abre (o crea) el índice. En modo WAL las búsquedas no esperan a la escritura en curso."""
+    # Transacciones explícitas (ver TranscriptIndex.begin)
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(_SCHEMA)
+    return db
+
+
+class TranscriptIndex:
+    """Índice de búsqueda de las transcripciones en SQLite (FTS5).
+
+    Cada segmento se guarda con su stream y su tiempo en el medio, y su texto normalizado
+    con normalizar_palabra (minúsculas y sin tildes) en una tabla FTS5. Volver a indexar el
+    mismo segmento (mismo stream e inicio), p. ej. al repetir una transcripción, lo sustituye.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = connect(path)
+        self._streams = {}
+
+    def stream_id(self, name):
+        if name not in self._streams:
+            self._db.execute("INSERT OR IGNORE INTO streams (name, created_at) VALUES (?, ?)", (name, time.time()))
+            self._streams[name] = self._db.execute("SELECT id FROM streams WHERE name = ?", (name,)).fetchone()[0]
+        return self._streams[name]
+
+    def begin(self):
+        """Empieza una transacción reservando ya la escritura: varios transcriptores pueden compartir el índice."""
+        self._db.execute("BEGIN IMMEDIATE")
+
+    def add(self, stream, caption):
+        """Indexa un subtítulo final dentro de la transacción en curso (ver begin y commit)."""
+        stream_id = self.stream_id(stream)
+        previous = self._db.execute("SELECT id FROM segments WHERE stream_id = ? AND start = ?",
+                                    (stream_id, round(caption.start, 3))).fetchone()
+        if previous:
+            self._db.execute("DELETE FROM segments_fts WHERE rowid = ?", previous)
+            self._db.execute("DELETE FROM segments WHERE id = ?", previous)
+        words = [[round(start, 3), round(end, 3), word] for start, end, word in caption.words]
+        segment_id = self._db.execute(
+            "INSERT INTO segments (stream_id, start, end, text, speaker, words, indexed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (stream_id, round(caption.start, 3), round(caption.end, 3), caption.text, caption.speaker,
+             json.dumps(words, ensure_ascii=False) if words else None, time.time())).lastrowid
+        self._db.execute("INSERT INTO segments_fts (rowid, text) VALUES (?, ?)",
+                         (segment_id, normalize_text(caption.text)))
+
+    def commit(self):
+        self._db.execute("COMMIT")
+
+    @property
+    def in_transaction(self):
+        return self._db.in_transaction
+
+    def rollback(self):
+        self._db.execute("ROLLBACK")
+
+    def close(self):
+        if self._db.in_transaction:
+            self.commit()
+        self._db.close()
+
+
+def query_tokens(terms):
+    """Palabras buscadas, normalizadas como el índice: [(palabra, si es un prefijo)]."""
+    return [(normalized, word.endswith("*")) for term in terms for word in term.split()
+            for normalized in [normalize_text(word)] if normalized]
+
+
+def build_query(terms, phrase=False):
+    """Consulta FTS5 a partir de lo que escribe el usuario, normalizado como el índice.
+
+    Cada palabra va entre comillas (la sintaxis de FTS5 no se interpreta); `palabra*` busca
+    por prefijo. Por defecto tienen que aparecer todas; con `phrase`, seguidas.
+    """
+    tokens = query_tokens(terms)
+    if not tokens:
+        return None
+    if phrase:
+        return '"' + " ".join(token for token, _ in tokens) + '"' + ("*" if tokens[-1][1] else "")
+    return " ".join(f'"{token}"' + ("*" if prefix else "") for token, prefix in tokens)
+
+
+def term_time(words, tokens, start):
+    """Instante del medio en que se dice el primer término buscado, con las marcas por palabra si las hay."""
+    for word_start, _, word in words or []:
+        normalized = normalize_text(word)
+        if any(normalized == token or (prefix and normalized.startswith(token)) for token, prefix in tokens):
+            return word_start
+    return start
+
+
+def search(path, terms, phrase=False, stream=None, limit=SEARCH_LIMIT, relevance=False):
+    """Busca en el índice. Devuelve [{stream, start, end, time, text, speaker, indexed_at}].
+
+    Por defecto, los más recientes primero: FTS5 los recorre en orden y se detiene en `limit`,
+    así que una palabra muy frecuente cuesta lo mismo que una rara. Con `relevance` se ordenan
+    por bm25, que tiene que puntuar todas las coincidencias.
+    """
+    query = build_query(terms, phrase)
+    if query is None:
+        return []
+    tokens = query_tokens(terms)
+    sql = ("SELECT streams.name, segments.start, segments.end, segments.text, segments.speaker, segments.words, "
+           "segments.indexed_at FROM segments_fts "
+           "JOIN segments ON segments.id = segments_fts.rowid JOIN streams ON streams.id = segments.stream_id "
+           "WHERE segments_fts MATCH ?")
+    params = [query]
+    if stream:
+        sql += " AND streams.name LIKE ?"
+        params.append(f"%{stream}%")
+    sql += " ORDER BY rank LIMIT ?" if relevance else " ORDER BY segments_fts.rowid DESC LIMIT ?"
+    params.append(limit)
+
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = db.execute(sql, params).fetchall()
+    finally:
+        db.close()
+    return [{"stream": name, "start": start, "end": end, "time": term_time(json.loads(words or "[]"), tokens, start),
+             "text": text, "speaker": speaker, "indexed_at": indexed_at}
+            for name, start, end, text, speaker, words, indexed_at in rows]
+
+
+def list_streams(path):
+    """Streams indexados: [{stream, segments, duration, first, last}]."""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = db.execute("SELECT streams.name, COUNT(segments.id), MAX(segments.end), MIN(segments.indexed_at), "
+                          "MAX(segments.indexed_at) FROM streams LEFT JOIN segments ON segments.stream_id = streams.id "
+                          "GROUP BY streams.id ORDER BY streams.created_at").fetchall()
+    finally:
+        db.close()
+    return [{"stream": name, "segments": count, "duration": duration or 0.0, "first": first, "last": last}
+            for name, count, duration, first, last in rows]
+
+
+class IndexSink(Sink):
+    """Destino que añade cada subtítulo final al índice de búsqueda `path` (ver TranscriptIndex).
+
+    SQLite escribe desde un hilo propio, en transacciones de hasta COMMIT_SIZE subtítulos o
+    COMMIT_INTERVAL segundos, así que confirmar en disco no frena al resto de destinos.
+    `stream` identifica el stream en el índice (la URL, salvo que se indique `ruta#nombre`).
+    El índice se abre al crear el destino, así que una ruta no válida falla en el momento
+    (sqlite3.Error); si el hilo termina por un error, los subtítulos se descartan en lugar
+    de acumularse en la cola.
+    """
+
+    def __init__(self, path, stream=None):
+        path, _, name = path.partition("#")
+        self.path = path
+        self.stream = name or stream or "default"
+        self._index = TranscriptIndex(path)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="indice", daemon=True)
+        self._thread.start()
+        logger.info(f"[Índice] Indexando {self.stream} en {self.path}")
+
+    def write(self, caption):
+        if caption.final and caption.text.strip() and self._thread.is_alive():
+            self._queue.put(caption)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(30)
+
+    def _run(self):
+        index = self._index
+        indexed = 0
+        stop = False
+        try:
+            while not stop:
+                batch = []
+                deadline = time.monotonic() + COMMIT_INTERVAL
+                while len(batch) < COMMIT_SIZE:
+                    try:
+                        caption = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if caption is None:
+                        stop = True
+                        break
+                    batch.append(caption)
+                if batch:
+                    indexed += self._write(index, batch)
+        except Exception as e:
+            logger.error(f"[Índice] Indexación de {self.stream} interrumpida; no se indexará nada más: {e}")
+        finally:
+            index.close()
+            logger.info(f"[Índice] {indexed} segmentos de {self.stream} indexados en {self.path}")
+
+    def _write(self, index, batch):
+        """Indexa un lote en una sola transacción. Devuelve los segmentos indexados."""
+        try:
+            index.begin()
+            for caption in batch:
+                index.add(self.stream, caption)
+            index.commit()
+            return len(batch)
+        except sqlite3.Error as e:
+            logger.error(f"[Índice] Error indexando {len(batch)} segmentos desde {batch[0].start:.1f} s: {e}")
+            if index.in_transaction:
+                index.rollback()
+            return 0
+
+
+def main(argv=None, prog=None):
+    """Punto de entrada de la línea de comandos (también `cli.py index`)."""
+
+    parser = argparse.ArgumentParser(prog=prog, description='Búsqueda en el índice de transcripciones '
+                                                            '(--sink index:transcripciones.db).')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    buscar = subparsers.add_parser('search', help='Busca palabras en todas las transcripciones indexadas')
+    buscar.add_argument('index', type=str, help='Base de datos del índice')
+    buscar.add_argument('terms', type=str, nargs='+',
+                        help='Palabras a buscar (sin distinguir mayúsculas ni tildes; palabra* por prefijo)')
+    buscar.add_argument('--phrase', action='store_true', help='Las palabras tienen que aparecer seguidas')
+    buscar.add_argument('--stream', type=str, default=None, help='Solo los streams cuyo nombre contiene este texto')
+    buscar.add_argument('--limit', type=int, default=SEARCH_LIMIT, help='Número máximo de resultados')
+    buscar.add_argument('--relevance', action='store_true',
+                        help='Ordenar por relevancia en lugar de los más recientes primero (más lento)')
+    buscar.add_argument('--json', action='store_true', help='Resultados como JSON, uno por línea')
+
+    streams = subparsers.add_parser('streams', help='Lista los streams indexados')
+    streams.add_argument('index', type=str, help='Base de datos del índice')
+
+    parser.add_argument('--debug', action='store_true', help='Activar modo debug')
+    args = parser.parse_args(argv)
+    setup_logging(args.debug)
+
+    try:
+        if args.comando == 'search':
+            started = time.perf_counter()
+            results = search(args.index, args.terms, args.phrase, args.stream, args.limit, args.relevance)
+            elapsed = time.perf_counter() - started
+            for result in results:
+                if args.json:
+                    print(json.dumps(result, ensure_ascii=False))
+                    continue
+                speaker = f"{result['speaker']}: " if result["speaker"] else ""
+                print(f"{result['stream']} [{format_timestamp(result['time'], '.')[:-4]}] {speaker}{result['text']}")
+            logger.debug(f"[Índice] {len(results)} resultados en {elapsed * 1000:.1f} ms")
+        else:
+            for stream in list_streams(args.index):
+                last = datetime.fromtimestamp(stream["last"]).strftime("%Y-%m-%d %H:%M") if stream["last"] else "-"
+                print(f"{stream['stream']}: {stream['segments']} segmentos, "
+                      f"{format_timestamp(stream['duration'], '.')[:-4]} de audio (último {last})")
+    except sqlite3.Error as e:
+        logger.error(f"[Índice] Error leyendo {args.index}: {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,106 @@
-import whisper
-import subprocess
 import threading
 import queue
-import numpy as np
 import argparse
+import logging
+import time
 from datetime import datetime
-from utils import get_audio_stream_url, load_correct_words, corregir_texto, setup_logging
+from utils import load_correct_words, setup_logging, configurar_cache_correcciones
+from correccion import corregir_textos
+from capture import MAX_RECONNECTS, capture_stream
+from checkpoint import CHECKPOINT_INTERVAL, Checkpoint, CheckpointSink
+from language import DETECT_SECONDS, RECHECK_SECONDS, LanguageTracker
+from inference import InferencePool, INFERENCE_BACKENDS, get_inference_backend, preload_inference_backend
+from vad import VAD_BACKENDS
+from metrics import REGISTRY, start_metrics
+from overload import OVERLOAD_POLICIES, ModelDowngrader, OverloadQueue
+from partial import PartialTranscriber
+from fingerprint import DEDUP_WAIT, DEDUP_WINDOW, SimulcastDedup
+from sinks import SINKS, Caption, SinkWriter, TextSink, create_sink, segment_words
+
+# Logger del transcriptor (setup_logging lo configura al ejecutar el script)
+logger = logging.getLogger("youtube_transcriptor")
 
 # Variable global para controlar la terminación ordenada
 shutdown_event = threading.Event()
 
-# Cola para comunicación entre hilos
-audio_queue = queue.Queue()
-transcription_queue = queue.Queue()
-correction_queue = queue.Queue()
+# Métricas de las etapas del pipeline
+correction_seconds = REGISTRY.summary("correction_seconds", "Tiempo de corrección de cada texto")
+latency_seconds = REGISTRY.summary("latency_seconds", "Latencia desde la captura del chunk hasta la salida")
+dropped_chunks = REGISTRY.counter("dropped_chunks_total", "Chunks capturados que no llegaron a transcribirse")
 
-def stream_audio_from_youtube(youtube_url, chunk_size=10):
-    """Captura el audio de YouTube y lo coloca en chunks en la cola."""
-    
-    # Obtener la URL del stream de audio
-    try:
-        stream_url = get_audio_stream_url(youtube_url)
-    except Exception as e:
-        logger.error(f"[Stream] Error obteniendo la URL del stream: {e}")
-        shutdown_event.set()
-        return
-    
-    # Usar FFmpeg para procesar el stream en tiempo real
-    cmd = [
-        'ffmpeg', 
-        '-loglevel', 'quiet',  # Silenciar la salida de FFmpeg
-        '-i', stream_url, 
-        '-vn',  # Sin video
-        '-acodec', 'pcm_s16le',  # Audio en formato PCM de 16 bits
-        '-f', 'wav',
-        '-ar', '16000',
-        '-ac', '1',
-        '-'
-    ]
-    process = None
-    try:    
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        
-        chunk_samples = 16000 * chunk_size  # Tamaño del chunk en segundos a 16kHz
-        while not shutdown_event.is_set():
-            chunk = process.stdout.read(chunk_samples * 2)  # 16-bit = 2 bytes por muestra
-            if not chunk:
-                audio_queue.put(None)
-                logger.info("[Stream] Fin del stream normalmente.")
-                break
+# Textos que el hilo de corrección corrige juntos como mucho, si se han acumulado en la cola
+MAX_CORRECTION_BATCH = 32
 
-            # Convertir a numpy array para procesamiento
-            audio_data = np.frombuffer(chunk, np.int16).astype(np.float32) / 32768.0
-            audio_queue.put(audio_data)
-                            
-    except Exception as e:
-            logger.error(f"[Stream] Error capturando audio: {e}")
-            shutdown_event.set()  # Señalar a otros hilos que deben terminar
-    
-    finally:
-        if shutdown_event.is_set():
-            logger.info("[Stream] Finalizando captura de audio por señal de cierre.")
-                    
-        if process:
-            logger.info("[Stream] Cerrando proceso de audio.")
-            try:
-                process.terminate()
-                process.wait(5)
-            except subprocess.TimeoutExpired:
-                process.kill()
-            except Exception as e:
-                logger.error(f"[Stream] Error cerrando proceso: {e}")
+
+def configure_queues(max_queue=20, overload_policy="block"):
+    """Acota las colas entre hilos a `max_queue` elementos; con la de audio llena se aplica `overload_policy`."""
+    global audio_queue, transcription_queue, correction_queue
+    audio_queue = OverloadQueue(max_queue, overload_policy, shutdown_event)
+    transcription_queue = queue.Queue(max_queue)
+    correction_queue = queue.Queue(max_queue)
+    for name, q in (("audio", audio_queue), ("transcription", transcription_queue), ("correction", correction_queue)):
+        REGISTRY.gauge("queue_depth", "Elementos pendientes en cada cola", function=q.qsize, queue=name)
+
+
+# Colas para comunicación entre hilos (transcribe_live_stream las acota según la línea de comandos)
+configure_queues(0)
+
+
+def put_until_shutdown(q, item):
+    """Encola `item` esperando si la cola está llena, salvo que se cierre el pipeline."""
+    while not shutdown_event.is_set():
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def stream_audio_from_youtube(youtube_url, chunk_size=10, overlap=0.0, vad=None, vad_min_silence=0.5,
+                              position=0.0, disconnected_at=None, max_reconnects=MAX_RECONNECTS, dedup=None):
+    """Captura el audio de YouTube y lo coloca en ventanas solapadas (o segmentos de voz si hay VAD) en la cola.
+
+    Se reconecta si el stream se corta; `position` y `disconnected_at` vienen del checkpoint al reanudar.
+    Con `dedup`, el fingerprint de cada chunk se registra para compartirlo con otros streams.
+    """
+    capture_stream(youtube_url, audio_queue, shutdown_event, chunk_size, overlap, vad, vad_min_silence,
+                   position=position, disconnected_at=disconnected_at, max_reconnects=max_reconnects, dedup=dedup)
         
 
-def transcription_worker(model_size="small", language=None):
-    """Procesa los chunks de audio y genera transcripciones."""
-    model = whisper.load_model(model_size)
+def transcription_worker(model_size="small", language=None, overlap=0.0, use_context=True, workers=1, batch_size=1,
+                         model_dir=None, backend="whisper", prompt="", detect_seconds=DETECT_SECONDS,
+                         recheck_seconds=RECHECK_SECONDS, dedup=None):
+    """Reparte los chunks de audio entre los hilos de inferencia y publica las transcripciones en orden.
+
+    Sin `language`, el idioma se detecta en los primeros `detect_seconds` de voz y se fija (ver LanguageTracker).
+    Con `dedup`, los chunks que otro stream ya ha transcrito reutilizan su transcripción.
+    """
+    engine = get_inference_backend(backend, model_size, model_dir=model_dir)
+    languages = LanguageTracker(engine, language, detect_seconds, recheck_seconds)
+
+    def publish(text, chunk, segments):
+        languages.feedback(segments)
+        start, end = (segments[0]["start"], segments[-1]["end"]) if segments else (chunk.start, chunk.end)
+        caption = Caption(text, start, end, True, segment_words(segments),
+                          timestamp=datetime.now().strftime("%H:%M:%S"), captured_at=chunk.captured_at)
+        put_until_shutdown(transcription_queue, caption)
+
+    pool = InferencePool(engine, workers, batch_size, language, overlap, use_context,
+                         on_result=publish, shutdown_event=shutdown_event, prompt=prompt, dedup=dedup)
+    if audio_queue.policy == "downgrade":
+        audio_queue.adapt = ModelDowngrader(pool, backend, model_size, model_dir)
     while not shutdown_event.is_set(): # Hay datos en la cola pero se ha recibido una señal de cierre
         try:
-            audio_data = audio_queue.get(timeout=1)
-            if audio_data is None:
-                transcription_queue.put((None, ""))
+            chunk = audio_queue.get(timeout=1)
+            if chunk is None:
+                pool.close()  # Esperar a que se transcriban los chunks pendientes
+                put_until_shutdown(transcription_queue, None)
                 logger.info("[Transcripción] Fin de la cola de audio.")
                 break  # Terminar si se recibe None
 
-            result = model.transcribe(audio_data, language=language)
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            transcription_queue.put((timestamp, result["text"]))
+            pool.language = languages.observe(chunk)
+            pool.submit(chunk)
             
         except queue.Empty:
             # Si no hay datos pero no es shutdown, continuar esperando
@@ -102,31 +116,101 @@ def transcription_worker(model_size="small", language=None):
 
     if shutdown_event.is_set():
         logger.info("[Transcripción] Finalizando por señal de cierre.")
+        pending = audio_queue.qsize()
+        if pending:
+            dropped_chunks.inc(pending)
+            logger.warning(f"[Transcripción] {pending} chunks pendientes descartados.")
+    languages.log_stats()
+    if dedup:
+        dedup.log_stats(engine.stats.real_time_factor)
     
   
 
-def correct_transcriptions(input_file=None):
-    """Corrige las transcripciones en la cola."""
+def partial_transcription_worker(model_size="small", language=None, use_context=True, interval=1.0, max_buffer=10.0,
+                                 model_dir=None, backend="whisper", prompt="", detect_seconds=DETECT_SECONDS,
+                                 recheck_seconds=RECHECK_SECONDS):
+    """Transcribe el audio cada `interval` segundos y publica resultados provisionales y definitivos."""
+    engine = get_inference_backend(backend, model_size, model_dir=model_dir)
+    languages = LanguageTracker(engine, language, detect_seconds, recheck_seconds)
+
+    def publish(caption):
+        caption.timestamp = datetime.now().strftime("%H:%M:%S")
+        put_until_shutdown(transcription_queue, caption)
+
+    transcriber = PartialTranscriber(engine, language, interval, max_buffer, use_context, on_event=publish,
+                                     prompt=prompt)
+    while not shutdown_event.is_set():
+        try:
+            chunk = audio_queue.get(timeout=1)
+            if chunk is None:
+                transcriber.finish()
+                put_until_shutdown(transcription_queue, None)
+                logger.info("[Transcripción] Fin de la cola de audio.")
+                break
+
+            transcriber.language = languages.observe(chunk)
+            transcriber.push(chunk)
+
+        except queue.Empty:
+            continue
+
+        except Exception as e:
+            logger.error(f"[Transcripción] Error en transcripción: {e}")
+            shutdown_event.set()
+            break
+
+    if shutdown_event.is_set():
+        logger.info("[Transcripción] Finalizando por señal de cierre.")
+    languages.log_stats()
+
+
+def correct_transcriptions(input_file=None, cache_size=100000, cache_file=None):
+    """Corrige las transcripciones en la cola.
+
+    Los textos que se acumulan mientras se corrige se corrigen juntos (corregir_textos): cada
+    palabra distinta del lote se busca una sola vez.
+    """
     if input_file is None:
         datos_correccion = None
     else:
         datos_correccion = load_correct_words(input_file)
+    cache = configurar_cache_correcciones(cache_size, cache_file)
+    corregidos = 0
 
     while not shutdown_event.is_set():
         try:
-            timestamp, text = transcription_queue.get(timeout=1)
-            if timestamp is None:
-                correction_queue.put((None, ""))
-                logger.info(f"[Corrección] Corrección finalizada normalmente.")
-                break  # Terminar si se recibe None
-            
-            if datos_correccion:
-                # Usar la función optimizada de corrección
-                corrected_text = corregir_texto(text.strip(), datos_correccion, umbral=0.7)
-                correction_queue.put((timestamp, corrected_text))
+            lote = [transcription_queue.get(timeout=1)]
+            # Juntar lo que ya espera en la cola, sin esperar a que llegue más
+            while lote[-1] is not None and len(lote) < MAX_CORRECTION_BATCH:
+                try:
+                    lote.append(transcription_queue.get_nowait())
+                except queue.Empty:
+                    break
+            fin = lote[-1] is None
+            captions = lote[:-1] if fin else lote
+
+            if datos_correccion and captions:
+                # Corrección por lotes: una búsqueda por palabra distinta
+                started = time.perf_counter()
+                textos = corregir_textos([caption.text.strip() for caption in captions], datos_correccion, umbral=0.7)
+                elapsed = time.perf_counter() - started
+                for caption, texto in zip(captions, textos):
+                    caption.text = texto
+                    correction_seconds.observe(elapsed / len(captions))
+                if (corregidos + len(captions)) // 100 > corregidos // 100:
+                    cache.registrar_estadisticas(logger, logging.DEBUG)
+                corregidos += len(captions)
             else:
                 # Sin corrección, pasar el texto tal como está
-                correction_queue.put((timestamp, text.strip()))
+                for caption in captions:
+                    caption.text = caption.text.strip()
+            for caption in captions:
+                put_until_shutdown(correction_queue, caption)
+
+            if fin:
+                put_until_shutdown(correction_queue, None)
+                logger.info(f"[Corrección] Corrección finalizada normalmente.")
+                break  # Terminar si se recibe None
             
         except queue.Empty:
              # Si no hay datos pero no es shutdown, continuar esperando
@@ -143,21 +227,56 @@ def correct_transcriptions(input_file=None):
     if shutdown_event.is_set():        
         logger.info("[Corrección] Finalizando por señal de cierre.")
 
-def output_worker(output_file="transcripcion.txt"):
-    """Muestra las transcripciones a medida que están disponibles."""
-    with open(output_file, "a", encoding="utf-8") as f:
+    if datos_correccion:
+        cache.registrar_estadisticas(logger)
+    cache.cerrar()
+
+def output_worker(output_file="transcripcion.txt", sinks=(), checkpoint=None, stream=None):
+    """Muestra las transcripciones a medida que están disponibles y las reparte entre los destinos.
+
+    El fichero de texto `output_file` siempre se escribe; `sinks` son destinos extra en formato
+    `tipo:destino` (JSONL, SRT, WebVTT, difusión HTTP). Lo provisional solo se ve en la consola
+    y en los destinos que lo piden. Con `checkpoint` (CheckpointSink), se guarda el punto de
+    reanudación y se descarta lo que ya se escribió antes de reanudar. `stream` (la URL)
+    identifica la transcripción en los destinos que la guardan, como el índice de búsqueda.
+    """
+    partial_shown = False
+    resumed_at = checkpoint.checkpoint.position if checkpoint else 0.0
+    try:
+        extra = [create_sink(spec, stream=stream) for spec in sinks]
+    except Exception as e:
+        logger.error(f"[Salida] No se pudo crear un destino: {e}")
+        shutdown_event.set()
+        return
+    if checkpoint:
+        checkpoint.track(extra)
+    writer = SinkWriter([TextSink(output_file)] + extra + ([checkpoint] if checkpoint else []))
+    try:
         while not shutdown_event.is_set():
             try:
-                timestamp, text = correction_queue.get(timeout=1)
-                if timestamp is None:
+                caption = correction_queue.get(timeout=1)
+                if caption is None:
                     logger.info(f"[Salida] Salida finalizada normalmente.")
                     break  # Terminar si se recibe None 
+
+                if caption.end <= resumed_at:
+                    continue  # Ya escrito antes de reanudar
+
+                writer.publish(caption)
+                if not caption.final:
+                    # Texto provisional: se reescribe en la misma línea de la consola
+                    print(f"\r\x1b[2K[{caption.timestamp}]~ {caption.text}", end="", flush=True)
+                    partial_shown = bool(caption.text)
+                    continue
+
+                if caption.captured_at:
+                    latency_seconds.observe(time.monotonic() - caption.captured_at)
                 
-                if text.strip():
-                    output = f"[{timestamp}]: {text}"
-                    print(output)
-                    f.write(output + "\n")
-                    f.flush()
+                if caption.text.strip():
+                    if partial_shown:
+                        print("\r\x1b[2K", end="")
+                        partial_shown = False
+                    print(f"[{caption.timestamp}]: {caption.text}")
                 
             except queue.Empty:
                  # Si no hay datos pero no es shutdown, continuar esperando
@@ -173,22 +292,86 @@ def output_worker(output_file="transcripcion.txt"):
 
         if shutdown_event.is_set():
             logger.info("[Salida] Finalizando por señal de cierre.")
+    finally:
+        writer.close()  # Escribe lo que quede en el último lote
 
 def transcribe_live_stream(youtube_url, model_size="small", language="es", output_file="transcripcion.txt", 
-                           chunk_size=10, correct_words=None):
-    """Inicia los hilos para transcribir un stream en vivo."""
+                           chunk_size=10, correct_words=None, overlap=0.0, use_context=True,
+                           vad=None, vad_min_silence=0.5, workers=1, batch_size=1,
+                           cache_size=100000, cache_file=None, model_dir=None, backend="whisper",
+                           max_queue=20, overload_policy="block", partial_interval=0.0, sinks=(),
+                           checkpoint_file=None, checkpoint_interval=CHECKPOINT_INTERVAL, max_reconnects=MAX_RECONNECTS,
+                           detect_seconds=DETECT_SECONDS, recheck_seconds=RECHECK_SECONDS,
+                           dedup_file=None, dedup_window=DEDUP_WINDOW, dedup_wait=DEDUP_WAIT):
+    """Inicia los hilos para transcribir un stream en vivo.
+
+    Con `partial_interval`, el audio se transcribe cada ese número de segundos con resultados
+    provisionales, y `chunk_size` pasa a ser el máximo de audio sin confirmar que se vuelve a decodificar.
+    Con `checkpoint_file`, se guarda periódicamente el punto de reanudación y, si ya existe
+    uno del mismo stream, la transcripción continúa donde se quedó. Con `dedup_file`, los
+    transcriptores que lo comparten reutilizan la transcripción del audio que emiten igual
+    (ver SimulcastDedup).
+    """
+    configure_queues(max_queue, overload_policy)
+
+    checkpoint = None
+    if checkpoint_file:
+        checkpoint = Checkpoint.load(checkpoint_file)
+        if checkpoint and checkpoint.url != youtube_url:
+            logger.warning(f"[Checkpoint] {checkpoint_file} es de otro stream ({checkpoint.url}); "
+                           f"se empieza desde el principio.")
+            checkpoint = None
+        if checkpoint:
+            logger.info(f"[Checkpoint] Reanudando en el segundo {checkpoint.position:.1f} "
+                        f"({checkpoint.captions} textos ya escritos).")
+            checkpoint.truncate_output(output_file)
+        else:
+            checkpoint = Checkpoint(youtube_url)
+    resume = checkpoint or Checkpoint(youtube_url)
+    prompt = resume.prompt if use_context else ""
+
+    # El modelo se carga en segundo plano mientras se resuelve el stream y conecta FFmpeg
+    preload_inference_backend(backend, model_size, model_dir=model_dir)
+
+    if vad and overlap:
+        logger.warning("[SISTEMA] Con VAD los segmentos no se solapan; se ignora --overlap.")
+        overlap = 0.0
+
+    dedup = None
+    if dedup_file:
+        if partial_interval:
+            logger.warning("[SISTEMA] Con resultados parciales no se reutilizan transcripciones; se ignora --dedup.")
+        else:
+            dedup = SimulcastDedup(dedup_file, dedup_window, dedup_wait)
+
+    if partial_interval:
+        if vad or overlap:
+            logger.warning("[SISTEMA] Con resultados parciales el audio se transcribe de forma continua; "
+                           "se ignoran --vad y --overlap.")
+        # Bloques de partial_interval segundos; el transcriptor acumula hasta chunk_size sin confirmar
+        capture_args = (youtube_url, partial_interval, 0.0, None, vad_min_silence)
+        transcription_target = partial_transcription_worker
+        transcription_args = (model_size, language, use_context, partial_interval, chunk_size, model_dir, backend,
+                              prompt, detect_seconds, recheck_seconds)
+    else:
+        capture_args = (youtube_url, chunk_size, overlap, vad, vad_min_silence)
+        transcription_target = transcription_worker
+        transcription_args = (model_size, language, overlap, use_context, workers, batch_size, model_dir, backend,
+                              prompt, detect_seconds, recheck_seconds, dedup)
+    capture_args += (resume.position, resume.captured_at, max_reconnects, dedup)
+
     # Iniciar hilo para capturar audio
     audio_thread = threading.Thread(
         target=stream_audio_from_youtube, 
-        args=(youtube_url, chunk_size)
+        args=capture_args
     )
     audio_thread.daemon = True
     audio_thread.start()
     
     # Iniciar hilo para transcripción
     transcription_thread = threading.Thread(
-        target=transcription_worker,
-        args=(model_size, language)
+        target=transcription_target,
+        args=transcription_args
     )
     transcription_thread.daemon = True
     transcription_thread.start()
@@ -196,7 +379,7 @@ def transcribe_live_stream(youtube_url, model_size="small", language="es", outpu
     # Iniciar hilo para corrección de transcripciones
     correction_thread = threading.Thread(
         target=correct_transcriptions,
-        args=(correct_words,)
+        args=(correct_words, cache_size, cache_file)
     )
     correction_thread.daemon = True
     correction_thread.start()
@@ -204,7 +387,9 @@ def transcribe_live_stream(youtube_url, model_size="small", language="es", outpu
     # Iniciar hilo para mostrar resultados
     output_thread = threading.Thread(
         target=output_worker,
-        args=(output_file,)
+        args=(output_file, sinks,
+              CheckpointSink(checkpoint_file, checkpoint, output_file, checkpoint_interval) if checkpoint else None,
+              youtube_url)
     )
     output_thread.daemon = True
     output_thread.start()
@@ -236,40 +421,124 @@ def transcribe_live_stream(youtube_url, model_size="small", language="es", outpu
                     logger.warning(f"[SISTEMA] Advertencia: El hilo {thread.name} no terminó en el tiempo esperado.")
                     raise RuntimeError(f"Hilo {thread.name} no terminó en el tiempo esperado.")
         
+        if dedup:
+            dedup.close()
+
         # Confirmar cierre ordenado
         logger.info("[SISTEMA] Cierre ordenado completado.")
 
-if __name__ == "__main__":
+def main(argv=None, prog=None):
+    """Punto de entrada de la línea de comandos (también `cli.py whisper`)."""
     
-    parser = argparse.ArgumentParser(description='Transcribe YouTube live streams en tiempo real.')
+    parser = argparse.ArgumentParser(prog=prog, description='Transcribe YouTube live streams en tiempo real.')
     parser.add_argument('--url', type=str, required=True,
                         help='URL del stream de YouTube a transcribir')
     parser.add_argument('--model', type=str, default="small", choices=["tiny", "base", "small", "medium", "large"],
                         help='Tamaño del modelo de Whisper a utilizar')
     parser.add_argument('--language', type=str, default=None,
                         help='Código de idioma para la transcripción (ej: es, en, fr)')
+    parser.add_argument('--language-detect-seconds', type=float, default=DETECT_SECONDS,
+                        help='Sin --language, segundos de voz con los que se detecta el idioma antes de fijarlo')
+    parser.add_argument('--language-recheck-seconds', type=float, default=RECHECK_SECONDS,
+                        help='Segundos de audio entre comprobaciones del idioma detectado')
     parser.add_argument('--output', type=str, default="transcripcion.txt",
                         help='Archivo de salida para guardar la transcripción')
-    parser.add_argument('--chunk-size', type=int, default=10, 
+    parser.add_argument('--chunk-size', type=float, default=10, 
                         help='Tamaño del fragmento de audio en segundos')
+    parser.add_argument('--overlap', type=float, default=0.0,
+                        help='Solapamiento en segundos entre fragmentos consecutivos (stride = chunk-size - overlap)')
+    parser.add_argument('--partial-interval', type=float, default=0,
+                        help='Segundos entre resultados provisionales (subtítulos de baja latencia); 0 los desactiva')
+    parser.add_argument('--no-context', action='store_true',
+                        help='No pasar el texto anterior como contexto al modelo')
+    parser.add_argument('--vad', type=str, default=None, choices=sorted(VAD_BACKENDS),
+                        help='Detector de voz para descartar el silencio antes de transcribir (energy, webrtc)')
+    parser.add_argument('--vad-min-silence', type=float, default=0.5,
+                        help='Segundos de silencio que cierran un segmento de voz')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Número de hilos de inferencia que comparten el modelo')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Número máximo de chunks pendientes que se transcriben juntos en un lote')
+    parser.add_argument('--backend', type=str, default="whisper", choices=sorted(INFERENCE_BACKENDS),
+                        help='Motor de inferencia: whisper (float32), int8 (cuantizado, CPU) o ctranslate2 (faster-whisper)')
+    parser.add_argument('--model-dir', type=str, default=None,
+                        help='Directorio donde guardar una instantánea local del modelo para arrancar más rápido')
+    parser.add_argument('--max-queue', type=int, default=20,
+                        help='Número máximo de chunks en cada cola entre hilos (0 sin límite)')
+    parser.add_argument('--overload-policy', type=str, default="block", choices=OVERLOAD_POLICIES,
+                        help='Qué hacer con la cola de audio llena: block (esperar), drop-oldest, skip-silence, '
+                             'downgrade (modelo más pequeño) o stride (ventanas más largas)')
+    parser.add_argument('--sink', type=str, action='append', default=[],
+                        help=f'Destino extra como tipo:destino, se puede repetir ({", ".join(SINKS)}); '
+                             'p. ej. jsonl:salida.jsonl, srt:salida.srt, http:8090, index:transcripciones.db')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='Fichero donde guardar el punto de reanudación; si ya existe, se continúa desde él')
+    parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+                        help='Segundos entre escrituras del checkpoint')
+    parser.add_argument('--max-reconnects', type=int, default=MAX_RECONNECTS,
+                        help='Reintentos seguidos de reconexión si el stream se corta (0 para no reconectar)')
+    parser.add_argument('--dedup', type=str, default=None,
+                        help='Fichero SQLite compartido con los transcriptores de otros streams: el audio que '
+                             'emiten igual (simulcast) se transcribe una sola vez')
+    parser.add_argument('--dedup-window', type=float, default=DEDUP_WINDOW,
+                        help='Segundos de audio de los otros streams con los que se compara cada chunk')
+    parser.add_argument('--dedup-wait', type=float, default=DEDUP_WAIT,
+                        help='Segundos como mucho que un chunk espera a que otro stream transcriba el mismo audio')
     parser.add_argument('--correct-words', type=str, default=None,
                         help='Archivo JSON con palabras correctas para corrección de transcripciones')
+    parser.add_argument('--cache-size', type=int, default=100000,
+                        help='Número máximo de palabras en la caché de correcciones')
+    parser.add_argument('--cache-file', type=str, default=None,
+                        help='Fichero SQLite donde persistir la caché de correcciones entre ejecuciones')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Puerto en el que exportar las métricas en formato Prometheus (/metrics)')
+    parser.add_argument('--metrics-host', type=str, default='127.0.0.1',
+                        help='Dirección en la que escuchar las métricas (0.0.0.0 para exponerlas fuera de la máquina)')
+    parser.add_argument('--metrics-interval', type=float, default=60,
+                        help='Segundos entre las líneas de métricas del log (0 para desactivarlas)')
     parser.add_argument('--debug', action='store_true',
                         help='Activar modo debug')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
+    for spec in args.sink:
+        if spec.partition(":")[0] not in SINKS or ":" not in spec:
+            parser.error(f"Destino no válido: {spec}. Formato tipo:destino con tipo en {', '.join(SINKS)}")
+
     # Configurar logging
     logger = setup_logging(args.debug)
     
     logger.info("Iniciando transcripción del stream...")
     logger.info(f"URL: {args.url}")
-    logger.info(f"Modelo: {args.model}")
+    logger.info(f"Modelo: {args.model} (backend {args.backend})")
     logger.info(f"Idioma: {args.language}")
     logger.info(f"Archivo de salida: {args.output}")
+    logger.info(f"Destinos extra: {', '.join(args.sink) if args.sink else 'ninguno'}")
     logger.info(f"Tamaño del chunk: {args.chunk_size} segundos")
+    logger.info(f"Solapamiento: {args.overlap} segundos")
+    logger.info(f"Resultados parciales: {f'cada {args.partial_interval} segundos' if args.partial_interval else 'desactivados'}")
+    logger.info(f"VAD: {args.vad if args.vad else 'desactivado'}")
+    logger.info(f"Hilos de inferencia: {args.workers} (lote máximo: {args.batch_size})")
+    logger.info(f"Colas: {args.max_queue or 'sin límite'} chunks (política de sobrecarga: {args.overload_policy})")
+    logger.info(f"Checkpoint: {args.checkpoint if args.checkpoint else 'desactivado'} "
+                f"(reconexiones: {args.max_reconnects})")
+    logger.info(f"Deduplicación entre streams: {args.dedup if args.dedup else 'desactivada'}")
     logger.info(f"Archivo de palabras correctas: {args.correct_words if args.correct_words else 'No se utilizará corrección'}")
     print()
     
-    
-    transcribe_live_stream(args.url, args.model, args.language, args.output, args.chunk_size, args.correct_words)
+    _, metrics_reporter = start_metrics(args.metrics_port, args.metrics_interval, args.metrics_host)
+    try:
+        transcribe_live_stream(args.url, args.model, args.language, args.output, args.chunk_size, args.correct_words,
+                               args.overlap, not args.no_context, args.vad, args.vad_min_silence,
+                               args.workers, args.batch_size, args.cache_size, args.cache_file, args.model_dir,
+                               args.backend, args.max_queue, args.overload_policy, args.partial_interval, args.sink,
+                               args.checkpoint, args.checkpoint_interval, args.max_reconnects,
+                               args.language_detect_seconds, args.language_recheck_seconds,
+                               args.dedup, args.dedup_window, args.dedup_wait)
+    finally:
+        if metrics_reporter:
+            metrics_reporter.stop()  # Última línea de métricas con los totales
+
+
+if __name__ == "__main__":
+    main()
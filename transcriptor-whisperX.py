@@ -1,131 +1,139 @@
-import whisperx.diarize
-import yt_dlp
-import tempfile
-import os
-import uuid
+import numpy as np
 import threading
 import queue
 import argparse
-import time
-import whisperx
 import gc
-import torch
+from utils import get_audio_stream_info
+from capture import start_ffmpeg, stop_process
+from streaming import AudioChunk, SlidingWindowChunker
+from models import preload_align, preload_whisperx, preload_diarization, smaller_model
+from overload import OVERLOAD_POLICIES, OverloadQueue
+from sinks import SINKS, Caption, SinkWriter, TextSink, create_sink, segment_words
+from diarization import DIARIZATION_WINDOW, IncrementalDiarizer, assign_speakers
+from datetime import datetime
 
 
 
-# Cola para comunicación entre hilos
-audio_queue = queue.Queue()
+# Cola para comunicación entre hilos (configure_queues las acota)
+audio_queue = OverloadQueue()
+diarization_queue = queue.Queue()
 result_queue = queue.Queue()
 
+def configure_queues(max_queue=10, overload_policy="block"):
+    """Acota las colas a `max_queue` elementos; con la de audio llena se aplica `overload_policy`."""
+    global audio_queue, diarization_queue, result_queue
+    audio_queue = OverloadQueue(max_queue, overload_policy)
+    diarization_queue = queue.Queue(max_queue)
+    result_queue = queue.Queue(max_queue)
+
 def extract_youtube_audio(youtube_url, chunk_size=10):
-    """Extrae audio de YouTube en chunks y los pone en la cola."""
-    
-    # Opciones para yt-dlp
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'wav',
-            'preferredquality': '192',
-        }],
-        'quiet': True,
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(youtube_url, download=False)
-        is_live = info.get('is_live', False)
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            
-            # Para streams en vivo, usamos un enfoque de descarga continua
-            if is_live:
-                print("Detectado stream en vivo, iniciando extracción continua...")
-               
-                stream_opts = ydl_opts.copy()
-                stream_opts['external_downloader'] = 'ffmpeg' 
-                stream_opts['external_downloader_args'] = ['-t', str(chunk_size)] 
-
-                # En un stream en vivo, descargamos en chunks
-                while True:
-                    # Generar nombre único para este chunk
-                    chunk_id = uuid.uuid4().hex
-                    stream_opts['outtmpl'] = os.path.join(temp_dir, f'temp_stream_{chunk_id}')
-                    
-                    # Descargar el chunk de audio
-                    with yt_dlp.YoutubeDL(stream_opts) as ydl_stream:                    
-                        ydl_stream.download([youtube_url])
-
-                    # Convertir el nombre del archivo descargado a WAV y ponerlo en la cola
-                    filepath = os.path.join(temp_dir, f'temp_stream_{chunk_id}.wav')
-                    audio_queue.put(filepath)
-
-                    time.sleep(chunk_size/2)  # Esperar el tamaño del chunk antes de descargar el siguiente
-
-            else:
-                print("No es un stream en vivo, descargando video completo.")
-                # Para videos normales, descargamos todo de una vez
-                ydl_opts['outtmpl'] = os.path.join(temp_dir, 'complete_video')  # Nombre de archivo fijo
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl_video:
-                    ydl_video.download([youtube_url])
-                    filepath = os.path.join(temp_dir, 'complete_video.wav')  # Referenciar el archivo directamente
-                    audio_queue.put(filepath)
-        
-        except Exception as e:
-            print(f"Error en extracción de audio: {e}")
+    """Extrae audio de YouTube con un único proceso FFmpeg y pone los chunks (AudioChunk) en la cola."""
+
+    process = None
+    try:
+        # Una sola resolución del stream; FFmpeg entrega PCM a 16 kHz por un pipe, sin tocar el disco
+        info = get_audio_stream_info(youtube_url)
+        process = start_ffmpeg(info['url'])
+
+        # Para streams en vivo, ventanas consecutivas de chunk_size segundos sin huecos ni solapes
+        if info.get('is_live', False):
+            print("Detectado stream en vivo, iniciando extracción continua...")
+            # Con la política stride las ventanas pueden crecer hasta el doble si WhisperX no da abasto
+            chunker = SlidingWindowChunker(chunk_size, max_window_seconds=2 * chunk_size)
+            audio_queue.attach_source(chunker)
+            for chunk in chunker.chunks(process.stdout):
+                audio_queue.put(chunk)
+
+        else:
+            print("No es un stream en vivo, descargando video completo.")
+            # Para videos normales, todo el audio se transcribe de una vez
+            data = process.stdout.read()
+            pcm = np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16)
+            audio_queue.put(AudioChunk(0.0, pcm.astype(np.float32) / 32768.0, final=True))
 
-        finally:    
-            audio_queue.join()  # Esperar a que se procesen los archivos temporales
-            print("Extracción de audio finalizada.")
-            audio_queue.put(None)  # Señalizar fin de la extracción 
+    except Exception as e:
+        print(f"Error en extracción de audio: {e}")
+
+    finally:
+        if process:
+            stop_process(process)
+        print("Extracción de audio finalizada.")
+        audio_queue.put(None)  # Señalizar fin de la extracción 
             
 
-def transcribe_with_whisperx(model_size="small", language=None, token=None):
-    """Transcribe los chunks de audio usando WhisperX con marcas de tiempo a nivel de palabra."""
+def whisperx_device():
+    """Dispositivo y tipo de cómputo para WhisperX."""
+    import torch
 
-    # Configurar y cargar el modelo WhisperX     
     device = "cuda" if torch.cuda.is_available() else "cpu"                 # Configurar dispositivo, whisperX no detecta automáticamente.
     compute_type = "float16" if torch.cuda.is_available() else "int8"       # Tipo de cómputo, whisper solo manejea floats32
+    return device, compute_type
+
+def preload_models(model_size="small", language=None, token=None, model_dir=None):
+    """Empieza a cargar en paralelo y en segundo plano el modelo ASR y el de diarización."""
+    device, compute_type = whisperx_device()
+    return (preload_whisperx(model_size, device, compute_type, language, model_dir),
+            preload_diarization(token, device))
+
+def transcribe_with_whisperx(model_size="small", language=None, token=None, model_dir=None, align=True):
+    """Transcribe los chunks de audio usando WhisperX con marcas de tiempo a nivel de palabra.
+
+    Los resultados pasan a la etapa de diarización, que les asigna los hablantes en su propio hilo.
+    """
+
+    # Imports pesados solo al transcribir: --help y los errores de argumentos no los pagan
+    import torch
+    import whisperx
 
+    # Configurar y cargar el modelo WhisperX (reutiliza la carga en curso o ya terminada)
+    device, compute_type = whisperx_device()
     print(f"Cargando modelo WhisperX en {device}...")
-    model = whisperx.load_model(model_size, device, compute_type=compute_type, language=language)
+    model_loading, _ = preload_models(model_size, language, token, model_dir)
+    model = model_loading.result()
+    smaller_loading = None
 
-    try:
-        diarize_model = whisperx.diarize.DiarizationPipeline(
-            use_auth_token = token,
-            device=device
-        )
-        print("Modelo de diarización cargado correctamente")
-    except Exception as e:
-        print(f"Error al cargar el modelo de diarización: {e}")
+    def downgrade():
+        # Política downgrade: el modelo más pequeño se carga en segundo plano y se usa en cuanto está listo
+        nonlocal model_size, smaller_loading
+        smaller = smaller_model(model_size)
+        if smaller is None:
+            return None
+        model_size = smaller
+        smaller_loading = preload_whisperx(smaller, device, compute_type, language, model_dir)
+        return f"cargando el modelo {smaller} para sustituir al actual"
 
+    if audio_queue.policy == "downgrade":
+        audio_queue.adapt = downgrade
 
     while True:
-        # Obtener archivo de audio de la cola
-        audio_file = audio_queue.get()
+        # Obtener audio de la cola
+        chunk = audio_queue.get()
         
         # None señaliza fin del stream
-        if audio_file is None:
+        if chunk is None:
             audio_queue.task_done()
             break
             
         try:
-            #Cargar audio
-            audio = whisperx.load_audio(audio_file)
+            if smaller_loading is not None and smaller_loading.done():
+                model, smaller_loading = smaller_loading.result(), None
+                print(f"Transcribiendo con el modelo {model_size}.")
 
+            audio = chunk.audio
             # Transcribir audio
             result = model.transcribe(audio, batch_size=16)
 
-            # Diarizar segmentos
-            diarize_segments = diarize_model(audio)
-            result = whisperx.assign_word_speakers(diarize_segments, result)
+            # Alinear para obtener las marcas de tiempo de cada palabra (y después el hablante de cada una)
+            if align:
+                try:
+                    align_model, metadata = preload_align(result.get("language") or language, device).result()
+                    result = whisperx.align(result["segments"], align_model, metadata, audio, device,
+                                            return_char_alignments=False)
+                except Exception as e:
+                    print(f"Error alineando palabras, se usan los tiempos por segmento: {e}")
 
-            # Verificar si el archivo es de stream y eliminarlo después de transcribir
-            if(audio_file.startswith("temp_stream")):
-                os.remove(audio_file) 
-
-            # Añadir resultado a la cola de resultados
-            result_queue.put(result)
+            # Pasar el resultado a la diarización, con el chunk para situarlo en el tiempo del stream
+            diarization_queue.put((chunk, result))
             
         except Exception as e:
             print(f"Error en transcripción: {e}")
@@ -139,34 +147,88 @@ def transcribe_with_whisperx(model_size="small", language=None, token=None):
         torch.cuda.empty_cache()
     
     # Señalizar fin de la transcripción
-    result_queue.put(None)
+    diarization_queue.put(None)
     print("Transcripción completa.")
 
 
+def diarization_worker(token=None, window=DIARIZATION_WINDOW):
+    """Asigna hablantes a los resultados de la transcripción por ventanas deslizantes de `window` segundos.
 
-def output_worker(output_file="transcripcion.txt"):
-    """Muestra las transcripciones a medida que están disponibles."""
-    with open(output_file, "a", encoding="utf-8") as f:
+    Va por detrás de la transcripción sin frenarla: si se acumulan resultados, los diariza
+    todos en una sola pasada. Las etiquetas (SPEAKER_00...) se mantienen en todo el stream.
+    """
+    device, _ = whisperx_device()
+    diarizer = None
+    try:
+        diarizer = IncrementalDiarizer(preload_diarization(token, device).result(), window)
+        print("Modelo de diarización cargado correctamente")
+    except Exception as e:
+        print(f"Error al cargar el modelo de diarización, se transcribe sin hablantes: {e}")
+
+    finished = False
+    while not finished:
+        pending = [diarization_queue.get()]
+        while pending[-1] is not None:
+            try:
+                pending.append(diarization_queue.get_nowait())
+            except queue.Empty:
+                break
+        if pending[-1] is None:
+            pending.pop()
+            finished = True
+
+        if diarizer and pending:
+            try:
+                turns = diarizer.process([chunk for chunk, _ in pending])
+                for chunk, result in pending:
+                    assign_speakers(result["segments"], turns, chunk.start)
+            except Exception as e:
+                print(f"Error en diarización: {e}")
+
+        for item in pending:
+            result_queue.put(item)
+
+    result_queue.put(None)
+    print("Diarización completa.")
+
+
+
+def output_worker(output_file="transcripcion.txt", sinks=(), stream=None):
+    """Muestra las transcripciones a medida que están disponibles y las reparte entre los destinos."""
+    writer = SinkWriter([TextSink(output_file)] + [create_sink(spec, stream=stream) for spec in sinks])
+    try:
         while True:
             try:
-                result = result_queue.get() 
-                if result is None:
+                item = result_queue.get() 
+                if item is None:
                     print("Redacción completa. Resultados guardados en ", output_file)
                     break
                 
+                chunk, result = item
+                timestamp = datetime.now().strftime("%H:%M:%S")
                 for segment in result["segments"]:
-                    segment = f'{segment["speaker"]}: {segment["text"].strip()}'
-                    print(segment)  # Mostrar transcripción en consola
-                    f.write(segment + "\n")  # Guardar transcripción en archivo
-                f.flush()
+                    # Tiempos del segmento y de sus palabras relativos al inicio del stream
+                    caption = Caption(segment["text"].strip(), chunk.start + segment["start"],
+                                      chunk.start + segment["end"], True, segment_words([segment], chunk.start),
+                                      speaker=segment.get("speaker"), timestamp=timestamp)
+                    print(f'{caption.speaker}: {caption.text}')  # Mostrar transcripción en consola
+                    writer.publish(caption)
 
             except Exception as e:
                 print(f"Error mostrando transcripción: {e}")
                 continue
+    finally:
+        writer.close()
    
 
-def transcribe_live_stream(youtube_url, model_size="small", language="es", output_file="transcripcion.txt", chunk_size=10, token=None):
+def transcribe_live_stream(youtube_url, model_size="small", language="es", output_file="transcripcion.txt", chunk_size=10, token=None,
+                           model_dir=None, max_queue=10, overload_policy="block", sinks=(), align=True,
+                           diarization_window=DIARIZATION_WINDOW):
     """Inicia los hilos para transcribir un stream en vivo.""" 
+    configure_queues(max_queue, overload_policy)
+    # Los modelos se cargan mientras se resuelve el stream y conecta FFmpeg
+    preload_models(model_size, language, token, model_dir)
+
     # Iniciar hilo para capturar audio
     extractor_thread = threading.Thread(
         target=extract_youtube_audio,
@@ -178,15 +240,23 @@ def transcribe_live_stream(youtube_url, model_size="small", language="es", outpu
     # Iniciar hilo para transcripción
     transcription_thread = threading.Thread(
         target=transcribe_with_whisperx,
-        args=(model_size, language, token)
+        args=(model_size, language, token, model_dir, align)
     )
     transcription_thread.daemon = True
     transcription_thread.start()
+
+    # Iniciar hilo para diarización
+    diarization_thread = threading.Thread(
+        target=diarization_worker,
+        args=(token, diarization_window)
+    )
+    diarization_thread.daemon = True
+    diarization_thread.start()
     
     # Iniciar hilo para mostrar resultados
     output_thread = threading.Thread(
         target=output_worker,
-        args=(output_file,)
+        args=(output_file, sinks, youtube_url)
     )
     output_thread.daemon = True
     output_thread.start()
@@ -194,11 +264,13 @@ def transcribe_live_stream(youtube_url, model_size="small", language="es", outpu
     # Esperar a que terminen los hilos
     extractor_thread.join()
     transcription_thread.join()
+    diarization_thread.join()
     output_thread.join()
 
-if __name__ == "__main__":
+def main(argv=None, prog=None):
+    """Punto de entrada de la línea de comandos (también `cli.py whisperx`)."""
     
-    parser = argparse.ArgumentParser(description='Transcribe YouTube live streams en tiempo real.')
+    parser = argparse.ArgumentParser(prog=prog, description='Transcribe YouTube live streams en tiempo real.')
     parser.add_argument('--url', type=str, required=True,
                         help='URL del stream de YouTube a transcribir')
     parser.add_argument('--model', type=str, default="small", choices=["tiny", "base", "small", "medium", "large"],
@@ -211,8 +283,22 @@ if __name__ == "__main__":
                         help='Tamaño del fragmento de audio en segundos')
     parser.add_argument('--token', type=str, required=True,
                         help='Token de autenticación para el modelo de diarización')
+    parser.add_argument('--model-dir', type=str, default=None,
+                        help='Directorio donde guardar el modelo convertido para arrancar más rápido')
+    parser.add_argument('--sink', type=str, action='append', default=[],
+                        help=f'Destino extra como tipo:destino, se puede repetir ({", ".join(SINKS)}); '
+                             'p. ej. jsonl:salida.jsonl, srt:salida.srt, http:8090, index:transcripciones.db')
+    parser.add_argument('--no-align', action='store_true',
+                        help='No alinear las palabras (más rápido, pero sin marcas de tiempo por palabra)')
+    parser.add_argument('--diarization-window', type=float, default=DIARIZATION_WINDOW,
+                        help='Segundos de audio sobre los que se diariza cada vez (contexto para mantener los hablantes)')
+    parser.add_argument('--max-queue', type=int, default=10,
+                        help='Número máximo de chunks en cada cola entre hilos (0 sin límite)')
+    parser.add_argument('--overload-policy', type=str, default="block", choices=OVERLOAD_POLICIES,
+                        help='Qué hacer con la cola de audio llena: block (esperar), drop-oldest, skip-silence, '
+                             'downgrade (modelo más pequeño) o stride (ventanas más largas)')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     print("Iniciando transcripción del stream...")
     print(f"URL: {args.url}")
@@ -221,6 +307,12 @@ if __name__ == "__main__":
     print(f"Archivo de salida: {args.output}")
     print(f"Tamaño del chunk: {args.chunk_size} segundos")
     print(f"Token de diarización: {args.token}")
+    print(f"Colas: {args.max_queue or 'sin límite'} chunks (política de sobrecarga: {args.overload_policy})")
     print()
 
-    transcribe_live_stream(args.url, args.model, args.language, args.output, args.chunk_size, args.token)
\ No newline at end of file
+    transcribe_live_stream(args.url, args.model, args.language, args.output, args.chunk_size, args.token, args.model_dir,
+                           args.max_queue, args.overload_policy, args.sink, not args.no_align, args.diarization_window)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,149 @@
-import yt_dlp
 import json
 import jellyfish
 import re
 from unidecode import unidecode   
 import difflib
 import logging
+import math
+import os
+import numpy as np
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from resolver import get_resolver
+
+class CacheCorrecciones:
+    """Caché LRU de correcciones, opcionalmente persistida en SQLite.
+
+    Las claves incluyen el hash del vocabulario y el umbral, así que una caché
+    persistida nunca devuelve correcciones calculadas con otro diccionario. También
+    guarda los resultados negativos (palabras sin corrección) para no recalcularlos.
+    """
+
+    # Valor guardado para las palabras que no tienen corrección
+    SIN_CORRECCION = None
+
+    def __init__(self, max_entradas=100000, ruta=None):
+        self.max_entradas = max_entradas
+        self.ruta = ruta
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._sin_confirmar = 0  # Escrituras en SQLite pendientes de commit
+        if ruta:
+            self._db = sqlite3.connect(ruta, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS correcciones ("
+                "ambito TEXT NOT NULL, clave TEXT NOT NULL, valor TEXT, PRIMARY KEY (ambito, clave))"
+            )
+            self._db.commit()
+
+    def obtener(self, ambito, clave):
+        """Devuelve (encontrada, corrección); la corrección es None si la palabra no tiene."""
+        with self._lock:
+            entrada = (ambito, clave)
+            if entrada in self._entradas:
+                self._entradas.move_to_end(entrada)
+                self.aciertos += 1
+                return True, self._entradas[entrada]
+
+            if self._db is not None:
+                fila = self._db.execute(
+                    "SELECT valor FROM correcciones WHERE ambito = ? AND clave = ?", (ambito, clave)
+                ).fetchone()
+                if fila is not None:
+                    self._insertar(entrada, fila[0])
+                    self.aciertos += 1
+                    return True, fila[0]
+
+            self.fallos += 1
+            return False, None
+
+    def guardar(self, ambito, clave, valor):
+        with self._lock:
+            self._insertar((ambito, clave), valor)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO correcciones VALUES (?, ?, ?)", (ambito, clave, valor))
+                # Confirmar en bloques para no escribir en disco en cada palabra
+                self._sin_confirmar += 1
+                if self._sin_confirmar >= 100:
+                    self._db.commit()
+                    self._sin_confirmar = 0
+
+    def _insertar(self, entrada, valor):
+        self._entradas[entrada] = valor
+        self._entradas.move_to_end(entrada)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.expulsiones += 1
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'entradas': len(self._entradas),
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'expulsiones': self.expulsiones,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+        }
+
+    def registrar_estadisticas(self, logger, nivel=logging.INFO):
+        """Escribe las estadísticas de la caché en el log configurado con setup_logging."""
+        e = self.estadisticas()
+        logger.log(nivel, f"[Caché] {e['entradas']} entradas, {e['aciertos']} aciertos, {e['fallos']} fallos, "
+                          f"{e['expulsiones']} expulsiones (tasa de aciertos {e['tasa_aciertos']:.1%})")
+
+    def cerrar(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
 
 # Cache global para correcciones ya realizadas
-_cache_correcciones = {}
+_cache_correcciones = CacheCorrecciones()
+
+def configurar_cache_correcciones(max_entradas=100000, ruta=None):
+    """Sustituye la caché global de correcciones (tamaño máximo y fichero SQLite opcional)."""
+    global _cache_correcciones
+    _cache_correcciones.cerrar()
+    _cache_correcciones = CacheCorrecciones(max_entradas, ruta)
+    return _cache_correcciones
+
+def obtener_cache_correcciones():
+    """Devuelve la caché global de correcciones."""
+    return _cache_correcciones
 
-def get_audio_stream_url(youtube_url):
+# Palabras del texto y separadores admitidos entre las palabras de una entrada de varias palabras
+_PATRON_PALABRA = re.compile(r'\w+')
+_SEPARADOR_FRASE = re.compile(r'[\s\-]+')
+
+# Clave del trie que marca el final de una entrada de varias palabras
+_FIN_FRASE = None
+
+# Marca que corregir_texto añade tras cada corrección; las palabras marcadas no se vuelven a corregir
+MARCA_CORREGIDA = " (corregida)"
+
+def get_audio_stream_info(youtube_url, refresh=False):
+    """Obtiene la información de yt-dlp del vídeo; la URL del stream de audio está en 'url'.
+
+    La resolución se guarda en caché hasta que caduca la URL (ver resolver.py); con
+    `refresh` se vuelve a resolver. Un fichero local se entrega tal cual a FFmpeg
+    (pruebas y benchmarks sin conexión).
+    """
+    if os.path.isfile(youtube_url):
+        nombre = os.path.splitext(os.path.basename(youtube_url))[0]
+        return {'url': os.path.abspath(youtube_url), 'id': nombre, 'title': nombre, 'is_live': False}
+    return get_resolver().resolve(youtube_url, refresh)
+
+def get_audio_stream_url(youtube_url, refresh=False):
     """Obtiene la URL del stream de audio de YouTube."""
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'quiet': True,
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(youtube_url, download=False)
-        return info['url']
+    return get_audio_stream_info(youtube_url, refresh)['url']
     
 # Configurar logging
 def setup_logging(debug=False, name ="youtube_transcriptor"):
@@ -34,7 +160,22 @@ def setup_logging(debug=False, name ="youtube_transcriptor"):
     return logging.getLogger(name)
 
 
-def load_correct_words(file_path="palabras_correctas.json"):
+def load_correct_words(file_path="palabras_correctas.json", usar_indice=True):
+    """Carga los datos de corrección a partir de un archivo JSON de palabras correctas.
+
+    Con `usar_indice`, los datos se leen del índice compilado que acompaña al JSON
+    (ver vocab_index.py), que se regenera automáticamente si el JSON cambia.
+    """
+    if usar_indice:
+        from vocab_index import cargar_vocabulario  # Import diferido: vocab_index depende de utils
+        return cargar_vocabulario(file_path)
+
+    correct_words = leer_palabras_correctas(file_path)
+    if correct_words is None:
+        return None
+    return crear_datos_precalculados(correct_words)
+
+def leer_palabras_correctas(file_path="palabras_correctas.json"):
     """Carga un set de palabras correctas desde un archivo JSON."""
     correct_words = set()  # Usar un set para evitar duplicados 
     try:
@@ -62,7 +203,7 @@ def load_correct_words(file_path="palabras_correctas.json"):
         print(f"Error cargando palabras correctas: {e}")
         return None
     
-    return crear_datos_precalculados(correct_words)
+    return correct_words
 
 def crear_indice_fonetico(set_palabras_correctas):
     """Crea un índice fonético para búsquedas más rápidas."""
@@ -80,20 +221,100 @@ def crear_listas_palabras_correctas(set_palabras_correctas):
     palabras_norm = [normalizar_palabra(p) for p in palabras_correctas_list]
     return (palabras_correctas_list, palabras_norm)
 
+def crear_indice_difuso(palabras_norm):
+    """Crea un índice para búsquedas aproximadas: frecuencias de caracteres agrupadas por longitud."""
+    posiciones = {}
+    por_longitud = {}
+    for idx, palabra in enumerate(palabras_norm):
+        if palabra in posiciones:
+            continue
+        posiciones[palabra] = idx  # Primera aparición, igual que palabras_norm.index()
+        por_longitud.setdefault(len(palabra), []).append(palabra)
+
+    alfabeto = {c: i for i, c in enumerate(sorted({c for palabra in posiciones for c in palabra}))}
+    grupos = {}
+    for longitud, palabras in por_longitud.items():
+        conteos = np.zeros((len(palabras), len(alfabeto)), dtype=np.uint16)
+        for i, palabra in enumerate(palabras):
+            for c in palabra:
+                conteos[i, alfabeto[c]] += 1
+        grupos[longitud] = (palabras, conteos)
+
+    return {'alfabeto': alfabeto, 'grupos': grupos, 'posiciones': posiciones}
+
+def buscar_candidatos_difusos(indice_difuso, palabra_norm, umbral=0.8):
+    """Devuelve las palabras del índice que pueden alcanzar el umbral de similitud de difflib.
+
+    Aplica a todo el vocabulario a la vez la cota quick_ratio() de difflib (caracteres en
+    común sin importar el orden), que nunca es menor que ratio(): ninguna coincidencia
+    válida se queda fuera y difflib solo calcula ratio() sobre los supervivientes.
+    """
+    la = len(palabra_norm)
+    if umbral <= 0:
+        longitud_min, longitud_max = 0, math.inf
+    else:
+        # ratio() <= 2 * min(la, lb) / (la + lb) acota la longitud de los candidatos
+        longitud_min = math.ceil(la * umbral / (2 - umbral) - 1e-9)
+        longitud_max = math.floor(la * (2 - umbral) / umbral + 1e-9)
+
+    alfabeto = indice_difuso['alfabeto']
+    consulta = np.zeros(len(alfabeto), dtype=np.uint16)
+    for c in palabra_norm:
+        if c in alfabeto:  # Un carácter fuera del vocabulario no puede coincidir con nada
+            consulta[alfabeto[c]] += 1
+
+    candidatos = []
+    for longitud, (palabras, conteos) in indice_difuso['grupos'].items():
+        if not longitud_min <= longitud <= longitud_max:
+            continue
+        comunes = np.minimum(conteos, consulta).sum(axis=1)
+        for i in np.flatnonzero(2 * comunes >= umbral * (la + longitud) - 1e-9):
+            candidatos.append(palabras[i])
+    return candidatos
+
+def crear_trie_frases(set_palabras_correctas):
+    """Crea un trie de palabras normalizadas con las entradas de varias palabras."""
+    trie = {}
+    for entrada in set_palabras_correctas:
+        tokens = _PATRON_PALABRA.findall(entrada)
+        if len(tokens) < 2:
+            continue
+        nodo = trie
+        for token in tokens:
+            nodo = nodo.setdefault(normalizar_palabra(token), {})
+        nodo[_FIN_FRASE] = entrada
+    return trie
+
+def calcular_hash_vocabulario(set_palabras_correctas):
+    """Hash estable del contenido del vocabulario (independiente del orden y del formato del JSON)."""
+    contenido = "\n".join(sorted(set_palabras_correctas)).encode('utf-8')
+    return hashlib.sha256(contenido).hexdigest()[:16]
+
 def crear_datos_precalculados(set_palabras_correctas):
     """Crea un objeto de datos pre-calculados para corrección de palabras."""
+    listas_palabras_correctas = crear_listas_palabras_correctas(set_palabras_correctas)
     return {
         'set_palabras_correctas': set_palabras_correctas,
+        'hash_vocabulario': calcular_hash_vocabulario(set_palabras_correctas),
         'indice_fonetico': crear_indice_fonetico(set_palabras_correctas),
-        'listas_palabras_correctas': crear_listas_palabras_correctas(set_palabras_correctas)
+        'listas_palabras_correctas': listas_palabras_correctas,
+        'indice_difuso': crear_indice_difuso(listas_palabras_correctas[1]),
+        'trie_frases': crear_trie_frases(set_palabras_correctas)
     }
 
-def levinshtein_distance(palabra_incorrecta, listas_palabras, umbral=0.8):
-    """Encuentra la mejor coincidencia usando difflib - más eficiente y preciso."""
+def levinshtein_distance(palabra_incorrecta, listas_palabras, umbral=0.8, indice_difuso=None):
+    """Encuentra la mejor coincidencia usando difflib - más eficiente y preciso.
+
+    Con `indice_difuso`, difflib solo compara contra los candidatos del índice en lugar
+    de contra todo el vocabulario; el resultado es el mismo.
+    """
     palabra_incorrecta_norm = normalizar_palabra(palabra_incorrecta)
     
     # Desempaquetar las listas pre-calculadas
     palabras_correctas_list, palabras_norm = listas_palabras
+
+    if indice_difuso is not None:
+        palabras_norm = buscar_candidatos_difusos(indice_difuso, palabra_incorrecta_norm, umbral)
     
     # difflib.get_close_matches es MÁS EFICIENTE que un bucle manual
     coincidencias = difflib.get_close_matches(
@@ -105,12 +326,15 @@ def levinshtein_distance(palabra_incorrecta, listas_palabras, umbral=0.8):
     
     if coincidencias:
         # Encontrar la palabra original correspondiente
-        idx = palabras_norm.index(coincidencias[0])
+        if indice_difuso is not None:
+            idx = indice_difuso['posiciones'][coincidencias[0]]
+        else:
+            idx = palabras_norm.index(coincidencias[0])
         return palabras_correctas_list[idx]
     
     return palabra_incorrecta
 
-def corregir_palabra(palabra_incorrecta, indice_fonetico, listas_palabras_correctas, umbral=0.8):
+def corregir_palabra(palabra_incorrecta, indice_fonetico, listas_palabras_correctas, umbral=0.8, indice_difuso=None):
     """Versión optimizada de corrección de palabras usando índice fonético."""
     codigo_fonetico = jellyfish.metaphone(palabra_incorrecta)
     
@@ -128,49 +352,99 @@ def corregir_palabra(palabra_incorrecta, indice_fonetico, listas_palabras_correc
         return levinshtein_distance(palabra_incorrecta, candidatos_foneticos, umbral)
     
     # Si no hay coincidencia fonética, buscar por similitud Levenshtein
-    return levinshtein_distance(palabra_incorrecta, listas_palabras_correctas, umbral)
-
-def corregir_texto(texto, datos_correccion, umbral=0.8):
-    """Versión optimizada de corrección de texto."""
-    # Desempaquetar los datos pre-calculados
-    set_palabras_correctas = datos_correccion['set_palabras_correctas']
-    indice_fonetico = datos_correccion['indice_fonetico']
-    listas_palabras_correctas = datos_correccion['listas_palabras_correctas']
-
-    # Usar regex para encontrar palabras
-    palabras = re.findall(r'\b\w+\b', texto)
-    texto_corregido = texto
-    
-    # Iterar sobre las palabras encontradas
-    for palabra in palabras:
-
-        # Usar set para ignorar palabras ya correctas
-        if palabra in set_palabras_correctas:
-            continue 
-
-        # Ignorar palabras muy cortas o números
-        if palabra.isdigit() or len(palabra) < 3:
-            continue 
-
-        # Usar palabra normalizada como clave del cache
-        cache_key = normalizar_palabra(palabra)
-        cache = False
-        if cache_key in _cache_correcciones:
-            palabra_corregida = _cache_correcciones[cache_key]
-            cache = True
+    return levinshtein_distance(palabra_incorrecta, listas_palabras_correctas, umbral, indice_difuso)
+
+def buscar_frase(texto, palabras, i, trie_frases, normalizadas):
+    """Busca la entrada de varias palabras más larga que empieza en la palabra i.
+
+    Devuelve (índice de la última palabra de la entrada, entrada) o (i, None) si no hay ninguna.
+    """
+    mejor = (i, None)
+    nodo = trie_frases
+    for j in range(i, len(palabras)):
+        # Las palabras de una entrada solo pueden estar separadas por espacios o guiones
+        if j > i and not _SEPARADOR_FRASE.fullmatch(texto, palabras[j - 1].end(), palabras[j].start()):
+            break
+        nodo = nodo.get(normalizadas[j])
+        if nodo is None:
+            break
+        if _FIN_FRASE in nodo:
+            mejor = (j, nodo[_FIN_FRASE])
+    return mejor
+
+def necesita_correccion(palabra, datos_correccion):
+    """Si hay que buscar la corrección de la palabra (no está en el vocabulario, no es un número ni muy corta)."""
+    # Usar set para ignorar palabras ya correctas
+    if palabra in datos_correccion['set_palabras_correctas']:
+        return False
+
+    # Ignorar palabras muy cortas o números
+    return not (palabra.isdigit() or len(palabra) < 3)
+
+def ambito_correcciones(datos_correccion, umbral):
+    """Ámbito de la caché: las correcciones solo valen para el mismo vocabulario y umbral."""
+    return f"{datos_correccion.get('hash_vocabulario', '')}:{umbral}"
+
+def corregir_token(palabra, datos_correccion, umbral=0.8, resueltas=None):
+    """Devuelve la corrección de una palabra suelta (la propia palabra si no hay que cambiarla).
+
+    `resueltas` ({palabra normalizada: corrección o None}) son correcciones ya buscadas para
+    un lote de textos (ver correccion.py); las que no estén se buscan como siempre.
+    """
+    if not necesita_correccion(palabra, datos_correccion):
+        return palabra
+
+    # Usar palabra normalizada como clave del cache, dentro del ámbito del vocabulario y el umbral
+    cache_key = normalizar_palabra(palabra)
+    if resueltas is not None and cache_key in resueltas:
+        palabra_resuelta = resueltas[cache_key]
+        return palabra if palabra_resuelta is CacheCorrecciones.SIN_CORRECCION else palabra_resuelta
+
+    ambito = ambito_correcciones(datos_correccion, umbral)
+    encontrada, palabra_cache = _cache_correcciones.obtener(ambito, cache_key)
+    if encontrada:
+        return palabra if palabra_cache is CacheCorrecciones.SIN_CORRECCION else palabra_cache
+
+    palabra_corregida = corregir_palabra(palabra, datos_correccion['indice_fonetico'],
+                                         datos_correccion['listas_palabras_correctas'], umbral,
+                                         datos_correccion.get('indice_difuso'))
+    # Las palabras sin corrección también se guardan para no volver a buscarlas
+    _cache_correcciones.guardar(ambito, cache_key,
+                                palabra_corregida if palabra_corregida != palabra else CacheCorrecciones.SIN_CORRECCION)
+    return palabra_corregida
+
+def corregir_texto(texto, datos_correccion, umbral=0.8, resueltas=None):
+    """Corrige el texto en una sola pasada, incluidas las entradas de varias palabras."""
+    trie_frases = datos_correccion.get('trie_frases', {})
+
+    palabras = list(_PATRON_PALABRA.finditer(texto))
+    normalizadas = [normalizar_palabra(p.group()) for p in palabras] if trie_frases else None
+
+    partes = []
+    copiado_hasta = 0  # Posición del texto original ya volcada en `partes`
+    i = 0
+    while i < len(palabras):
+        inicio = palabras[i].start()
+
+        # Primero las entradas de varias palabras, que tienen prioridad sobre las sueltas
+        ultima, frase = (i, None)
+        if trie_frases and normalizadas[i] in trie_frases:
+            ultima, frase = buscar_frase(texto, palabras, i, trie_frases, normalizadas)
+
+        if frase is not None:
+            original, correccion = texto[inicio:palabras[ultima].end()], frase
         else:
-            palabra_corregida = corregir_palabra(palabra, indice_fonetico, listas_palabras_correctas, umbral)
+            original = palabras[i].group()
+            correccion = corregir_token(original, datos_correccion, umbral, resueltas)
 
-        if palabra_corregida != palabra:
-            if not cache:
-                # Guardar en cache usando palabra normalizada como clave
-                _cache_correcciones[cache_key] = palabra_corregida
-            
-            # Reemplazar la palabra incorrecta por la corregida en el texto
-            texto_corregido = re.sub(r'\b' + re.escape(palabra) + r'\b', 
-                                   palabra_corregida + (" (corregida)"), texto_corregido)
-    
-    return texto_corregido
+        if correccion != original:
+            partes.append(texto[copiado_hasta:inicio])
+            partes.append(correccion + MARCA_CORREGIDA)
+            copiado_hasta = palabras[ultima].end()
+        i = ultima + 1
+
+    partes.append(texto[copiado_hasta:])
+    return "".join(partes)
 
 def normalizar_palabra(texto):
     """Normaliza una palabra: convierte a minúsculas y quita tildes."""
@@ -0,0 +1,234 @@
+import logging
+from collections import deque
+
+import numpy as np
+
+from metrics import REGISTRY
+from streaming import AudioChunk, SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Duración de cada trama de análisis (webrtcvad solo admite 10, 20 o 30 ms)
+FRAME_MS = 30
+
+
+class EnergyVAD:
+    """Detector de voz por energía con suelo de ruido adaptativo."""
+
+    def __init__(self, min_db=-45.0, margin_db=10.0, adaptation=0.05):
+        self.min_db = min_db              # Energía mínima absoluta para considerar voz (dBFS)
+        self.margin_db = margin_db        # Margen sobre el suelo de ruido
+        self.adaptation = adaptation      # Velocidad de adaptación del suelo de ruido
+        self.noise_db = -60.0
+
+    def speech_flags(self, frames):
+        """Devuelve un array booleano (una entrada por trama) indicando si hay voz."""
+        rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+        energy_db = 20 * np.log10(rms)
+        flags = np.empty(len(frames), dtype=bool)
+        for i, db in enumerate(energy_db):
+            flags[i] = db > max(self.min_db, self.noise_db + self.margin_db)
+            # El suelo de ruido se adapta rápido en silencio y muy despacio con voz
+            rate = self.adaptation if not flags[i] else self.adaptation / 50
+            self.noise_db += rate * (db - self.noise_db)
+        return flags
+
+
+class WebRTCVAD:
+    """Detector de voz basado en webrtcvad (requiere `pip install webrtcvad`)."""
+
+    def __init__(self, aggressiveness=2):
+        try:
+            import webrtcvad
+        except ImportError:
+            raise ImportError("El backend 'webrtc' necesita el paquete webrtcvad: pip install webrtcvad")
+        self._vad = webrtcvad.Vad(aggressiveness)
+
+    def speech_flags(self, frames):
+        pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype(np.int16)
+        return np.array([self._vad.is_speech(frame.tobytes(), SAMPLE_RATE) for frame in pcm], dtype=bool)
+
+
+# Backends disponibles; se pueden añadir otros con register_vad_backend
+VAD_BACKENDS = {
+    'energy': EnergyVAD,
+    'webrtc': WebRTCVAD,
+}
+
+
+def register_vad_backend(name, factory):
+    """Registra un backend de VAD. `factory()` debe devolver un objeto con `speech_flags(frames)`."""
+    VAD_BACKENDS[name] = factory
+
+
+def get_vad_backend(name, **kwargs):
+    """Crea una instancia del backend de VAD indicado."""
+    if name not in VAD_BACKENDS:
+        raise ValueError(f"Backend de VAD desconocido: {name}. Disponibles: {', '.join(VAD_BACKENDS)}")
+    return VAD_BACKENDS[name](**kwargs)
+
+
+class VADSegmenter:
+    """Corta el audio en segmentos de voz y descarta el silencio entre ellos.
+
+    Un segmento termina tras `min_silence` segundos sin voz o al llegar a
+    `max_segment` segundos; en ese caso se corta en la trama de menor energía
+    de su segunda mitad para no partir palabras. El audio descartado se suma al momento
+    a la métrica `vad_skipped_seconds_total` (con las etiquetas `labels`).
+    """
+
+    def __init__(self, backend, max_segment=10.0, min_silence=0.5, min_speech=0.25,
+                 padding=0.2, sample_rate=SAMPLE_RATE, labels=None):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * FRAME_MS // 1000
+        frame_seconds = FRAME_MS / 1000
+        self.max_frames = max(1, int(max_segment / frame_seconds))
+        self.min_silence_frames = max(1, int(min_silence / frame_seconds))
+        self.min_speech_frames = max(1, int(min_speech / frame_seconds))
+        self.padding_frames = int(padding / frame_seconds)
+
+        self._pending = np.empty(0, dtype=np.float32)          # Muestras que no completan una trama
+        self._padding = deque(maxlen=self.padding_frames)      # Tramas de silencio previas a la voz
+        self._segment = []              # Tramas del segmento en curso
+        self._energies = []             # Energía de cada trama del segmento
+        self._segment_start = 0         # Índice de trama donde empieza el segmento
+        self._speech_frames = 0         # Tramas con voz dentro del segmento
+        self._silence_run = 0           # Tramas seguidas sin voz al final del segmento
+        self._frame_index = 0           # Tramas procesadas desde el inicio del stream
+
+        self.skipped_frames = 0
+        self.total_frames = 0
+        self._skipped_metric = REGISTRY.counter("vad_skipped_seconds_total",
+                                                "Segundos de audio que el VAD ha descartado como silencio",
+                                                **(labels or {}))
+
+    def widen(self, limit=30.0):
+        """Permite segmentos más largos (menos llamadas al modelo) hasta `limit` segundos.
+
+        Devuelve una descripción del cambio, o None si ya no se pueden alargar más.
+        """
+        max_frames = int(limit * 1000 / FRAME_MS)
+        if self.max_frames >= max_frames:
+            return None
+        self.max_frames = min(max_frames, int(self.max_frames * 1.5))
+        return f"segmentos de voz de hasta {self.max_frames * FRAME_MS / 1000:.1f} s"
+
+    @property
+    def skipped_seconds(self):
+        return self.skipped_frames * FRAME_MS / 1000
+
+    @property
+    def total_seconds(self):
+        return self.total_frames * FRAME_MS / 1000
+
+    def process(self, audio):
+        """Procesa muestras float32 consecutivas y devuelve los segmentos de voz completados."""
+        audio = np.concatenate((self._pending, audio)) if len(self._pending) else audio
+        n_frames = len(audio) // self.frame_samples
+        self._pending = audio[n_frames * self.frame_samples:].copy()
+        if not n_frames:
+            return []
+
+        frames = audio[:n_frames * self.frame_samples].reshape(n_frames, self.frame_samples)
+        flags = self.backend.speech_flags(frames)
+        energies = np.mean(frames * frames, axis=1)
+
+        segments = []
+        for frame, is_speech, energy in zip(frames, flags, energies):
+            self.total_frames += 1
+            segment = self._push(frame, is_speech, energy)
+            if segment is not None:
+                segments.append(segment)
+            self._frame_index += 1
+        return segments
+
+    def flush(self):
+        """Cierra el segmento en curso al terminar el stream."""
+        self._skip(len(self._padding))
+        self._padding.clear()
+        segment = self._close_segment(final=True)
+        return [segment] if segment is not None else []
+
+    def _skip(self, frames):
+        if frames:
+            self.skipped_frames += frames
+            self._skipped_metric.inc(frames * FRAME_MS / 1000)
+
+    def _push(self, frame, is_speech, energy):
+        if not self._segment:
+            if not is_speech:
+                if len(self._padding) == self.padding_frames:
+                    self._skip(1)  # La trama de relleno más antigua se descarta
+                self._padding.append(frame)
+                return None
+            # Inicio de voz: el segmento incluye el relleno previo
+            self._segment_start = self._frame_index - len(self._padding)
+            self._segment = list(self._padding)
+            self._energies = [0.0] * len(self._padding)
+            self._padding.clear()
+
+        self._segment.append(frame)
+        self._energies.append(energy)
+        if is_speech:
+            self._speech_frames += 1
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+
+        if self._silence_run >= self.min_silence_frames:
+            return self._close_segment()
+        if len(self._segment) >= self.max_frames:
+            return self._split_segment()
+        return None
+
+    def _close_segment(self, final=False):
+        """Emite el segmento en curso quitando el silencio final que exceda el relleno."""
+        if not self._segment:
+            return None
+        trailing = max(0, self._silence_run - self.padding_frames)
+        frames = self._segment[:len(self._segment) - trailing]
+        self._skip(trailing)
+        speech_frames = self._speech_frames
+        start = self._segment_start
+
+        self._segment, self._energies = [], []
+        self._speech_frames = self._silence_run = 0
+
+        if speech_frames < self.min_speech_frames:
+            # Ruido impulsivo demasiado corto para ser voz
+            self._skip(len(frames))
+            return None
+        return self._make_chunk(start, frames, final)
+
+    def _split_segment(self):
+        """Corta un segmento demasiado largo por la trama más silenciosa de su segunda mitad."""
+        half = len(self._segment) // 2
+        cut = half + int(np.argmin(self._energies[half:])) + 1
+        chunk = self._make_chunk(self._segment_start, self._segment[:cut], False)
+
+        self._segment = self._segment[cut:]
+        self._energies = self._energies[cut:]
+        self._segment_start += cut
+        self._speech_frames = len(self._segment)  # Lo que queda sigue siendo parte de la voz
+        self._silence_run = 0
+        return chunk
+
+    def _make_chunk(self, start_frame, frames, final):
+        start = start_frame * self.frame_samples / self.sample_rate
+        return AudioChunk(start, np.concatenate(frames), final)
+
+
+def speech_chunks(chunks, segmenter):
+    """Aplica el VAD a un iterable de AudioChunk consecutivos y sin solapamiento."""
+    for chunk in chunks:
+        yield from segmenter.process(chunk.audio)
+    yield from segmenter.flush()
+
+
+def log_vad_stats(segmenter):
+    """Registra cuánto audio ha descartado el VAD."""
+    total = segmenter.total_seconds
+    skipped = segmenter.skipped_seconds
+    percent = 100 * skipped / total if total else 0
+    logger.info(f"[VAD] Audio descartado: {skipped:.1f} s de {total:.1f} s ({percent:.0f}%)")
@@ -0,0 +1,288 @@
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+
+import jellyfish
+import numpy as np
+
+from utils import (leer_palabras_correctas, normalizar_palabra, crear_indice_difuso, calcular_hash_vocabulario,
+                   crear_datos_precalculados, _PATRON_PALABRA, _FIN_FRASE, setup_logging)
+
+logger = logging.getLogger(__name__)
+
+# Cabecera: firma, versión del formato y longitud de los metadatos JSON
+MAGIA = b"YTVOCIDX"
+VERSION_INDICE = 1
+_CABECERA = struct.Struct("<8sII")
+
+# Los arrays de cada sección empiezan alineados a este número de bytes
+_ALINEACION = 64
+
+# Separador de las tablas de cadenas (no puede aparecer en ninguna palabra)
+_SEPARADOR = "\0"
+
+
+def ruta_indice_por_defecto(ruta_json):
+    """Ruta del índice compilado que acompaña a un JSON de palabras (palabras.json -> palabras.vidx)."""
+    return os.path.splitext(ruta_json)[0] + ".vidx"
+
+
+def _hash_fichero(ruta):
+    with open(ruta, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _tabla_cadenas(cadenas):
+    for cadena in cadenas:
+        if _SEPARADOR in cadena:
+            raise ValueError(f"La palabra {cadena!r} contiene un carácter nulo")
+    return _SEPARADOR.join(cadenas).encode('utf-8')
+
+
+def _leer_cadenas(datos, n):
+    return datos.decode('utf-8').split(_SEPARADOR) if n else []
+
+
+def compilar_indice(ruta_json, ruta_indice=None):
+    """Compila el vocabulario de `ruta_json` en un índice binario. Devuelve la ruta del índice o None."""
+    ruta_indice = ruta_indice or ruta_indice_por_defecto(ruta_json)
+    stat = os.stat(ruta_json)
+    sha256 = _hash_fichero(ruta_json)
+    palabras_correctas = leer_palabras_correctas(ruta_json)
+    if palabras_correctas is None:
+        return None
+
+    # Orden estable: el mismo JSON produce siempre el mismo índice
+    palabras = sorted(palabras_correctas)
+    normalizadas = [normalizar_palabra(p) for p in palabras]
+    codigos = [jellyfish.metaphone(p) for p in palabras]
+
+    frases = []
+    for entrada in palabras:
+        tokens = _PATRON_PALABRA.findall(entrada)
+        if len(tokens) >= 2:
+            frases.append([entrada, [normalizar_palabra(t) for t in tokens]])
+
+    # El índice difuso se guarda como una sola matriz con los grupos de longitud consecutivos
+    indice_difuso = crear_indice_difuso(normalizadas)
+    alfabeto = "".join(indice_difuso['alfabeto'])
+    grupos, palabras_difusas, matrices = [], [], []
+    for longitud in sorted(indice_difuso['grupos']):
+        grupo_palabras, conteos = indice_difuso['grupos'][longitud]
+        grupos.append([longitud, len(palabras_difusas), len(grupo_palabras)])
+        palabras_difusas.extend(grupo_palabras)
+        matrices.append(conteos)
+    conteos = np.concatenate(matrices) if matrices else np.zeros((0, len(alfabeto)), dtype=np.uint16)
+    posiciones = np.array([indice_difuso['posiciones'][p] for p in palabras_difusas], dtype=np.int32)
+
+    secciones = {
+        'palabras': _tabla_cadenas(palabras),
+        'normalizadas': _tabla_cadenas(normalizadas),
+        'codigos': _tabla_cadenas(codigos),
+        'difuso_palabras': _tabla_cadenas(palabras_difusas),
+        'difuso_posiciones': np.ascontiguousarray(posiciones),
+        'difuso_conteos': np.ascontiguousarray(conteos, dtype=np.uint16),
+    }
+
+    descripcion, offset = {}, 0
+    for nombre, datos in secciones.items():
+        offset = -(-offset // _ALINEACION) * _ALINEACION
+        tamano = datos.nbytes if isinstance(datos, np.ndarray) else len(datos)
+        descripcion[nombre] = {'offset': offset, 'bytes': tamano}
+        if isinstance(datos, np.ndarray):
+            descripcion[nombre].update(dtype=datos.dtype.str, shape=list(datos.shape))
+        offset += tamano
+
+    metadatos = json.dumps({
+        'origen': {'mtime_ns': stat.st_mtime_ns, 'tamano': stat.st_size, 'sha256': sha256},
+        'hash_vocabulario': calcular_hash_vocabulario(palabras_correctas),
+        'n_palabras': len(palabras),
+        'n_difusas': len(palabras_difusas),
+        'alfabeto': alfabeto,
+        'grupos': grupos,
+        'frases': frases,
+        'secciones': descripcion,
+    }, ensure_ascii=False).encode('utf-8')
+
+    # Escritura atómica: un transcriptor que arranque a la vez nunca ve un índice a medias
+    temporal = f"{ruta_indice}.{os.getpid()}.tmp"
+    try:
+        with open(temporal, 'wb') as f:
+            f.write(_CABECERA.pack(MAGIA, VERSION_INDICE, len(metadatos)))
+            f.write(metadatos)
+            inicio_datos = -(-f.tell() // _ALINEACION) * _ALINEACION
+            for nombre, datos in secciones.items():
+                f.write(b"\0" * (inicio_datos + descripcion[nombre]['offset'] - f.tell()))
+                f.write(datos.tobytes() if isinstance(datos, np.ndarray) else datos)
+        os.replace(temporal, ruta_indice)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    logger.info(f"[Vocabulario] Índice compilado en {ruta_indice}: {len(palabras)} palabras, "
+                f"{len(frases)} entradas de varias palabras")
+    return ruta_indice
+
+
+class IndiceVocabulario:
+    """Índice de vocabulario compilado, abierto con mmap.
+
+    Las matrices del índice difuso son vistas de solo lectura sobre el fichero; solo las
+    cadenas y los diccionarios se reconstruyen en memoria, sin calcular metaphone ni unidecode.
+    """
+
+    def __init__(self, ruta_indice):
+        self.ruta = ruta_indice
+        with open(ruta_indice, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magia, version, longitud = _CABECERA.unpack_from(self._mmap, 0)
+        if magia != MAGIA:
+            raise ValueError(f"{ruta_indice} no es un índice de vocabulario")
+        self.version = version
+        if version != VERSION_INDICE:
+            return
+        fin_metadatos = _CABECERA.size + longitud
+        self.metadatos = json.loads(self._mmap[_CABECERA.size:fin_metadatos].decode('utf-8'))
+        self._inicio_datos = -(-fin_metadatos // _ALINEACION) * _ALINEACION
+
+    @property
+    def compatible(self):
+        return self.version == VERSION_INDICE
+
+    def vigente(self, ruta_json):
+        """Indica si el índice corresponde al JSON actual (misma fecha y tamaño, o mismo contenido)."""
+        if not self.compatible:
+            return False
+        origen = self.metadatos['origen']
+        stat = os.stat(ruta_json)
+        if stat.st_mtime_ns == origen['mtime_ns'] and stat.st_size == origen['tamano']:
+            return True
+        # Fecha distinta (p. ej. tras un checkout): basta con que el contenido no haya cambiado
+        return _hash_fichero(ruta_json) == origen['sha256']
+
+    def _seccion(self, nombre):
+        seccion = self.metadatos['secciones'][nombre]
+        offset = self._inicio_datos + seccion['offset']
+        if 'dtype' not in seccion:
+            return self._mmap[offset:offset + seccion['bytes']]
+        if not seccion['bytes']:
+            return np.zeros(seccion['shape'], dtype=seccion['dtype'])
+        return np.frombuffer(self._mmap, dtype=seccion['dtype'], count=int(np.prod(seccion['shape'])),
+                             offset=offset).reshape(seccion['shape'])
+
+    def datos_correccion(self):
+        """Devuelve el mismo diccionario que crear_datos_precalculados()."""
+        m = self.metadatos
+        palabras = _leer_cadenas(self._seccion('palabras'), m['n_palabras'])
+        normalizadas = _leer_cadenas(self._seccion('normalizadas'), m['n_palabras'])
+        codigos = _leer_cadenas(self._seccion('codigos'), m['n_palabras'])
+
+        indice_fonetico = {}
+        for palabra, codigo in zip(palabras, codigos):
+            indice_fonetico.setdefault(codigo, []).append(palabra)
+
+        palabras_difusas = _leer_cadenas(self._seccion('difuso_palabras'), m['n_difusas'])
+        posiciones = self._seccion('difuso_posiciones').tolist()
+        conteos = self._seccion('difuso_conteos')
+        indice_difuso = {
+            'alfabeto': {c: i for i, c in enumerate(m['alfabeto'])},
+            'grupos': {longitud: (palabras_difusas[inicio:inicio + n], conteos[inicio:inicio + n])
+                       for longitud, inicio, n in m['grupos']},
+            'posiciones': dict(zip(palabras_difusas, posiciones)),
+        }
+
+        trie_frases = {}
+        for entrada, tokens in m['frases']:
+            nodo = trie_frases
+            for token in tokens:
+                nodo = nodo.setdefault(token, {})
+            nodo[_FIN_FRASE] = entrada
+
+        return {
+            'set_palabras_correctas': set(palabras),
+            'hash_vocabulario': m['hash_vocabulario'],
+            'indice_fonetico': indice_fonetico,
+            'listas_palabras_correctas': (palabras, normalizadas),
+            'indice_difuso': indice_difuso,
+            'trie_frases': trie_frases,
+        }
+
+
+def abrir_indice(ruta_indice):
+    """Abre un índice compilado; devuelve None si no existe o no se puede leer."""
+    if not os.path.exists(ruta_indice):
+        return None
+    try:
+        return IndiceVocabulario(ruta_indice)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"[Vocabulario] Índice {ruta_indice} ilegible, se recompilará: {e}")
+        return None
+
+
+def cargar_vocabulario(ruta_json, ruta_indice=None):
+    """Carga los datos de corrección desde el índice compilado, recompilándolo si el JSON ha cambiado."""
+    ruta_indice = ruta_indice or ruta_indice_por_defecto(ruta_json)
+    if not os.path.exists(ruta_json):
+        return leer_palabras_correctas(ruta_json)  # Informa del error y devuelve None
+
+    indice = abrir_indice(ruta_indice)
+    if indice is not None and indice.vigente(ruta_json):
+        logger.debug(f"[Vocabulario] Usando índice compilado {ruta_indice}")
+        return indice.datos_correccion()
+
+    motivo = "no existe" if indice is None else ("versión antigua" if not indice.compatible else "JSON modificado")
+    logger.info(f"[Vocabulario] Recompilando {ruta_indice} ({motivo})...")
+    try:
+        if compilar_indice(ruta_json, ruta_indice) is None:
+            return None
+        return IndiceVocabulario(ruta_indice).datos_correccion()
+    except OSError as e:
+        # Directorio de solo lectura, disco lleno...: se trabaja sin índice
+        logger.warning(f"[Vocabulario] No se pudo escribir el índice compilado ({e}); se calcula en memoria.")
+        palabras_correctas = leer_palabras_correctas(ruta_json)
+        return crear_datos_precalculados(palabras_correctas) if palabras_correctas is not None else None
+
+
+def main(argv=None, prog=None):
+    """Punto de entrada de la línea de comandos (también `cli.py vocab`)."""
+
+    parser = argparse.ArgumentParser(prog=prog, description='Herramientas del índice compilado de palabras correctas.')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    compilar = subparsers.add_parser('compile', help='Compila un JSON de palabras correctas en un índice binario')
+    compilar.add_argument('correct_words', type=str, help='Archivo JSON con palabras correctas')
+    compilar.add_argument('--output', type=str, default=None,
+                          help='Ruta del índice (predeterminado: junto al JSON con extensión .vidx)')
+
+    info = subparsers.add_parser('info', help='Muestra el estado de un índice compilado')
+    info.add_argument('correct_words', type=str, help='Archivo JSON con palabras correctas')
+    info.add_argument('--index', type=str, default=None, help='Ruta del índice compilado')
+
+    parser.add_argument('--debug', action='store_true', help='Activar modo debug')
+    args = parser.parse_args(argv)
+    setup_logging(args.debug)
+
+    if args.comando == 'compile':
+        if compilar_indice(args.correct_words, args.output) is None:
+            raise SystemExit(1)
+    else:
+        ruta = args.index or ruta_indice_por_defecto(args.correct_words)
+        indice = abrir_indice(ruta)
+        if indice is None:
+            print(f"{ruta}: no existe")
+        elif not indice.compatible:
+            print(f"{ruta}: versión {indice.version} (actual {VERSION_INDICE}), hay que recompilar")
+        else:
+            m = indice.metadatos
+            estado = "vigente" if indice.vigente(args.correct_words) else "desactualizado"
+            print(f"{ruta}: versión {indice.version}, {m['n_palabras']} palabras, "
+                  f"{len(m['frases'])} entradas de varias palabras, {estado}")
+
+
+if __name__ == "__main__":
+    main()